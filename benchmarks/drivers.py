@@ -0,0 +1,274 @@
+"""
+Throughput benchmarks of the pralab drivers against the simulated instruments.
+
+Measured:
+    overhead   Software overhead of Parameter.get/set per driver (simulated bus time
+               set to zero), and of the FastSweepSetter path where available.
+    iv_sweep   Points/s of an IV sweep: Yokogawa7651 current + Keithley2182A1ch amplitude.
+    ac_sweep   Points/s of an AC sweep: Keithley6221 wave amplitude + LI5650 X/Y/R/theta.
+    snapshot   Time of snapshot(update=True) and snapshot(update=False) per instrument.
+    import     Cold-start import time per subpackage (see import_time.py).
+
+The sweeps use the default timing models of the simulated instruments, so
+their points/s follow the latency and integration times of the real ones.
+
+Usage:
+    python benchmarks/drivers.py [--json results.json] [--compare baseline.json] [--tolerance 0.1]
+    python benchmarks/drivers.py --only overhead iv_sweep
+
+With --compare, every metric is compared with the baseline file and the
+script exits with status 1 if one of them got worse by more than the tolerance.
+"""
+import argparse
+import datetime
+import json
+import platform
+import statistics
+import sys
+import time
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+from import_time import measure_import_times
+from pralab_phys.qcodes_drivers import LI5650, Keithley2182A1ch, Keithley6221, QDdotNET, Yokogawa7651
+from pralab_phys.qcodes_drivers.fast_sweep import FastSweepSetter
+from pralab_phys.qcodes_drivers.sim import (
+    QDSimBackend,
+    SimKeithley2182A,
+    SimKeithley6221,
+    SimLI5650,
+    SimYokogawa7651,
+)
+
+BENCHMARKS = ("overhead", "iv_sweep", "ac_sweep", "snapshot", "import")
+
+
+def _no_sleep(seconds: float) -> None:
+    pass
+
+
+def make_instruments(timing: bool = True) -> dict[str, Any]:
+    """
+    Creates the simulated instruments.
+
+    Args:
+        timing: Use the timing models. If False, the simulated bus takes no time,
+            which leaves only the software overhead.
+    """
+    sim_kwargs = {} if timing else {"latency": 0.0, "transfer_rate": float("inf"), "sleep": _no_sleep}
+    suffix = "" if timing else "_notiming"
+    k2182_timing = {} if timing else {"reading_overhead": 0.0, "line_frequency": float("inf")}
+    k2182_model = SimKeithley2182A(**k2182_timing, **sim_kwargs)
+    return {
+        "yoko": Yokogawa7651("yoko" + suffix, "GPIB::1::INSTR", sim=SimYokogawa7651(**sim_kwargs)),
+        "k2182": Keithley2182A1ch("k2182" + suffix, "GPIB::7::INSTR", sim=k2182_model),
+        "k6221": Keithley6221("k6221" + suffix, "GPIB::12::INSTR", sim=SimKeithley6221(**sim_kwargs)),
+        "lockin": LI5650("lockin" + suffix, "GPIB::2::INSTR", sim=SimLI5650(**sim_kwargs)),
+        "qd": QDdotNET(
+            "qd" + suffix,
+            "",
+            backend=QDSimBackend(latency=0.02 if timing else 0.0, noise={"temperature": 1e-3}),
+        ),
+    }
+
+
+def close_instruments(instruments: dict[str, Any]) -> None:
+    for instrument in instruments.values():
+        instrument.close()
+
+
+def _per_call(function: Callable[[], Any], repeat: int) -> float:
+    """Median time of one call in s (over 5 rounds of repeat calls)."""
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            function()
+        rounds.append((time.perf_counter() - start) / repeat)
+    return statistics.median(rounds)
+
+
+# parameter -> value set by the overhead benchmark
+OVERHEAD_PARAMETERS = {
+    "yoko": {"current": 1e-6, "voltage": 1e-3},
+    "k2182": {"nplc": 1, "amplitude": None},
+    "k6221": {"dc_amplitude": 1e-6, "wave_frec": 13.0},
+    "lockin": {"frequency": 13.0, "time_constant": 0.1},
+    "qd": {"temperature": None, "field": None},
+}
+
+
+def bench_overhead(repeat: int = 200) -> dict[str, dict[str, float]]:
+    """Per-call get/set time in us with a zero-time simulated bus."""
+    instruments = make_instruments(timing=False)
+    results = {}
+    try:
+        for key, parameters in OVERHEAD_PARAMETERS.items():
+            instrument = instruments[key]
+            for name, value in parameters.items():
+                parameter = instrument.parameters[name]
+                result = {"get_us": _per_call(parameter.get, repeat) * 1e6}
+                if value is not None:
+                    result["set_us"] = _per_call(lambda: parameter.set(value), repeat) * 1e6
+                    try:
+                        setter = FastSweepSetter(parameter, np.full(repeat, value))
+                    except ValueError:
+                        pass
+                    else:
+                        result["fast_set_us"] = _per_call(lambda: list(setter), 1) / repeat * 1e6
+                results[f"{key}.{name}"] = result
+    finally:
+        close_instruments(instruments)
+    return results
+
+
+def bench_iv_sweep(npoints: int = 50, nplc: float = 1) -> dict[str, float]:
+    """Points/s of an IV sweep with Parameter.set and with a FastSweepSetter."""
+    instruments = make_instruments()
+    yoko, k2182 = instruments["yoko"], instruments["k2182"]
+    currents = np.linspace(0, 1e-3, npoints)
+    try:
+        k2182.nplc.set(nplc)
+        start = time.perf_counter()
+        for current in currents:
+            yoko.current.set(current)
+            k2182.amplitude.get()
+        parameter_rate = npoints / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        FastSweepSetter(yoko.current, currents).run(k2182.amplitude.get)
+        fast_rate = npoints / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        k2182.read_buffer(npoints)
+        buffer_rate = npoints / (time.perf_counter() - start)
+    finally:
+        close_instruments(instruments)
+    return {
+        "points_per_s": parameter_rate,
+        "fast_points_per_s": fast_rate,
+        "buffer_readings_per_s": buffer_rate,
+    }
+
+
+def bench_ac_sweep(npoints: int = 50) -> dict[str, float]:
+    """Points/s of an AC sweep reading X/Y/R/theta with one FETC? per point."""
+    instruments = make_instruments()
+    k6221, lockin = instruments["k6221"], instruments["lockin"]
+    amplitudes = np.linspace(1e-6, 1e-4, npoints)
+    try:
+        start = time.perf_counter()
+        for amplitude in amplitudes:
+            k6221.wave_amplitude.set(amplitude)
+            lockin.xy_rtheta.get()
+        parameter_rate = npoints / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        FastSweepSetter(k6221.wave_amplitude, amplitudes).run(lockin.xy_rtheta.get)
+        fast_rate = npoints / (time.perf_counter() - start)
+    finally:
+        close_instruments(instruments)
+    return {"points_per_s": parameter_rate, "fast_points_per_s": fast_rate}
+
+
+def bench_snapshot(repeat: int = 3) -> dict[str, dict[str, float]]:
+    """Time in s of a full and a cached snapshot per instrument."""
+    instruments = make_instruments()
+    results = {}
+    try:
+        for key, instrument in instruments.items():
+            results[key] = {
+                "update_s": _per_call(lambda: instrument.snapshot(update=True), repeat),
+                "cached_s": _per_call(lambda: instrument.snapshot(update=False), repeat),
+            }
+    finally:
+        close_instruments(instruments)
+    return results
+
+
+def run_benchmarks(only: tuple[str, ...] = BENCHMARKS, import_repeat: int = 3) -> dict[str, Any]:
+    """Runs the selected benchmarks and returns the results with their environment."""
+    runners: dict[str, Callable[[], Any]] = {
+        "overhead": bench_overhead,
+        "iv_sweep": bench_iv_sweep,
+        "ac_sweep": bench_ac_sweep,
+        "snapshot": bench_snapshot,
+        "import": lambda: measure_import_times(repeat=import_repeat),
+    }
+    results = {name: runners[name]() for name in only}
+    return {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def _flatten(results: dict[str, Any], prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)):
+            flat[prefix + key] = float(value)
+    return flat
+
+
+def compare(current: dict[str, Any], baseline: dict[str, Any], tolerance: float = 0.1) -> list[str]:
+    """
+    Compares the results with a baseline.
+
+    Metrics ending in "per_s" are better when higher, all others (times) when lower.
+
+    Returns:
+        The descriptions of the metrics that got worse by more than tolerance (relative).
+    """
+    now = _flatten(current["results"])
+    before = _flatten(baseline["results"])
+    regressions = []
+    for key in sorted(now.keys() & before.keys()):
+        if before[key] == 0:
+            continue
+        change = now[key] / before[key] - 1
+        worse = -change if key.endswith("per_s") else change
+        marker = ""
+        if worse > tolerance:
+            marker = "  <-- regression"
+            regressions.append(f"{key}: {before[key]:.4g} -> {now[key]:.4g} ({change:+.1%})")
+        print(f"{key:60s} {before[key]:12.4g} {now[key]:12.4g} {change:+8.1%}{marker}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--import-repeat", type=int, default=3)
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="baseline JSON file to compare the results with")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(tuple(args.only), args.import_repeat)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s):")
+            for regression in regressions:
+                print("  " + regression)
+            sys.exit(1)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
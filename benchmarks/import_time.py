@@ -0,0 +1,102 @@
+"""
+Cold-start import time of the pralab_phys subpackages and drivers.
+
+Every module is imported in a fresh interpreter with ``python -X importtime``,
+and the cumulative import time reported for the module itself is recorded
+(the median over the repetitions), together with the wall time of the process.
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5] [--json results.json] [module ...]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = [
+    "pralab_phys",
+    "pralab_phys.analysis",
+    "pralab_phys.eztools",
+    "pralab_phys.ezgraph",
+    "pralab_phys.ezgraph.ezgraph_2d",
+    "pralab_phys.ezgraph.ipygraph",
+    "pralab_phys.ezgraph.realtimeplot",
+    "pralab_phys.qcodes_drivers",
+    "pralab_phys.qcodes_drivers.keithley2182a1ch",
+    "pralab_phys.qcodes_drivers.keithley6221",
+    "pralab_phys.qcodes_drivers.li5650",
+    "pralab_phys.qcodes_drivers.yokogawa7651",
+    "pralab_phys.qcodes_drivers.qddotnet",
+]
+
+
+def import_time_once(module: str) -> tuple[float, float]:
+    """
+    Imports a module in a fresh interpreter.
+
+    Returns:
+        (cumulative import time of the module in s, wall time of the process in s)
+    """
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise ImportError(proc.stderr.strip().splitlines()[-1])
+    # import time:  self [us] | cumulative | imported package
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) == 3 and fields[2].strip() == module:
+            return int(fields[1]) * 1e-6, wall
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def measure_import_times(modules: list[str] = MODULES, repeat: int = 5) -> dict[str, dict]:
+    """
+    Measures the cold-start import time of each module.
+
+    Returns:
+        {module: {"import_s": median cumulative import time, "wall_s": median process time}}
+        or {module: {"error": message}} if the import fails.
+    """
+    results = {}
+    for module in modules:
+        try:
+            samples = [import_time_once(module) for _ in range(repeat)]
+        except (ImportError, RuntimeError) as e:
+            results[module] = {"error": str(e)}
+            continue
+        results[module] = {
+            "import_s": statistics.median(s[0] for s in samples),
+            "wall_s": statistics.median(s[1] for s in samples),
+        }
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=MODULES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = measure_import_times(args.modules, args.repeat)
+    for module, result in results.items():
+        if "error" in result:
+            print(f"{module:50s} error: {result['error']}")
+        else:
+            print(f"{module:50s} {result['import_s'] * 1e3:9.1f} ms (process {result['wall_s'] * 1e3:.0f} ms)")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+# pralab_phys._lazy
+# Lazy attribute access of the subpackages (PEP 562 module __getattr__/__dir__)
+
+import importlib
+import sys
+from collections.abc import Callable
+
+
+def lazy_module(
+    module_name: str,
+    attributes: dict[str, str],
+) -> tuple[Callable[[str], object], Callable[[], list[str]]]:
+    """
+    Returns the module-level __getattr__ and __dir__ importing each attribute on first access.
+
+    Usage in a package __init__.py:
+        >>> __getattr__, __dir__ = lazy_module(__name__, {"EZGraph": ".ezgraph_2d"})
+
+    Args:
+        module_name: Name of the package (__name__).
+        attributes: Attribute name -> module defining it, relative to the package.
+    """
+    def __getattr__(name: str) -> object:
+        if name in attributes:
+            value = getattr(importlib.import_module(attributes[name], module_name), name)
+            # 次回以降は通常の属性として見つかる
+            setattr(sys.modules[module_name], name, value)
+            return value
+        raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(sys.modules[module_name])) | set(attributes))
+
+    return __getattr__, __dir__
@@ -1,6 +1,22 @@
 # pralab_phys.ezgraph
 # Plotly graph functions formatted for academic presentations
+# Each class is imported on first access (dash, plotly and ipywidgets are slow to import).
 
-from .ezgraph_2d import EZGraph
-from .ipygraph import EZGraphDisplay
-from .realtimeplot import RealTimePlot
\ No newline at end of file
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_module
+
+if TYPE_CHECKING:
+    from .ezgraph_2d import EZGraph
+    from .ipygraph import EZGraphDisplay
+    from .realtimeplot import RealTimePlot
+
+_LAZY_ATTRIBUTES = {
+    "EZGraph": ".ezgraph_2d",
+    "EZGraphDisplay": ".ipygraph",
+    "RealTimePlot": ".realtimeplot",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
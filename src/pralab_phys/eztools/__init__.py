@@ -1,3 +1,25 @@
+# pralab_phys.eztools
+# Each function is imported on first access (openexp needs tkinter, visa needs pyvisa).
 
-from .openexp import openpath, opendir, opendir_safety
-from .visa import show_connected_visa, list_visa_resources
\ No newline at end of file
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_module
+
+if TYPE_CHECKING:
+    from .openexp import openpath, opendir, opendir_safety
+    from .visa import show_connected_visa, list_visa_resources, discover_visa, VisaResourceInfo, visa_pool
+
+_LAZY_ATTRIBUTES = {
+    "openpath": ".openexp",
+    "opendir": ".openexp",
+    "opendir_safety": ".openexp",
+    "show_connected_visa": ".visa",
+    "list_visa_resources": ".visa",
+    "discover_visa": ".visa",
+    "VisaResourceInfo": ".visa",
+    "visa_pool": ".visa",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
@@ -1,16 +1,387 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
 import pyvisa
+import pyvisa.resources
 
-def show_connected_visa(timeout=5000):
-    rm = pyvisa.ResourceManager()
-    res_list = rm.list_resources()
+# resource -> IDN -> pralab driver class の対応を保存する場所
+DEFAULT_REGISTRY_PATH = Path.home() / ".pralab_phys" / "visa_registry.json"
 
-    for i in res_list:
-        inst = rm.open_resource(i)
-        inst.timeout = timeout
+# Identification queries tried in order (the Yokogawa7651 does not understand *IDN?)
+ID_QUERIES = ("*IDN?", "OS")
+
+# Substring of the identification response -> pralab driver class
+DRIVER_PATTERNS = (
+    ("MODEL 2182A", "pralab_phys.qcodes_drivers.Keithley2182A"),
+    ("MODEL 6221", "pralab_phys.qcodes_drivers.Keithley6221"),
+    ("LI5650", "pralab_phys.qcodes_drivers.LI5650"),
+    ("7651", "pralab_phys.qcodes_drivers.Yokogawa7651"),
+)
+
+
+class _PooledSession:
+    def __init__(self, resource: pyvisa.resources.MessageBasedResource) -> None:
+        self.resource = resource
+        # serializes the transactions of all users of the session
+        self.lock = threading.RLock()
+        self.users = 0
+        # held exclusively by acquire_idle() (e.g. an identification probe)
+        self.probing = False
+        self.released = time.monotonic()
+
+
+class PooledResource:
+    """
+    Handle of a pooled VISA session, returned by VisaPool.acquire().
+
+    Attribute access is forwarded to the PyVISA resource, except close(),
+    which hands the session back to the pool instead of closing it. close()
+    acts once per handle, so the owner of the handle (e.g. the finalizer of
+    a QCoDeS VisaInstrument) can never close a session that another driver uses.
+
+    Attributes:
+        resource (MessageBasedResource): The pooled PyVISA resource.
+        lock (threading.RLock): Lock shared by all handles of the session.
+            Hold it around write/read pairs so replies cannot go to another user.
+    """
+
+    __slots__ = ("_pool", "_session", "_released")
+
+    def __init__(self, pool: "VisaPool", session: _PooledSession) -> None:
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_session", session)
+        object.__setattr__(self, "_released", False)
+
+    @property
+    def resource(self) -> pyvisa.resources.MessageBasedResource:
+        return self._session.resource
+
+    @property
+    def lock(self) -> threading.RLock:
+        return self._session.lock
+
+    @property
+    def released(self) -> bool:
+        """True once the handle was handed back."""
+        return self._released
+
+    def close(self) -> None:
+        """Hands the session back to the pool (once)."""
+        self._pool.release(self)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._session.resource, name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._session.resource, name, value)
+
+    def __repr__(self) -> str:
+        return f"<PooledResource {self._session.resource!r}>"
+
+
+class VisaPool:
+    """
+    Process-wide pool of PyVISA resource managers and sessions.
+
+    One ResourceManager is created per VISA library and shared, because
+    initializing the backend is slow. Sessions are reused when the same
+    address is opened again (e.g. a driver created right after discovery),
+    and sessions nobody uses are closed after idle_timeout seconds.
+    Every acquire returns its own PooledResource handle; the handles of one
+    session share its lock.
+    Discovery takes sessions with acquire_idle(), which skips the sessions
+    used by a driver; a driver opening a session being probed waits for the probe.
+
+    Attributes:
+        idle_timeout (float): Time in s after which unused sessions are closed.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0) -> None:
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Condition()
+        self._managers: dict[str | None, pyvisa.ResourceManager] = {}
+        self._sessions: dict[tuple[str | None, str], _PooledSession] = {}
+        self._counts = {"managers": 0, "opens": 0, "reuses": 0, "closes": 0}
+
+    def resource_manager(self, visalib: str | None = None) -> pyvisa.ResourceManager:
+        """Returns the shared ResourceManager of a VISA library (the default one if None)."""
+        with self._lock:
+            rm = self._managers.get(visalib)
+            if rm is None:
+                rm = pyvisa.ResourceManager() if visalib is None else pyvisa.ResourceManager(visalib)
+                self._managers[visalib] = rm
+                self._counts["managers"] += 1
+            return rm
+
+    @staticmethod
+    def _is_open(resource: pyvisa.resources.Resource) -> bool:
         try:
-            print(i, ": ", inst.query("*IDN?"))
-        except Exception:
-            print(i, ": ", "Unknown instruments (*IDN? command failed)")
+            resource.session
+        except pyvisa.errors.InvalidSession:
+            return False
+        return True
+
+    def _reuse(self, key: tuple[str | None, str], exclusive: bool) -> tuple[bool, PooledResource | None]:
+        """
+        Takes the pooled session of key, called with the lock held.
+
+        Returns:
+            (found, handle): found is False if no open session is pooled.
+            handle is None if exclusive and the session is in use.
+        """
+        while True:
+            pooled = self._sessions.get(key)
+            if pooled is None or not self._is_open(pooled.resource):
+                return False, None
+            if exclusive:
+                if pooled.users:
+                    return True, None
+                pooled.probing = True
+            elif pooled.probing:
+                # 識別の問い合わせが終わるまで待つ
+                self._lock.wait()
+                continue
+            pooled.users += 1
+            self._counts["reuses"] += 1
+            return True, PooledResource(self, pooled)
+
+    def _acquire(self, address: str, visalib: str | None, exclusive: bool, kwargs: dict) -> PooledResource | None:
+        self.close_idle()
+        key = (visalib, address)
+        with self._lock:
+            found, handle = self._reuse(key, exclusive)
+            if found:
+                return handle
+
+        # 他のリソースのオープンを妨げないよう、ロックの外で開く
+        resource = self.resource_manager(visalib).open_resource(address, **kwargs)
+        if not isinstance(resource, pyvisa.resources.MessageBasedResource):
+            resource.close()
+            raise TypeError("Only MessageBasedResource VISA resources are supported")
+
+        with self._lock:
+            found, handle = self._reuse(key, exclusive)
+            if found:
+                # opened concurrently by another thread
+                resource.close()
+                return handle
+            pooled = _PooledSession(resource)
+            pooled.users = 1
+            pooled.probing = exclusive
+            self._sessions[key] = pooled
+            self._counts["opens"] += 1
+            return PooledResource(self, pooled)
+
+    def acquire(self, address: str, visalib: str | None = None, **kwargs) -> PooledResource:
+        """
+        Returns a handle of an open session of address, reusing a pooled one if possible.
+        Hand it back with release() or the close() of the handle.
+
+        Args:
+            address: VISA resource address.
+            visalib: VISA library (None for the default one).
+            **kwargs: Forwarded to ResourceManager.open_resource when a session is opened.
+        """
+        return self._acquire(address, visalib, False, kwargs)
+
+    def acquire_idle(self, address: str, visalib: str | None = None, **kwargs) -> PooledResource | None:
+        """
+        Returns a handle of a session of address for a short exclusive use, or None if
+        somebody (e.g. a driver) uses it. acquire() of the same address waits
+        until the session is handed back with release().
+
+        Args:
+            address: VISA resource address.
+            visalib: VISA library (None for the default one).
+            **kwargs: Forwarded to ResourceManager.open_resource when a session is opened.
+        """
+        return self._acquire(address, visalib, True, kwargs)
+
+    def release(self, handle: PooledResource) -> None:
+        """
+        Hands a session back to the pool. It stays open until it has been idle for idle_timeout.
+        Releasing the same handle again does nothing.
+        """
+        with self._lock:
+            if handle._released:
+                return
+            object.__setattr__(handle, "_released", True)
+            pooled = handle._session
+            pooled.users = max(pooled.users - 1, 0)
+            pooled.released = time.monotonic()
+            if pooled.probing:
+                pooled.probing = False
+                self._lock.notify_all()
+
+    def close_idle(self, max_idle: float | None = None) -> int:
+        """
+        Closes the sessions that nobody has used for max_idle seconds.
+
+        Args:
+            max_idle: Idle time in s. If None, idle_timeout is used.
+
+        Returns:
+            The number of sessions closed.
+        """
+        if max_idle is None:
+            max_idle = self.idle_timeout
+        now = time.monotonic()
+        with self._lock:
+            idle = [
+                key for key, pooled in self._sessions.items()
+                if pooled.users == 0 and now - pooled.released >= max_idle
+            ]
+            sessions = [self._sessions.pop(key) for key in idle]
+            self._counts["closes"] += len(sessions)
+        for pooled in sessions:
+            try:
+                pooled.resource.close()
+            except pyvisa.errors.VisaIOError:
+                pass
+        return len(sessions)
+
+    def counts(self) -> dict[str, int]:
+        """
+        Returns the numbers of resource managers created, sessions opened, reused and closed,
+        and of sessions presently open and in use.
+        """
+        with self._lock:
+            counts = dict(self._counts)
+            counts["open"] = len(self._sessions)
+            counts["in_use"] = sum(1 for pooled in self._sessions.values() if pooled.users)
+        return counts
+
+
+visa_pool = VisaPool()
+"""The process-wide pool shared by eztools and the pralab_phys drivers."""
+
+
+@dataclass
+class VisaResourceInfo:
+    """Result of probing one VISA resource."""
+    resource: str
+    idn: str | None = None
+    driver: str | None = None
+    error: str | None = None
+
+
+def match_driver(idn: str) -> str | None:
+    """Returns the pralab driver class (dotted path) for an identification response."""
+    for pattern, driver in DRIVER_PATTERNS:
+        if pattern in idn.upper():
+            return driver
+    return None
+
+
+def _probe_resource(resource: str, timeout: int) -> VisaResourceInfo | None:
+    """Identifies one resource. Returns None if a driver uses its session."""
+    info = VisaResourceInfo(resource)
+    try:
+        inst = visa_pool.acquire_idle(resource, open_timeout=timeout)
+    except Exception as e:
+        info.error = f"open failed: {e}"
+        return info
+    if inst is None:
+        # ドライバが使用中のセッションには問い合わせない (通信の割り込み・timeout の変更を避ける)
+        return None
+    previous_timeout = inst.timeout
+    try:
+        inst.timeout = timeout
+        for query in ID_QUERIES:
+            try:
+                idn = inst.query(query).strip()
+            except Exception as e:
+                info.error = f"{query} failed: {e}"
+                continue
+            if idn:
+                info.idn = idn
+                info.driver = match_driver(idn)
+                info.error = None
+                break
+    finally:
+        inst.timeout = previous_timeout
+        # 直後にドライバが同じアドレスを開く場合に備え、セッションはプールに返す
+        visa_pool.release(inst)
+    return info
+
+
+def load_registry(path: str | Path = DEFAULT_REGISTRY_PATH) -> list[VisaResourceInfo] | None:
+    """Returns the saved discovery results, or None if there is no registry."""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8") as f:
+        return [VisaResourceInfo(**entry) for entry in json.load(f)]
+
+
+def save_registry(infos: list[VisaResourceInfo], path: str | Path = DEFAULT_REGISTRY_PATH) -> None:
+    """Saves discovery results to the registry."""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump([asdict(info) for info in infos], f, indent=2, ensure_ascii=False)
+
+
+def discover_visa(
+    timeout: int = 500,
+    max_workers: int = 8,
+    refresh: bool = False,
+    registry_path: str | Path | None = None,
+) -> list[VisaResourceInfo]:
+    """
+    Identifies the connected VISA instruments.
+
+    The resources are probed concurrently with a short timeout, trying *IDN?
+    and then driver-specific identification queries (OS for the Yokogawa7651).
+    With a registry_path (e.g. DEFAULT_REGISTRY_PATH) the results are saved
+    in a registry, and later calls return the registry without touching the
+    bus unless refresh is True. Resources whose session
+    is used by a driver are not probed; their registry entry is kept.
+
+    Args:
+        timeout: Open and query timeout of each resource in ms.
+        max_workers: Number of resources probed at the same time.
+        refresh: Probe the resources even if a registry exists.
+        registry_path: Registry file. If None (default), nothing is read or written.
+
+    Returns:
+        The probe result of each resource.
+    """
+    saved = load_registry(registry_path) if registry_path is not None else None
+    if not refresh and saved is not None:
+        return saved
+
+    resources = visa_pool.resource_manager().list_resources()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        probed = list(executor.map(lambda r: _probe_resource(r, timeout), resources))
+    previous = {info.resource: info for info in saved or []}
+    infos = [
+        info if info is not None else previous.get(resource, VisaResourceInfo(resource, error="in use by a driver"))
+        for resource, info in zip(resources, probed)
+    ]
+
+    if registry_path is not None:
+        save_registry(infos, registry_path)
+    return infos
+
+
+def show_connected_visa(timeout=500):
+    """
+    Probes the VISA resources and prints the identification of the connected instruments.
+
+    Args:
+        timeout: Open and query timeout of each resource in ms.
+    """
+    for info in discover_visa(timeout=timeout, refresh=True):
+        if info.idn is not None:
+            print(info.resource, ": ", info.idn)
+        else:
+            print(info.resource, ": ", f"Unknown instruments ({info.error})")
 
 def list_visa_resources():
-    return pyvisa.ResourceManager().list_resources()
\ No newline at end of file
+    return visa_pool.resource_manager().list_resources()
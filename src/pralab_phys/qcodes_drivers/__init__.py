@@ -1,8 +1,29 @@
 # pralab_phys.qcodes_drivers
+# Each driver is imported on first access, so importing one driver does not
+# load the dependencies of the others (e.g. pythonnet for QDdotNET).
 
-from .yokogawa7651 import Yokogawa7651
-from .keithley2182a1ch import Keithley2182A1ch
-from .qddotnet import QDdotNET
-from .keithley6221 import Keithley6221
-#from .nfli5640 import nfLI5640
-from .li5650 import LI5650
\ No newline at end of file
+from typing import TYPE_CHECKING
+
+from .._lazy import lazy_module
+
+if TYPE_CHECKING:
+    from .yokogawa7651 import Yokogawa7651
+    from .keithley2182a1ch import Keithley2182A1ch
+    from .keithley2182a import Keithley2182A
+    from .qddotnet import QDdotNET
+    from .keithley6221 import Keithley6221
+    #from .nfli5640 import nfLI5640
+    from .li5650 import LI5650
+
+_LAZY_ATTRIBUTES = {
+    "Yokogawa7651": ".yokogawa7651",
+    "Keithley2182A1ch": ".keithley2182a1ch",
+    "Keithley2182A": ".keithley2182a",
+    "QDdotNET": ".qddotnet",
+    "Keithley6221": ".keithley6221",
+    "LI5650": ".li5650",
+}
+
+__all__ = list(_LAZY_ATTRIBUTES)
+
+__getattr__, __dir__ = lazy_module(__name__, _LAZY_ATTRIBUTES)
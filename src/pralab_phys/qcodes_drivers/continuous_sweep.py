@@ -0,0 +1,163 @@
+"""
+ContinuousSweep measures while the PPMS temperature or field is ramping.
+
+Instead of stepping the temperature and waiting for stability at every point,
+a slow sweep is started and the readout parameters are sampled as fast as
+they allow. The QDdotNET poller records the temperature (or field) in the
+background, and every reading is tagged with the value interpolated at the
+time of the reading.
+
+Example:
+    >>> sweep = ContinuousSweep(qd, "temperature", [k2182.amplitude])
+    >>> for row in sweep.run(target=10, rate=0.05):
+    ...     print(row["temperature"], row[k2182.amplitude.full_name])
+    >>> df = sweep.dataframe()
+"""
+import time
+from collections import deque
+from collections.abc import Iterator, Sequence
+from typing import Any
+
+import numpy as np
+import pandas as pd
+from qcodes.parameters import Parameter
+
+from .qddotnet import DEFAULT_TOLERANCE, QDdotNET
+
+
+class ContinuousSweep:
+    """
+    Sweep-on-the-fly acquisition with a QDdotNET temperature or field ramp.
+
+    Args:
+        qd: The QDdotNET instrument.
+        quantity: "temperature" or "field".
+        readouts: Parameters read at every point.
+        poll_interval: Interval of the background temperature/field poll in s.
+
+    Attributes:
+        rows (list[dict]): Rows emitted by the last run().
+    """
+
+    def __init__(
+        self,
+        qd: QDdotNET,
+        quantity: str,
+        readouts: Sequence[Parameter],
+        poll_interval: float = 0.2,
+    ) -> None:
+        if quantity not in ("temperature", "field"):
+            raise ValueError('quantity must be "temperature" or "field"')
+        self.qd = qd
+        self.quantity = quantity
+        self.readouts = list(readouts)
+        self.poll_interval = poll_interval
+        self.rows: list[dict[str, Any]] = []
+        # 補間に使う直近の (time, value) のみを保持する
+        self._window: deque[tuple[float, float]] = deque()
+
+    def _start_sweep(self, target: float, rate: float | None) -> None:
+        if self.quantity == "temperature":
+            if rate is not None:
+                self.qd.temperaturerate.set(rate)
+            self.qd.set_temperature(target)
+        else:
+            if rate is not None:
+                self.qd.fieldrate.set(rate)
+            self.qd.set_field(target)
+
+    def _sweep_finished(self, target: float, tolerance: float) -> bool:
+        value, _ = self.qd.read_state(self.quantity)
+        return abs(value - target) <= tolerance
+
+    def _interpolate(self, pending: deque, flush: bool = False) -> Iterator[dict[str, Any]]:
+        # only the samples recorded since the last call are fetched
+        since = self._window[-1][0] if self._window else None
+        self._window.extend(zip(*self.qd.state_history(self.quantity, since=since)))
+        if not self._window:
+            return
+        times, values = np.array(self._window).T
+        # 補間は前後の poll が揃ったものだけ出力する (flush 時は外挿せず端の値を使う)
+        while pending and (flush or pending[0][0] <= times[-1]):
+            timestamp, readings = pending.popleft()
+            row = {"time": timestamp, self.quantity: float(np.interp(timestamp, times, values))}
+            for parameter, reading in zip(self.readouts, readings):
+                row[parameter.full_name] = reading
+            self.rows.append(row)
+            yield row
+        # drop the samples no pending reading needs (the one before the oldest reading is kept)
+        horizon = pending[0][0] if pending else times[-1]
+        while len(self._window) > 1 and self._window[1][0] <= horizon:
+            self._window.popleft()
+
+    def run(
+        self,
+        target: float,
+        rate: float | None = None,
+        tolerance: float | None = None,
+        max_points: int | None = None,
+        timeout: float | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        """
+        Starts the sweep and yields one row per reading while it runs.
+
+        Each row holds "time" (time.time() at the middle of the reading), the
+        temperature or field interpolated at that time, and the value of every
+        readout parameter under its full name. Rows are emitted as soon as a poll
+        after the reading is available.
+
+        Args:
+            target: Target temperature (K) or field (Oe).
+            rate: Sweep rate. If None, the present temperaturerate/fieldrate is used.
+            tolerance: Distance from target at which the sweep is finished.
+                Defaults to qddotnet.DEFAULT_TOLERANCE.
+            max_points: Stop after this many readings.
+            timeout: Stop after this many seconds.
+
+        Yields:
+            The rows of the streaming table.
+        """
+        if tolerance is None:
+            tolerance = DEFAULT_TOLERANCE[self.quantity]
+        self.rows = []
+        # samples of earlier runs must not enter the interpolation
+        self.qd.clear_state_history()
+        self._window.clear()
+        own_poller = self.qd._poller is None
+        if own_poller:
+            self.qd.start_poller(self.poll_interval, (self.quantity,))
+        # the record must not hide the progress of the sweep
+        max_age = self.qd.state_max_age.cache.get()
+        self.qd.state_max_age.set(self.poll_interval if max_age is None else min(max_age, self.poll_interval))
+
+        pending: deque[tuple[float, list[Any]]] = deque()
+        started = time.time()
+        npoints = 0
+        try:
+            self._start_sweep(target, rate)
+            while True:
+                t0 = time.time()
+                readings = [parameter.get() for parameter in self.readouts]
+                t1 = time.time()
+                pending.append(((t0 + t1) / 2, readings))
+                npoints += 1
+                yield from self._interpolate(pending)
+
+                if max_points is not None and npoints >= max_points:
+                    break
+                if timeout is not None and t1 - started > timeout:
+                    break
+                if self._sweep_finished(target, tolerance):
+                    break
+            # 最後の読み取りの後に一回 poll されるのを待つ
+            time.sleep(self.poll_interval)
+            self.qd.read_state(self.quantity, max_age=0)
+            yield from self._interpolate(pending, flush=True)
+        finally:
+            self.qd.state_max_age.set(max_age)
+            if own_poller:
+                self.qd.stop_poller()
+
+    def dataframe(self) -> pd.DataFrame:
+        """Returns the rows of the last run as a DataFrame."""
+        return pd.DataFrame(self.rows)
@@ -0,0 +1,158 @@
+"""
+Fast-path sweep setters.
+
+Every set of a QCoDeS parameter runs the validators, the parsers, the
+cache and snapshot bookkeeping and the logging. In a tight sweep that costs
+as much as the write itself. FastSweepSetter validates the whole setpoint
+array once, formats all the commands up front with the driver's own
+formatter (fast_set_formatter of PralabVisaInstrument), and then only
+issues raw writes. The parameter cache is updated once at the end.
+
+Writes go through write_raw, so the instrument lock and the readback cache
+of the driver stay consistent, but the write suppression of the parameter is
+bypassed. The safety settings of the parameter are kept: with a step, every
+increment (also from the present value to the first setpoint) must be at
+most step, and writes are at least inter_delay apart.
+
+Example:
+    >>> setter = FastSweepSetter(yoko.current, np.linspace(0, 1e-3, 501))
+    >>> for current in setter:
+    ...     data.append((current, k2182.amplitude()))
+    >>> yoko.current.cache()   # last setpoint
+"""
+import time
+from collections.abc import Callable, Iterator, Sequence
+from typing import Any
+
+import numpy as np
+from qcodes.parameters import Parameter
+from qcodes.validators import Numbers
+
+
+class FastSweepSetter:
+    """
+    Pre-validated, pre-formatted setter of one parameter over a setpoint array.
+
+    Raises ValueError if a setpoint fails the validator of the parameter or
+    if an increment exceeds its step (sweep finer or ramp to the start first).
+
+    Args:
+        parameter: Parameter of a pralab driver supporting fast sweeps.
+        setpoints: Values set one after another.
+        delay: Wait in s after each write when iterating.
+
+    Attributes:
+        setpoints (np.ndarray): The validated setpoints.
+        commands (list[str]): The command written for each setpoint.
+    """
+
+    def __init__(self, parameter: Parameter, setpoints: Sequence[float] | np.ndarray, delay: float = 0.0) -> None:
+        instrument = parameter.instrument
+        if instrument is None or not hasattr(instrument, "fast_set_formatter"):
+            raise ValueError(f"{parameter.full_name} does not belong to a pralab VISA driver")
+        if (
+            parameter.val_mapping is not None
+            or parameter.set_parser is not None
+            or parameter.scale is not None
+            or parameter.offset is not None
+        ):
+            raise ValueError(f"{parameter.full_name} transforms its values and cannot be swept fast")
+        formatter: Callable[[float], str] = instrument.fast_set_formatter(parameter.name)
+
+        self.parameter = parameter
+        self.instrument = instrument
+        self.delay = delay
+        self.setpoints = np.asarray(setpoints, dtype=float)
+        if self.setpoints.ndim != 1:
+            raise ValueError("setpoints must be a 1D array")
+        self._validate()
+        self.commands = [formatter(float(v)) for v in self.setpoints]
+        self._last: float | None = None
+        self._last_write: float | None = None
+
+    def _validate(self) -> None:
+        if not np.all(np.isfinite(self.setpoints)):
+            raise ValueError("setpoints must be finite")
+        validator = self.parameter.vals
+        if isinstance(validator, Numbers):
+            # 配列全体を一度で検証する
+            low, high = validator.min_value, validator.max_value
+            bad = (self.setpoints < low) | (self.setpoints > high)
+            if np.any(bad):
+                raise ValueError(
+                    f"{self.setpoints[bad][0]} is invalid for {self.parameter.full_name}: "
+                    f"must be between {low} and {high}"
+                )
+        elif validator is not None:
+            for value in self.setpoints:
+                self.parameter.validate(float(value))
+        step = self.parameter.step
+        if step and len(self.setpoints) > 1:
+            jumps = np.abs(np.diff(self.setpoints)) > step * (1 + 1e-9)
+            if np.any(jumps):
+                index = int(np.argmax(jumps))
+                raise ValueError(
+                    f"Setpoints {self.setpoints[index]} -> {self.setpoints[index + 1]} exceed "
+                    f"the step {step} of {self.parameter.full_name}"
+                )
+
+    def _check_step(self, value: float) -> None:
+        step = self.parameter.step
+        if not step:
+            return
+        previous = self._last if self._last is not None else self.parameter.get_latest()
+        if previous is not None and abs(value - float(previous)) > step * (1 + 1e-9):
+            raise ValueError(
+                f"{self.parameter.full_name} is at {previous}; the jump to {value} exceeds its step {step}"
+            )
+
+    def __len__(self) -> int:
+        return len(self.setpoints)
+
+    def set(self, index: int) -> float:
+        """Writes the setpoint at index and returns it."""
+        value = float(self.setpoints[index])
+        self._check_step(value)
+        inter_delay = self.parameter.inter_delay
+        if inter_delay and self._last_write is not None:
+            wait = self._last_write + inter_delay - time.perf_counter()
+            if wait > 0:
+                time.sleep(wait)
+        self.instrument.write_raw(self.commands[index])
+        self._last_write = time.perf_counter()
+        self._last = value
+        return value
+
+    def finish(self) -> None:
+        """Stores the last setpoint written in the parameter cache."""
+        if self._last is not None:
+            self.parameter.cache.set(self._last)
+
+    def __iter__(self) -> Iterator[float]:
+        """Writes the setpoints one by one, yielding each after the write (and delay)."""
+        try:
+            for index in range(len(self.setpoints)):
+                value = self.set(index)
+                if self.delay:
+                    time.sleep(self.delay)
+                yield value
+        finally:
+            self.finish()
+
+    def run(self, measure: Callable[[], Any] | None = None) -> list[Any]:
+        """
+        Writes all setpoints, calling measure after each write.
+
+        Args:
+            measure: Called after each write (and delay).
+
+        Returns:
+            The results of measure.
+        """
+        return [measure() if measure is not None else None for _ in self]
+
+    def __enter__(self) -> "FastSweepSetter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.finish()
@@ -0,0 +1,206 @@
+"""
+Concurrent "read all" of parameters on different instruments.
+
+At a sweep point the readouts usually sit on independent interfaces
+(GPIB, USB, .NET), so reading them one after another wastes the sum of their
+latencies. GroupReadParameter reads the parameters of each instrument in
+its own worker thread, which makes the time per point the latency of the
+slowest instrument.
+
+The parameters of one instrument are still read one after another while
+holding the lock of that instrument (visa_lock of the VISA drivers,
+device_lock of QDdotNET), so other threads cannot interleave with them.
+Multi-valued members (e.g. lockin.xy_rtheta, read with one FETC?) keep their
+own single read and contribute one value per name.
+
+Example:
+    >>> with GroupReadParameter("readout", [k2182.amplitude, lockin.xy_rtheta, qd.temperature]) as readout:
+    ...     values = readout()        # flat tuple in the order of the members
+    >>> readout.last_record["time"]   # timestamp of the read
+    >>> readout.member_latency        # s per member
+"""
+import threading
+import time
+import weakref
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager
+from typing import Any
+
+from qcodes.parameters import ArrayParameter, MultiParameter, Parameter, ParameterBase
+
+# visa_lock も device_lock も持たない装置のためのロック
+_fallback_locks: "weakref.WeakKeyDictionary[Any, threading.RLock]" = weakref.WeakKeyDictionary()
+_fallback_locks_lock = threading.Lock()
+
+
+def instrument_lock(instrument: Any) -> AbstractContextManager:
+    """
+    Returns the lock serializing the access to an instrument.
+
+    The VISA drivers use their visa_lock and QDdotNET its device_lock.
+    Other instruments get a lock shared by all group reads.
+    """
+    for attribute in ("visa_lock", "device_lock"):
+        lock = getattr(instrument, attribute, None)
+        if lock is not None:
+            return lock
+    with _fallback_locks_lock:
+        lock = _fallback_locks.get(instrument)
+        if lock is None:
+            lock = threading.RLock()
+            _fallback_locks[instrument] = lock
+        return lock
+
+
+class GroupReadParameter(MultiParameter):
+    """
+    MultiParameter reading the parameters of several instruments concurrently.
+
+    The thread pool is shut down by close(), at the end of a with block,
+    or when the group parameter is garbage collected.
+
+    Args:
+        name: Name of the group parameter.
+        parameters: Parameters read at every get. Parameters of the same
+            instrument are read in the given order. A MultiParameter member
+            contributes one value per name (named "<member>_<name>"), a
+            ParameterWithSetpoints or ArrayParameter one array.
+        max_workers: Size of the thread pool. Defaults to the number of instruments.
+        **kwargs: Forwarded to MultiParameter.
+
+    Attributes:
+        last_record (dict): Result of the last get. It holds "time" (time.time()
+            at the start of the read), "duration" (s) and the value of every
+            member under its full name.
+        member_latency (dict[str, float]): Time in s each member took in the last get.
+        instrument_latency (dict[str, float]): Time in s each instrument took in the last get.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        parameters: Sequence[Parameter],
+        max_workers: int | None = None,
+        **kwargs: Any,
+    ) -> None:
+        self.members = list(parameters)
+        if not self.members:
+            raise ValueError("GroupReadParameter needs at least one parameter")
+        names: list[str] = []
+        shapes: list[tuple[int, ...]] = []
+        labels: list[str] = []
+        units: list[str] = []
+        # member index -> number of values it contributes (None: one value, not a tuple)
+        self._widths: list[int | None] = []
+        for parameter in self.members:
+            if isinstance(parameter, MultiParameter):
+                names += [f"{parameter.full_name}_{n}" for n in parameter.names]
+                shapes += [tuple(shape) for shape in parameter.shapes]
+                labels += list(parameter.labels)
+                units += list(parameter.units)
+                self._widths.append(len(parameter.names))
+            elif isinstance(parameter, (Parameter, ArrayParameter)):
+                names.append(parameter.full_name)
+                if isinstance(parameter, ArrayParameter):
+                    shapes.append(tuple(parameter.shape))
+                else:
+                    # ParameterWithSetpoints: shape of its Arrays validator
+                    shapes.append(tuple(getattr(parameter.vals, "shape", None) or ()))
+                labels.append(parameter.label)
+                units.append(parameter.unit)
+                self._widths.append(None)
+            elif isinstance(parameter, ParameterBase):
+                raise TypeError(f"{parameter.full_name} ({type(parameter).__name__}) cannot be read by a group")
+            else:
+                raise TypeError(f"{parameter!r} is not a parameter")
+        super().__init__(
+            name,
+            names=tuple(names),
+            shapes=tuple(shapes),
+            labels=tuple(labels),
+            units=tuple(units),
+            **kwargs,
+        )
+
+        # 装置ごとにまとめる (装置を持たないパラメータはそれ自体を一つのグループとする)
+        self._groups: dict[int, tuple[Any, list[int]]] = {}
+        for index, parameter in enumerate(self.members):
+            owner = parameter.root_instrument
+            if owner is None:
+                owner = parameter
+            self._groups.setdefault(id(owner), (owner, []))[1].append(index)
+
+        self.max_workers = max_workers or len(self._groups)
+        self._executor: ThreadPoolExecutor | None = None
+        self._executor_finalizer: weakref.finalize | None = None
+        self.last_record: dict[str, Any] = {}
+        self.member_latency: dict[str, float] = {}
+        self.instrument_latency: dict[str, float] = {}
+
+    def _read_group(self, owner: Any, indices: list[int]) -> tuple[list[Any], list[float], float]:
+        values = []
+        latencies = []
+        with instrument_lock(owner):
+            t_group = time.perf_counter()
+            for index in indices:
+                t0 = time.perf_counter()
+                values.append(self.members[index].get())
+                latencies.append(time.perf_counter() - t0)
+        return values, latencies, time.perf_counter() - t_group
+
+    def get_raw(self) -> tuple[Any, ...]:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix=f"group-read-{self.name}"
+            )
+            # 明示的に close() されなくても、参照がなくなればスレッドを止める
+            self._executor_finalizer = weakref.finalize(self, self._executor.shutdown, wait=False)
+        started = time.time()
+        t0 = time.perf_counter()
+        futures = [
+            (owner, indices, self._executor.submit(self._read_group, owner, indices))
+            for owner, indices in self._groups.values()
+        ]
+
+        member_values: list[Any] = [None] * len(self.members)
+        member_latency = {}
+        instrument_latency = {}
+        for owner, indices, future in futures:
+            group_values, latencies, group_latency = future.result()
+            for index, value, latency in zip(indices, group_values, latencies):
+                member_values[index] = value
+                member_latency[self.members[index].full_name] = latency
+            instrument_latency[getattr(owner, "full_name", str(owner))] = group_latency
+
+        values: list[Any] = []
+        for value, width in zip(member_values, self._widths):
+            if width is None:
+                values.append(value)
+            else:
+                values.extend(value)
+
+        self.member_latency = member_latency
+        self.instrument_latency = instrument_latency
+        self.last_record = {"time": started, "duration": time.perf_counter() - t0}
+        self.last_record.update(zip(self.names, values))
+        return tuple(values)
+
+    def read_record(self) -> dict[str, Any]:
+        """Reads all members and returns the timestamped record (see last_record)."""
+        self.get()
+        return dict(self.last_record)
+
+    def close(self) -> None:
+        """Shuts down the thread pool. It is recreated by the next get."""
+        if self._executor is not None:
+            self._executor_finalizer.detach()
+            self._executor.shutdown()
+            self._executor = None
+            self._executor_finalizer = None
+
+    def __enter__(self) -> "GroupReadParameter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
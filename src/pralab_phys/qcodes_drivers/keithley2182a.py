@@ -1,35 +1,45 @@
 # most of the drivers only need a couple of these... moved all up here for clarity below
-from typing import TYPE_CHECKING
+from functools import partial
+from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
     from typing_extensions import (
         Unpack,  # can be imported from typing if python >= 3.12
     )
 
-from qcodes import validators as vals
+import numpy as np
 from qcodes.instrument import (
-    VisaInstrument,
+    InstrumentBaseKWArgs,
+    InstrumentChannel,
     VisaInstrumentKWArgs,
 )
-from qcodes.parameters import Parameter
-from qcodes.validators import Enum, Numbers
+from qcodes.parameters import MultiParameter, Parameter
+from qcodes.validators import Enum, Ints
 
+from .keithley2182a1ch import Keithley2182A1ch
 
 
-
-class Keithley2182A1ch(VisaInstrument):
+class Keithley2182A(Keithley2182A1ch):
     """
-    Instrument Driver for Keithley2182A (1 channel, Voltage only)
+    Instrument Driver for Keithley2182A (2 channels, Voltage only)
 
-    Attributes:
-        nplc (Parameter): Set or get the number of power line cycles (min=0.01, max=50)
-        auto_range (Parameter): Set or get the measurement range automatically (1: ON, 0: OFF)
-        rel (Parameter): Enables or disables the application of
-                         a relative offset value to the measurement. (1: ON, 0: OFF)
-        active (Parameter): Set or get the active function. (VOLT or TEMP)
-        filter (Parameter): Enables or disables the digital filter for measurements.
-        amplitude (Parameter): Get the voltage (unit: V)
+    The single channel parameters and the buffer/trigger methods of
+    Keithley2182A1ch act on the active channel: amplitude, buffer_trace,
+    auto_range and rel follow channel, while nplc, filter and active apply
+    to both channels. ch1 and ch2 address their channel regardless of channel.
 
+    Attributes:
+        channel (Parameter): Set or get the active channel. (1 or 2)
+        auto_range (Parameter): Automatic range of the active channel. (1: ON, 0: OFF)
+        rel (Parameter): Relative offset of the active channel. (1: ON, 0: OFF)
+        ch1 (Keithley2182AChannel): Channel 1.
+        ch2 (Keithley2182AChannel): Channel 2.
+        ratio (Parameter): Enables or disables the CH1/CH2 ratio mode. (1: ON, 0: OFF)
+        scan_ch1_ch2 (Keithley2182AScan): CH1 and CH2 read with one query.
+
+    Methods:
+        scan(): Reads CH1 and CH2 in one triggered sequence and one transaction.
+        read_ratio(npoints): Acquires CH1/CH2 ratio readings through the reading buffer.
     """
     def __init__(
         self,
@@ -39,60 +49,145 @@ class Keithley2182A1ch(VisaInstrument):
         **kwargs: "Unpack[VisaInstrumentKWArgs]",
     ):
 
-        super().__init__(name, address, **kwargs)
-
-        self._trigger_sent = False
+        super().__init__(name, address, reset=reset, **kwargs)
 
-        self.nplc: Parameter = self.add_parameter(
-            "nplc",
-            get_cmd="SENS:VOLT:NPLC?",
-            set_cmd="SENS:VOLT:NPLC {}",
-            vals=Numbers(min_value=0.01, max_value=50),
-            get_parser=float
-        )
-
-    
-        self.activate: Parameter = self.add_parameter(
-            "active",
-            get_cmd=":SENS:FUNC?",
-            set_cmd="SENS:FUNC {}",
-            vals=Enum("VOLT", "TEMP")
-        )
-
-        self.channnel: Parameter = self.add_parameter(
+        self.channel: Parameter = self.add_parameter(
             "channel",
             get_cmd=":SENS:CHAN?",
-            set_cmd="SENS:CHAN {}",
+            set_cmd=self._set_channel,
+            get_parser=int,
             vals=Enum(1, 2)
         )
 
-        self.filter: Parameter = self.add_parameter(
-            "filter",
-            get_cmd=":SENS:VOLT:DFILter:STAT?",
-            set_cmd=":SENS:VOLT:DFILter:STAT {}"
+        # Keithley2182A1ch の auto_range / rel は CH1 固定なので、選択中のチャンネルに従うものに置き換える
+        for name, header in (("auto_range", "RANG:AUTO"), ("rel", "REFerence:STATe")):
+            del self.parameters[name]
+            delattr(self, name)
+            setattr(self, name, self.add_parameter(
+                name,
+                get_cmd=partial(self._ask_active_channel, header),
+                set_cmd=partial(self._write_active_channel, header),
+                vals=Ints(min_value=0, max_value=1),
+                get_parser=int
+            ))
+
+        self.ratio: Parameter = self.add_parameter(
+            "ratio",
+            get_cmd=":SENS:VOLT:RAT?",
+            set_cmd=":SENS:VOLT:RAT {}",
+            vals=Enum("ON", "OFF", "0", "1", 0, 1)
         )
 
-        self.amplitude: Parameter = self.add_parameter(
-            "amplitude",
-            get_cmd="SENS:DATA:FRES?",
-            get_parser=float,
-            unit="V"
+        self.ch1: Keithley2182AChannel = self.add_submodule(
+            "ch1", Keithley2182AChannel(self, "ch1", 1)
+        )
+        self.ch2: Keithley2182AChannel = self.add_submodule(
+            "ch2", Keithley2182AChannel(self, "ch2", 2)
+        )
+
+        self.scan_ch1_ch2: Keithley2182AScan = self.add_parameter(
+            "scan_ch1_ch2",
+            parameter_class=Keithley2182AScan,
         )
 
-        self.get = self.amplitude
+    def _device_reset(self) -> None:
+        super()._device_reset()
+        # *RST selects CH1 (reset=True resets before the parameters below exist)
+        for name in ("channel", "auto_range", "rel"):
+            if name in self.parameters:
+                self.parameters[name].cache.invalidate()
+
+    def _channel_changed(self, channel: int) -> None:
+        # auto_range / rel のキャッシュは前のチャンネルの値なので捨てる
+        if self.channel.cache.get(get_if_invalid=False) != channel:
+            self.auto_range.cache.invalidate()
+            self.rel.cache.invalidate()
+        self.channel.cache.set(channel)
+
+    def _set_channel(self, channel: int) -> None:
+        with self.visa_lock:
+            self.write(f":SENS:CHAN {channel}")
+            self._channel_changed(channel)
+
+    def _ask_active_channel(self, header: str) -> str:
+        with self.visa_lock:
+            return self.ask(f"SENS:VOLT:CHAN{self.channel.get_latest()}:{header}?")
+
+    def _write_active_channel(self, header: str, value: int) -> None:
+        with self.visa_lock:
+            self.write(f"SENS:VOLT:CHAN{self.channel.get_latest()}:{header} {value}")
+
+    def _get_channel_amplitude(self, channel: int) -> float:
+        self._resume_continuous()
+        # チャンネルの切り替えと読み取りを一回の通信で行う
+        value = float(self.ask(f":SENS:CHAN {channel};:SENS:DATA:FRES?"))
+        self._channel_changed(channel)
+        return value
+
+    def scan(self) -> tuple[float, float]:
+        """
+        Reads CH1 and CH2 in one triggered sequence.
+
+        Both readings are requested in a single compound query
+        (each :READ? triggers one conversion on the selected channel),
+        so a point costs one transaction instead of two read cycles.
+
+        Returns:
+            The voltages of CH1 and CH2 (V).
+        """
+        cmd = self._suspend_continuous()
+        if self._trigger_mode != "single":
+            cmd += ":ABOR;:TRIG:SOUR IMM;:TRIG:COUN 1;:SAMP:COUN 1;"
+            self._trigger_mode = "single"
+        self._trigger_sent = False
+        response = self.ask(cmd + ":SENS:CHAN 1;:READ?;:SENS:CHAN 2;:READ?")
+        self._channel_changed(2)
+        v1, v2 = (float(v) for v in response.replace(";", ",").split(","))
+        return v1, v2
+
+    def read_ratio(
+        self,
+        npoints: int,
+        binary: bool | None = None,
+        timeout: float | None = None,
+    ) -> np.ndarray:
+        """
+        Acquires ``npoints`` CH1/CH2 ratio readings through the reading buffer,
+        downloaded in one transfer per buffer fill. The ratio mode is left as it was.
+
+        Args:
+            npoints: Number of readings.
+            binary: Use binary transfer. If None, it follows buffer_format.
+            timeout: Maximum waiting time in s for each buffer fill.
+
+        Returns:
+            The ratios CH1/CH2.
+        """
+        previous = self.ratio.get()
+        self.ratio.set("ON")
+        try:
+            return self.read_buffer(npoints, binary=binary, timeout=timeout)
+        finally:
+            # 呼び出し前の ratio の状態に戻す
+            self.ratio.set(previous)
 
 
 class Keithley2182AChannel(InstrumentChannel):
     """
     Class to hold the two Keithley channels, i.e.
     CH1 and CH2.
+
+    Attributes:
+        auto_range (Parameter): Set or get the measurement range automatically (1: ON, 0: OFF)
+        rel (Parameter): Enables or disables the relative offset of the channel. (1: ON, 0: OFF)
+        amplitude (Parameter): Get the voltage of the channel (unit: V)
     """
 
     def __init__(
         self,
-        parent: Instrument,
+        parent: Keithley2182A,
         name: str,
-        channel: str,
+        channel: int,
         **kwargs: "Unpack[InstrumentBaseKWArgs]",
     ) -> None:
         """
@@ -100,97 +195,63 @@ class Keithley2182AChannel(InstrumentChannel):
             parent: The Instrument instance to which the channel is
                 to be attached.
             name: The 'colloquial' name of the channel
-            channel: The name used by the Keithley, i.e. either
-                'ch1' or 'ch2'
+            channel: The channel number, i.e. either 1 or 2
             **kwargs: Forwarded to base class.
 
         """
 
-        if channel not in ["ch1", "ch2"]:
-            raise ValueError('channel must be either "ch1" or "ch2"')
-
-        dchannel = {
-            "ch1": "CHAN1",
-            "ch2": "CHAN2"
-        }
+        if channel not in (1, 2):
+            raise ValueError("channel must be either 1 or 2")
 
         super().__init__(parent, name, **kwargs)
-        self.model = self._parent.model
+        self.channel = channel
 
         self.auto_range: Parameter = self.add_parameter(
             "auto_range",
-            get_cmd=f"SENS:VOLT:{dchannel[channel]}:RANG:AUTO?",
-            set_cmd=f"SENS:VOLT:{dchannel[channel]}:RANG:AUTO {{}}"
+            get_cmd=f"SENS:VOLT:CHAN{channel}:RANG:AUTO?",
+            set_cmd=f"SENS:VOLT:CHAN{channel}:RANG:AUTO {{}}",
+            vals=Ints(min_value=0, max_value=1),
+            get_parser=int
         )
 
-        self.vrel: Parameter = self.add_parameter(
-            "vrel",
-            get_cmd=f"SENS:VOLT:{dchannel[channel]}:REFerence:STATe?",
-            set_cmd=f"SENS:VOLT:{dchannel[channel]}:REFerence:STATe {{}}"
+        self.rel: Parameter = self.add_parameter(
+            "rel",
+            get_cmd=f"SENS:VOLT:CHAN{channel}:REFerence:STATe?",
+            set_cmd=f"SENS:VOLT:CHAN{channel}:REFerence:STATe {{}}",
+            vals=Ints(min_value=0, max_value=1),
+            get_parser=int
         )
 
         self.amplitude: Parameter = self.add_parameter(
             "amplitude",
-            get_cmd="SENS:DATA:FRES?",
-            get_parser=float,
+            get_cmd=self._get_amplitude,
             unit="V"
         )
 
-        
-
+    def _get_amplitude(self) -> float:
+        return self.parent._get_channel_amplitude(self.channel)
 
 
-class Keithley2600(VisaInstrument):
+class Keithley2182AScan(MultiParameter):
     """
-    This is the qcodes driver for the Keithley2600 Source-Meter series,
-    tested with Keithley2614B
+    MultiParameter for the CH1 and CH2 voltages read by Keithley2182A.scan().
     """
-
-    default_terminator = "\n"
-
     def __init__(
-        self, name: str, address: str, **kwargs: "Unpack[VisaInstrumentKWArgs]"
+        self,
+        name: str,
+        instrument: Keithley2182A,
+        **kwargs: Any,
     ) -> None:
-        """
-        Args:
-            name: Name to use internally in QCoDeS
-            address: VISA ressource address
-            **kwargs: kwargs are forwarded to the base class.
-
-        """
-        super().__init__(name, address, **kwargs)
-
-        model = self.ask("localnode.model")
-
-        knownmodels = [
-            "2601B",
-            "2602B",
-            "2604B",
-            "2611B",
-            "2612B",
-            "2614B",
-            "2635B",
-            "2636B",
-        ]
-        if model not in knownmodels:
-            kmstring = ("{}, " * (len(knownmodels) - 1)).format(*knownmodels[:-1])
-            kmstring += f"and {knownmodels[-1]}."
-            raise ValueError("Unknown model. Known model are: " + kmstring)
-
-        # Add the channel to the instrument
-        self.smua = self.add_submodule("smua", KeithleyChannel(self, "smua", "smua"))
-        "smua channel of the instrument"
-        self.smub = self.add_submodule("smub", KeithleyChannel(self, "smub", "smub"))
-        "smub channel of the instrument"
-
-        # display parameter
-        # Parameters NOT specific to a channel still belong on the Instrument object
-        # In this case, the Parameter controls the text on the display
-        self.display_settext = Parameter(
-            "display_settext",
-            set_cmd=self._display_settext,
-            vals=vals.Strings(),
-            instrument=self,
+        super().__init__(
+            name,
+            names=("ch1", "ch2"),
+            shapes=((), ()),
+            labels=("CH1 voltage", "CH2 voltage"),
+            units=("V", "V"),
+            instrument=instrument,
+            **kwargs,
         )
 
-        self.connect_message()
\ No newline at end of file
+    def get_raw(self) -> tuple[float, float]:
+        """Returns the CH1 and CH2 voltages"""
+        return self.instrument.scan()
@@ -1,20 +1,42 @@
 # most of the drivers only need a couple of these... moved all up here for clarity below
-from typing import TYPE_CHECKING
+import json
+import time
+import warnings
+from collections.abc import Sequence
+from datetime import datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
     from typing_extensions import (
         Unpack,  # can be imported from typing if python >= 3.12
     )
 
+import numpy as np
 from qcodes import validators as vals
 from qcodes.instrument import (
-    VisaInstrument,
     VisaInstrumentKWArgs,
 )
-from qcodes.parameters import Parameter
-from qcodes.validators import Enum, Numbers
+from qcodes.parameters import ArrayParameter, Parameter
+from qcodes.validators import Enum, Ints, Numbers
 
-class Keithley2182A1ch(VisaInstrument):
+from .visa_base import PralabVisaInstrument
+
+# The 2182A reading buffer holds at most 1024 readings.
+BUFFER_MAX_POINTS = 1024
+
+# 装置・試料ごとの nplc/filter 最適値を保存する場所
+DEFAULT_TUNING_PATH = Path.home() / ".pralab_phys" / "keithley2182a_tuning.json"
+# nplc values tried by tune_speed()
+TUNING_NPLC = (0.01, 0.05, 0.1, 0.5, 1, 2, 5)
+
+
+def _parse_function(response: str) -> str:
+    """Returns the function of a SENS:FUNC? response ('"VOLT:DC"' -> "VOLT")."""
+    return response.strip().strip('"').split(":")[0]
+
+
+class Keithley2182A1ch(PralabVisaInstrument):
     """
     Instrument Driver for Keithley2182A (1 channel, Voltage only)
 
@@ -24,10 +46,30 @@ class Keithley2182A1ch(VisaInstrument):
         rel (Parameter): Enables or disables the application of
                          a relative offset value to the measurement. (1: ON, 0: OFF)
         active (Parameter): Set or get the active function. (VOLT or TEMP)
-        filter (Parameter): Enables or disables the digital filter for measurements.
+        filter (Parameter): Enables or disables the digital filter for measurements. (1: ON, 0: OFF)
         amplitude (Parameter): Get the voltage (unit: V)
+        buffer_npoints (Parameter): Number of readings acquired by buffer_trace.
+        buffer_format (Parameter): Transfer format of the buffer download. ("ascii" or "real32")
+        buffer_trace (ArrayParameter): Get buffer_npoints readings through the reading buffer (unit: V)
+        tuning_table (list[dict]): Speed/noise table measured by the last tune_speed().
 
+    Methods:
+        trigger(): Starts one conversion without waiting for it.
+        is_ready(): Returns True when the triggered conversion has finished.
+        fetch(): Returns the reading started by trigger().
+        buffer_arm(npoints): Clears the reading buffer and starts filling it.
+        buffer_wait(npoints): Waits until the reading buffer holds npoints readings.
+        buffer_fetch(): Downloads the reading buffer in one transfer.
+        read_buffer(npoints): Arms, waits and fetches npoints readings.
+        reset(): Resets the instrument (*RST) and invalidates the suppressed writes.
+        enable_write_suppression(*names): Skips nplc/filter/range writes that would not change them.
+        measure_noise(npoints): Measures the noise and the time per reading of the present setting.
+        tune_speed(noise_floor, sample): Picks the fastest nplc/filter meeting a noise floor and saves it.
+        load_tuning(sample): Applies the setting saved by tune_speed().
     """
+
+    _suppressible_parameters = ("nplc", "auto_range", "active", "filter")
+
     def __init__(
         self,
         name: str,
@@ -39,6 +81,12 @@ class Keithley2182A1ch(VisaInstrument):
         super().__init__(name, address, **kwargs)
 
         self._trigger_sent = False
+        self._reading_ready = False
+        self._continuous_suspended = False
+        # 現在の trigger model の設定 ("single": trigger()/fetch() 用, "buffer": buffer_arm() 用)
+        self._trigger_mode: str | None = None
+        self.tuning_table: list[dict[str, Any]] = []
+        """Speed/noise table measured by the last tune_speed()."""
 
         self.nplc: Parameter = self.add_parameter(
             "nplc",
@@ -52,34 +100,434 @@ class Keithley2182A1ch(VisaInstrument):
         self.auto_range: Parameter = self.add_parameter(
             "auto_range",
             get_cmd="SENS:VOLT:CHAN1:RANG:AUTO?",
-            set_cmd="SENS:VOLT:CHAN1:RANG:AUTO {}"
+            set_cmd="SENS:VOLT:CHAN1:RANG:AUTO {}",
+            vals=Ints(min_value=0, max_value=1),
+            get_parser=int
         )
 
         # 将来的に「チャンネルの変更」「Bool値の入力方法」「温度かボルテージか」など変更できるようにしたい
         self.rel: Parameter = self.add_parameter(
             "rel",
             get_cmd="SENS:VOLT:REFerence:STATe?",
-            set_cmd="SENS:VOLT:REFerence:STATe {}"
+            set_cmd="SENS:VOLT:REFerence:STATe {}",
+            vals=Ints(min_value=0, max_value=1),
+            get_parser=int
         )
 
         self.active: Parameter = self.add_parameter(
             "active",
             get_cmd=":SENS:FUNC?",
             set_cmd="SENS:FUNC {}",
-            vals=Enum("VOLT", "TEMP")
+            vals=Enum("VOLT", "TEMP"),
+            get_parser=_parse_function
         )
 
         self.filter: Parameter = self.add_parameter(
             "filter",
             get_cmd=":SENS:VOLT:DFILter:STAT?",
-            set_cmd=":SENS:VOLT:DFILter:STAT {}"
+            set_cmd=":SENS:VOLT:DFILter:STAT {}",
+            vals=Ints(min_value=0, max_value=1),
+            get_parser=int
         )
 
         self.amplitude: Parameter = self.add_parameter(
             "amplitude",
-            get_cmd="SENS:DATA:FRES?",
-            get_parser=float,
+            get_cmd=self._get_amplitude,
             unit="V"
         )
 
-        self.get = self.amplitude
\ No newline at end of file
+        self.buffer_trace: K2182ABufferTrace = self.add_parameter(
+            "buffer_trace",
+            parameter_class=K2182ABufferTrace,
+            label="buffer trace",
+            unit="V",
+        )
+
+        self.buffer_npoints: Parameter = self.add_parameter(
+            "buffer_npoints",
+            label="buffer points",
+            get_cmd=None,
+            set_cmd=self._set_buffer_npoints,
+            vals=Ints(min_value=1),
+            initial_value=BUFFER_MAX_POINTS,
+        )
+
+        # ASCII の解析が長いトレースの読み出し時間の大半を占めるため、既定はバイナリ転送
+        self.buffer_format: Parameter = self.add_parameter(
+            "buffer_format",
+            label="buffer transfer format",
+            get_cmd=None,
+            set_cmd=None,
+            vals=Enum("ascii", "real32"),
+            initial_value="real32",
+        )
+
+        self.get = self.amplitude
+
+        if reset:
+            self.reset()
+
+    def reset(self) -> None:
+        """Resets the instrument to the default settings."""
+        self.write("*RST")
+
+    def _device_reset(self) -> None:
+        super()._device_reset()
+        # *RST turns continuous initiation off
+        self._continuous_suspended = True
+        self._trigger_mode = None
+        self._trigger_sent = False
+        self._reading_ready = False
+
+    def _get_amplitude(self) -> float:
+        self._resume_continuous()
+        return float(self.ask("SENS:DATA:FRES?"))
+
+    def _suspend_continuous(self) -> str:
+        """Returns the command prefix that stops continuous initiation, if still needed."""
+        if self._continuous_suspended:
+            return ""
+        self._continuous_suspended = True
+        return ":INIT:CONT OFF;"
+
+    def _resume_continuous(self) -> None:
+        # SENS:DATA:FRES? only returns when a fresh reading is triggered,
+        # so continuous initiation is restored after buffered/triggered reads.
+        if self._continuous_suspended:
+            cmd = ":INIT:CONT ON"
+            if self._trigger_mode is not None:
+                # buffer_arm() が残した TRIG:SOUR (EXT, BUS, ...) / TRIG:COUN を既定に戻す
+                cmd = ":ABOR;:TRIG:SOUR IMM;:TRIG:COUN 1;" + cmd
+                self._trigger_mode = None
+                self._trigger_sent = False
+                self._reading_ready = False
+            self.write(cmd)
+            self._continuous_suspended = False
+
+    def trigger(self) -> None:
+        """
+        Starts one conversion and returns immediately.
+
+        Other instruments can be read while the 2182A integrates;
+        the reading is collected afterwards with fetch().
+        """
+        cmd = self._suspend_continuous()
+        if self._trigger_mode != "single":
+            cmd += ":ABOR;:TRIG:SOUR IMM;:TRIG:COUN 1;:SAMP:COUN 1;"
+            self._trigger_mode = "single"
+        # *OPC sets the operation complete bit of the event status register
+        # once the conversion has finished, which is_ready() polls.
+        self.write(cmd + "*CLS;:INIT;*OPC")
+        self._trigger_sent = True
+        self._reading_ready = False
+
+    def is_ready(self) -> bool:
+        """Returns True when the conversion started by trigger() has finished."""
+        if not self._trigger_sent:
+            return False
+        if not self._reading_ready:
+            self._reading_ready = bool(int(self.ask("*ESR?")) & 1)
+        return self._reading_ready
+
+    def fetch(self, timeout: float | None = None, poll_interval: float = 0.01) -> float:
+        """
+        Returns the reading started by trigger(), waiting for it if necessary.
+        If no conversion was triggered, one is started first.
+
+        Args:
+            timeout: Maximum waiting time in s. If None, it is estimated from nplc.
+            poll_interval: Interval between completion queries in s.
+
+        Returns:
+            The voltage (V).
+        """
+        if not self._trigger_sent:
+            self.trigger()
+        if timeout is None:
+            timeout = 5 + 3 * self.nplc.get_latest() / 50
+        deadline = time.perf_counter() + timeout
+        while not self.is_ready():
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Triggered reading did not finish within {timeout:.1f} s")
+            time.sleep(poll_interval)
+        self._trigger_sent = False
+        self._reading_ready = False
+        return float(self.ask(":FETC?"))
+
+    def _set_buffer_npoints(self, npoints: int) -> None:
+        self.buffer_trace.shape = (npoints,)
+        self.buffer_trace.setpoints = (tuple(range(npoints)),)
+
+    def buffer_arm(self, npoints: int, trigger_source: str = "IMM") -> None:
+        """
+        Clears the reading buffer and starts storing the next ``npoints`` readings.
+
+        Args:
+            npoints: Number of readings to store (1 to 1024).
+            trigger_source: Trigger source of each reading ("IMM", "EXT", "BUS", "TIM", "MAN").
+        """
+        if not 1 <= npoints <= BUFFER_MAX_POINTS:
+            raise ValueError(f"npoints must be between 1 and {BUFFER_MAX_POINTS}")
+        self._trigger_mode = "buffer"
+        self._trigger_sent = False
+        self.write(
+            self._suspend_continuous()
+            + ":ABOR;:TRAC:CLE;"
+            + f":TRAC:POIN {npoints};:TRAC:FEED SENS;:TRAC:FEED:CONT NEXT;"
+            + f":TRIG:SOUR {trigger_source};:TRIG:COUN {npoints};:SAMP:COUN 1;"
+            + ":INIT"
+        )
+
+    def buffer_count(self) -> int:
+        """Returns the number of readings currently stored in the buffer."""
+        return int(float(self.ask(":TRAC:POIN:ACT?")))
+
+    def buffer_wait(
+        self,
+        npoints: int,
+        timeout: float | None = None,
+        poll_interval: float = 0.05,
+    ) -> None:
+        """
+        Waits until the reading buffer holds ``npoints`` readings.
+
+        Args:
+            npoints: Number of readings to wait for.
+            timeout: Maximum waiting time in s. If None, it is estimated from nplc.
+            poll_interval: Interval between buffer count queries in s.
+        """
+        if timeout is None:
+            # 50 Hz を仮定した積分時間の見積もりに余裕を持たせる
+            timeout = 5 + 3 * npoints * self.nplc.get_latest() / 50
+        deadline = time.perf_counter() + timeout
+        while self.buffer_count() < npoints:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Reading buffer did not fill {npoints} points within {timeout:.1f} s")
+            time.sleep(poll_interval)
+
+    def buffer_fetch(self, binary: bool | None = None) -> np.ndarray:
+        """
+        Downloads the whole reading buffer in one transfer.
+
+        Args:
+            binary: Use IEEE754 single precision transfer (FORM:DATA REAL,32).
+                If None, it follows buffer_format.
+
+        Returns:
+            The stored readings (V).
+        """
+        if binary is None:
+            binary = self.buffer_format.get() == "real32"
+        if not binary:
+            return self.ask_ascii_values(":TRAC:DATA?")
+        with self.visa_lock:
+            try:
+                data = self.ask_binary_values(
+                    ":FORM:BORD NORM;:FORM:DATA REAL,32;:TRAC:DATA?",
+                    datatype="f",
+                    is_big_endian=True,
+                )
+            finally:
+                # amplitude などの ASCII 読み出しを壊さないよう戻しておく
+                self.write(":FORM:DATA ASC")
+        return data.astype(float)
+
+    def read_buffer(
+        self,
+        npoints: int,
+        binary: bool | None = None,
+        timeout: float | None = None,
+    ) -> np.ndarray:
+        """
+        Acquires ``npoints`` readings through the reading buffer.
+
+        Traces longer than the buffer (1024 readings) are acquired in consecutive fills.
+
+        Args:
+            npoints: Number of readings.
+            binary: Use binary transfer. If None, it follows buffer_format.
+            timeout: Maximum waiting time in s for each buffer fill.
+
+        Returns:
+            The readings (V).
+        """
+        chunks = []
+        remaining = npoints
+        while remaining > 0:
+            n = min(remaining, BUFFER_MAX_POINTS)
+            self.buffer_arm(n)
+            self.buffer_wait(n, timeout=timeout)
+            chunks.append(self.buffer_fetch(binary))
+            remaining -= n
+        return np.concatenate(chunks)
+
+    def measure_noise(self, npoints: int = 100, poll_interval: float = 0.002) -> tuple[float, float]:
+        """
+        Measures the noise of the present nplc/filter setting on the connected sample.
+
+        The noise is the standard deviation of npoints buffered readings after
+        removing a linear drift. The time per reading is measured from arming
+        the buffer until it holds npoints readings, polling every poll_interval,
+        so it includes the conversion overhead of the instrument but not the
+        download of the buffer.
+
+        Args:
+            npoints: Number of readings.
+            poll_interval: Interval between buffer count queries in s.
+                It bounds the timing error to poll_interval / npoints per reading.
+
+        Returns:
+            The noise (V) and the time per reading (s).
+        """
+        chunks = []
+        elapsed = 0.0
+        remaining = npoints
+        while remaining > 0:
+            n = min(remaining, BUFFER_MAX_POINTS)
+            t0 = time.perf_counter()
+            self.buffer_arm(n)
+            self.buffer_wait(n, poll_interval=poll_interval)
+            elapsed += time.perf_counter() - t0
+            chunks.append(self.buffer_fetch())
+            remaining -= n
+        readings = np.concatenate(chunks)
+        index = np.arange(len(readings))
+        drift = np.polyval(np.polyfit(index, readings, 1), index)
+        return float(np.std(readings - drift, ddof=1)), elapsed / npoints
+
+    def _tuning_key(self) -> str:
+        idn = self.IDN()
+        if idn.get("model") and idn.get("serial"):
+            return f"{idn['model']}-{idn['serial']}"
+        return self.name
+
+    def tune_speed(
+        self,
+        noise_floor: float,
+        sample: str,
+        nplc_values: Sequence[float] = TUNING_NPLC,
+        filters: Sequence[bool] = (False, True),
+        npoints: int = 100,
+        apply: bool = True,
+        path: str | Path | None = DEFAULT_TUNING_PATH,
+    ) -> dict[str, Any]:
+        """
+        Measures the noise versus nplc and digital filter, and picks the fastest
+        setting whose noise is below noise_floor.
+
+        The measured table is kept in tuning_table. If no setting reaches the
+        noise floor, the quietest one is picked with a warning.
+
+        Args:
+            noise_floor: Required noise (V).
+            sample: Name of the connected sample, used as key of the saved setting.
+            nplc_values: nplc values tried.
+            filters: Digital filter states tried.
+            npoints: Readings per setting.
+            apply: Leave the instrument at the chosen setting.
+                Otherwise the previous nplc and filter are restored.
+            path: JSON file the chosen setting is saved to. If None, nothing is saved.
+
+        Returns:
+            The chosen setting: nplc, filter, noise (V) and time_per_reading (s),
+            the acquisition time per reading measured by measure_noise().
+        """
+        previous = (self.nplc.get(), self.filter.get())
+        table = []
+        try:
+            for use_filter in filters:
+                self.filter.set(int(use_filter))
+                for nplc in nplc_values:
+                    self.nplc.set(nplc)
+                    noise, time_per_reading = self.measure_noise(npoints)
+                    table.append({
+                        "nplc": nplc,
+                        "filter": use_filter,
+                        "noise": noise,
+                        "time_per_reading": time_per_reading,
+                    })
+        finally:
+            if not apply:
+                self.nplc.set(previous[0])
+                self.filter.set(previous[1])
+        self.tuning_table = table
+
+        passing = [row for row in table if row["noise"] <= noise_floor]
+        if passing:
+            chosen = min(passing, key=lambda row: row["time_per_reading"])
+        else:
+            chosen = min(table, key=lambda row: row["noise"])
+            warnings.warn(
+                f"No setting reaches the noise floor {noise_floor:.3g} V; "
+                f"using the quietest one ({chosen['noise']:.3g} V)"
+            )
+        if apply:
+            self.nplc.set(chosen["nplc"])
+            self.filter.set(int(chosen["filter"]))
+
+        if path is not None:
+            path = Path(path)
+            saved = {}
+            if path.exists():
+                with open(path, encoding="utf-8") as f:
+                    saved = json.load(f)
+            entry = dict(chosen, noise_floor=noise_floor, date=datetime.now().isoformat(timespec="seconds"))
+            saved.setdefault(self._tuning_key(), {})[sample] = entry
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(saved, f, indent=2, ensure_ascii=False)
+        return chosen
+
+    def load_tuning(
+        self,
+        sample: str,
+        apply: bool = True,
+        path: str | Path = DEFAULT_TUNING_PATH,
+    ) -> dict[str, Any] | None:
+        """
+        Returns the setting saved by tune_speed() for this instrument and sample.
+
+        Args:
+            sample: Name of the connected sample.
+            apply: Set nplc and filter to the saved setting.
+            path: JSON file of the saved settings.
+
+        Returns:
+            The saved setting, or None if there is none.
+        """
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f).get(self._tuning_key(), {}).get(sample)
+        if entry is not None and apply:
+            self.nplc.set(entry["nplc"])
+            self.filter.set(int(entry["filter"]))
+        return entry
+
+
+class K2182ABufferTrace(ArrayParameter):
+    """
+    ArrayParameter for the readings acquired through the Keithley2182A reading buffer.
+    The number of readings follows the buffer_npoints parameter of the instrument.
+    """
+    def __init__(
+        self,
+        name: str,
+        instrument: Keithley2182A1ch,
+        **kwargs,
+    ) -> None:
+        super().__init__(
+            name,
+            shape=(BUFFER_MAX_POINTS,),
+            instrument=instrument,
+            setpoints=(tuple(range(BUFFER_MAX_POINTS)),),
+            setpoint_names=("sample",),
+            setpoint_labels=("sample",),
+            setpoint_units=("",),
+            **kwargs,
+        )
+
+    def get_raw(self) -> np.ndarray:
+        """Returns the buffered readings"""
+        return self.instrument.read_buffer(self.shape[0])
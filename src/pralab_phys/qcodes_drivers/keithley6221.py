@@ -13,16 +13,38 @@ Attributes:
     wave_use_phasemarker (Parameter): Phase marker usage state (ON/OFF).
     wave_phasemarker_phase (Parameter): Phase of the phase marker in degrees.
     wave_phasemarker_line (Parameter): Line number of the phase marker.
+    average_state (Parameter): Repeating/moving average filter of the delta readings (ON/OFF).
+    average_count (Parameter): Number of readings averaged by the filter.
+    average_type (Parameter): Filter type ("moving" or "repeat").
+    delta (Keithley6221Delta): Delta mode with a 2182A.
+    pulse_delta (Keithley6221PulseDelta): Pulse delta mode with a 2182A.
+    diff_conductance (Keithley6221DiffConductance): Differential conductance mode with a 2182A.
 
 Methods:
     waveform_arm(): Arms the current waveform function.
     waveform_start(): Starts the waveform output.
     waveform_abort(): Aborts the waveform output.
     clear(): Clears the source settings.
+    reset(): Resets the instrument (*RST) and invalidates the suppressed writes.
+    enable_write_suppression(*names): Skips wave/compliance/average writes that would not change them.
     on(): Turns the output ON.
     off(): Turns the output OFF.
+    ramp_dc_amplitude(target, rate, step): Ramps dc_amplitude in a worker thread.
+    sweep_list(currents, delay, compliance): Uploads and arms a hardware list sweep.
+    sweep_linear(start, stop, npoints): Uploads and arms a linear list sweep.
+    sweep_log(start, stop, npoints): Uploads and arms a logarithmic list sweep.
+    sweep_start(): Starts the armed sweep.
+    sweep_abort(): Aborts the sweep.
+    configure_trigger_link(output_line, input_line): Triggers a 2182A over Trigger Link at each sweep step.
+    buffer_count(): Returns the number of readings stored in the buffer.
+    buffer_fetch(binary): Downloads the reading buffer in one transfer.
+    load_arbitrary(slot, waveform): Uploads an arbitrary waveform to ARB1-ARB4 unless it is already loaded.
+    invalidate_arbitrary_cache(slot): Forgets which waveforms are loaded.
 """
 # most of the drivers only need a couple of these... moved all up here for clarity below
+import abc
+import hashlib
+from collections.abc import Sequence
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
@@ -30,20 +52,55 @@ if TYPE_CHECKING:
         Unpack,  # can be imported from typing if python >= 3.12
     )
 
+import numpy as np
+
 from qcodes import validators as vals
+import time
+
 from qcodes.instrument import (
-    Instrument,
-    VisaInstrument,
+    InstrumentBaseKWArgs,
+    InstrumentModule,
     VisaInstrumentKWArgs,
 )
 from qcodes.parameters import Parameter
 from qcodes.validators import Enum, Ints, MultiType, Numbers
 
-class Keithley6221(VisaInstrument):
+from .ramp import RampFuture, ramp_parameter
+from .visa_base import PralabVisaInstrument
+
+# Number of list points sent per SCPI message when uploading lists.
+# The 6221 accepts up to 100 points per list message.
+LIST_CHUNK_SIZE = 100
+# Maximum number of points of an arbitrary waveform.
+ARB_MAX_POINTS = 65536
+
+class Keithley6221(PralabVisaInstrument):
     """Instrument Driver for Keithley6221"""
 
     default_terminator = "\n"
 
+    _suppressible_parameters = (
+        "dc_compliance",
+        "auto_range",
+        "wave_func",
+        "wave_amplitude",
+        "wave_frec",
+        "wave_offset",
+        "wave_use_phasemarker",
+        "wave_phasemarker_phase",
+        "wave_phasemarker_line",
+        "average_state",
+        "average_count",
+        "average_type",
+    )
+
+    _fast_set_formats = {
+        "dc_amplitude": "SOUR:CURR:AMPL {}",
+        "wave_amplitude": "SOUR:WAVE:AMPL {}",
+        "wave_frec": "SOUR:WAVE:FREQ {}",
+        "wave_offset": "SOUR:WAVE:OFFS {}",
+    }
+
     def __init__(
         self,
         name: str,
@@ -56,6 +113,8 @@ class Keithley6221(VisaInstrument):
         """
         super().__init__(name, address, **kwargs)
 
+        # ARB1-ARB4 に読み込み済みの波形のハッシュ
+        self._arb_hashes: dict[int, str] = {}
 
         self.output: Parameter = self.add_parameter(
             "output",
@@ -147,6 +206,45 @@ class Keithley6221(VisaInstrument):
             vals=Enum(1, 2, 3, 4, 5, 6),
         )
 
+        # delta 系モードの平均化フィルタ (6221 のファームウェアで平均化される)
+        self.average_state: Parameter = self.add_parameter(
+            "average_state",
+            get_cmd="SENS:AVER?",
+            set_cmd="SENS:AVER {}",
+            vals = Enum("ON", "OFF", "0", "1")
+        )
+
+        self.average_count: Parameter = self.add_parameter(
+            "average_count",
+            get_cmd="SENS:AVER:COUN?",
+            set_cmd="SENS:AVER:COUN {}",
+            get_parser=lambda v: int(float(v)),
+            vals=Ints(min_value=2, max_value=300),
+        )
+
+        self.average_type: Parameter = self.add_parameter(
+            "average_type",
+            get_cmd="SENS:AVER:TCON?",
+            set_cmd="SENS:AVER:TCON {}",
+            val_mapping={
+                "moving": "MOV",
+                "repeat": "REP",
+            },
+        )
+
+        self.delta: Keithley6221Delta = self.add_submodule(
+            "delta", Keithley6221Delta(self, "delta")
+        )
+        self.pulse_delta: Keithley6221PulseDelta = self.add_submodule(
+            "pulse_delta", Keithley6221PulseDelta(self, "pulse_delta")
+        )
+        self.diff_conductance: Keithley6221DiffConductance = self.add_submodule(
+            "diff_conductance", Keithley6221DiffConductance(self, "diff_conductance")
+        )
+
+        if reset:
+            self.reset()
+
     def waveform_arm(self):
         """ Arm the current waveform function. """
         self.write("SOUR:WAVE:ARM")
@@ -162,8 +260,470 @@ class Keithley6221(VisaInstrument):
     def clear(self):
         self.write("SOUR:CLE:IMM")
 
+    def reset(self):
+        """ Reset the instrument to the default settings. """
+        self.write("*RST")
+
     def on(self):
         self.write("OUTPUT ON")
     
     def off(self):
         self.write("OUTPUT OFF")
+
+    def ramp_dc_amplitude(self, target: float, rate: float, step: float) -> RampFuture:
+        """
+        Ramps dc_amplitude to target in a worker thread and returns immediately.
+
+        Args:
+            target: Target current in A.
+            rate: Ramp rate in A/s.
+            step: Maximum step in A.
+
+        Returns:
+            The future of the ramp. stop() ends the ramp at the present value.
+        """
+        return ramp_parameter(self.dc_amplitude, target, rate, step)
+
+    def _write_list(
+        self,
+        command: str,
+        values: Sequence[float],
+        chunk_size: int = LIST_CHUNK_SIZE,
+        append_command: str | None = None,
+        fmt: str = "{:.6e}",
+    ) -> None:
+        """Writes a point list with as few messages as possible, appending with <command>:APP."""
+        if append_command is None:
+            append_command = f"{command}:APP"
+        for start in range(0, len(values), chunk_size):
+            chunk = ",".join(fmt.format(v) for v in values[start:start + chunk_size])
+            if start == 0:
+                self.write(f"{command} {chunk}")
+            else:
+                self.write(f"{append_command} {chunk}")
+
+    def configure_trigger_link(self, output_line: int = 2, input_line: int = 1) -> None:
+        """
+        Outputs a Trigger Link pulse after the source delay of each sweep step,
+        so that a 2182A armed with trigger_source="EXT" stores one reading per step.
+
+        Args:
+            output_line: Trigger Link line used to trigger the 2182A.
+            input_line: Trigger Link line on which the 2182A reports completion.
+        """
+        self.write(
+            f"TRIG:SOUR TLIN;:TRIG:DIR SOUR;:TRIG:OLIN {output_line};"
+            f":TRIG:ILIN {input_line};:TRIG:OUTP DEL"
+        )
+
+    def sweep_list(
+        self,
+        currents: Sequence[float],
+        delay: float = 1e-3,
+        compliance: float | None = None,
+        count: int = 1,
+        trigger_link: bool = True,
+        chunk_size: int = LIST_CHUNK_SIZE,
+    ) -> int:
+        """
+        Uploads a current list and arms a hardware list sweep.
+        The 6221 steps through the list on its own clock, so the sweep is not limited by
+        the bus latency. Start it with sweep_start().
+
+        Example:
+            >>> k2182.buffer_arm(len(currents), trigger_source="EXT")
+            >>> k6221.sweep_list(currents, delay=1e-3)
+            >>> k6221.sweep_start()
+            >>> k2182.buffer_wait(len(currents))
+            >>> voltages = k2182.buffer_fetch()
+
+        Args:
+            currents: Current of each sweep point in A.
+            delay: Source delay of each point in s.
+            compliance: Compliance voltage in V. If None, the present dc_compliance is used.
+            count: Number of sweep repetitions.
+            trigger_link: Trigger a 2182A over Trigger Link at each point (see configure_trigger_link).
+            chunk_size: Number of points sent per message.
+
+        Returns:
+            The number of sweep points.
+        """
+        currents = np.asarray(currents, dtype=float)
+        if currents.ndim != 1 or len(currents) == 0:
+            raise ValueError("currents must be a non-empty one dimensional array")
+        # 一点ずつではなく、最大値と最小値だけ検証する
+        self.dc_amplitude.validate(float(currents.min()))
+        self.dc_amplitude.validate(float(currents.max()))
+        if compliance is None:
+            compliance = self.dc_compliance.get_latest()
+        self.dc_compliance.validate(compliance)
+
+        npoints = len(currents)
+        self.write("SOUR:SWE:ABOR;:SOUR:SWE:SPAC LIST;:SOUR:SWE:RANG BEST;:SOUR:SWE:CAB OFF")
+        self._write_list("SOUR:LIST:CURR", currents, chunk_size)
+        self._write_list("SOUR:LIST:DEL", np.full(npoints, delay), chunk_size)
+        self._write_list("SOUR:LIST:COMP", np.full(npoints, float(compliance)), chunk_size)
+        if trigger_link:
+            self.configure_trigger_link()
+        else:
+            self.write("TRIG:SOUR IMM")
+        self.write(f"SOUR:SWE:COUN {count};:SOUR:SWE:ARM")
+        return npoints
+
+    def sweep_linear(self, start: float, stop: float, npoints: int, **kwargs: Any) -> int:
+        """
+        Uploads and arms a linear list sweep. Keyword arguments are passed to sweep_list().
+
+        Args:
+            start: First current in A.
+            stop: Last current in A.
+            npoints: Number of points.
+        """
+        return self.sweep_list(np.linspace(start, stop, npoints), **kwargs)
+
+    def sweep_log(self, start: float, stop: float, npoints: int, **kwargs: Any) -> int:
+        """
+        Uploads and arms a logarithmic list sweep. Keyword arguments are passed to sweep_list().
+
+        Args:
+            start: First current in A (same sign as stop, non-zero).
+            stop: Last current in A.
+            npoints: Number of points.
+        """
+        return self.sweep_list(np.geomspace(start, stop, npoints), **kwargs)
+
+    def sweep_start(self):
+        """ Start the armed sweep. """
+        self.write("INIT:IMM")
+
+    def sweep_abort(self):
+        """ Abort the sweep and disarm it. """
+        self.write("SOUR:SWE:ABOR")
+
+    def buffer_count(self) -> int:
+        """Returns the number of readings stored in the buffer."""
+        return int(float(self.ask("TRAC:POIN:ACT?")))
+
+    def buffer_fetch(self, binary: bool = True) -> np.ndarray:
+        """
+        Downloads the readings stored in the buffer in one transfer.
+
+        Args:
+            binary: Use IEEE754 single precision transfer (FORM:DATA REAL,32).
+
+        Returns:
+            The stored readings.
+        """
+        if not binary:
+            return self.ask_ascii_values("FORM:ELEM READ;:TRAC:DATA?")
+        with self.visa_lock:
+            try:
+                data = self.ask_binary_values(
+                    "FORM:ELEM READ;:FORM:BORD NORM;:FORM:DATA REAL,32;:TRAC:DATA?",
+                    datatype="f",
+                    is_big_endian=True,
+                )
+            finally:
+                self.write("FORM:DATA ASC")
+        return data.astype(float)
+
+    def load_arbitrary(
+        self,
+        slot: int,
+        waveform: Sequence[float],
+        select: bool = True,
+        force: bool = False,
+    ) -> bool:
+        """
+        Normalizes a waveform to the range -1 to 1 and uploads it to ARB<slot>.
+        If the same waveform is already loaded in the slot, the upload is skipped.
+        The peak current is set with wave_amplitude.
+
+        Args:
+            slot: Arbitrary waveform memory (1 to 4).
+            waveform: Waveform points (2 to 65536 points).
+            select: Select the slot with wave_func after loading.
+            force: Upload even if the same waveform is cached as loaded.
+
+        Returns:
+            True if the waveform was uploaded, False if the upload was skipped.
+        """
+        if slot not in (1, 2, 3, 4):
+            raise ValueError("slot must be 1, 2, 3 or 4")
+        points = np.asarray(waveform, dtype=float)
+        if points.ndim != 1 or not 2 <= len(points) <= ARB_MAX_POINTS:
+            raise ValueError(f"waveform must be a one dimensional array of 2 to {ARB_MAX_POINTS} points")
+        peak = np.max(np.abs(points))
+        if peak == 0:
+            raise ValueError("waveform must not be all zero")
+        points = points / peak
+
+        digest = hashlib.sha1(points.astype("<f8").tobytes()).hexdigest()
+        uploaded = force or self._arb_hashes.get(slot) != digest
+        if uploaded:
+            self._write_list(
+                "SOUR:WAVE:ARB:DATA", points,
+                append_command="SOUR:WAVE:ARB:APP", fmt="{:.6f}",
+            )
+            self.write(f"SOUR:WAVE:ARB:COPY {slot}")
+            self._arb_hashes[slot] = digest
+        if select:
+            self.wave_func.set(f"arbitrary{slot}")
+        return uploaded
+
+    def invalidate_arbitrary_cache(self, slot: int | None = None) -> None:
+        """
+        Forgets which waveform is loaded in ARB<slot> (all slots if None),
+        e.g. after the waveforms were changed from the front panel.
+        """
+        if slot is None:
+            self._arb_hashes.clear()
+        else:
+            self._arb_hashes.pop(slot, None)
+
+
+class Keithley6221DeltaBase(InstrumentModule, abc.ABC):
+    """
+    Base class of the delta measurement modes of the Keithley6221 + 2182A pair.
+
+    The 2182A is connected to the 6221 with the RS-232 cable and Trigger Link.
+    The 6221 controls the 2182A, computes the delta readings in firmware and
+    stores them in its buffer, which is downloaded in one binary transfer.
+    """
+
+    mode_prefix = ""
+
+    def __init__(
+        self,
+        parent: Keithley6221,
+        name: str,
+        **kwargs: "Unpack[InstrumentBaseKWArgs]",
+    ) -> None:
+        super().__init__(parent, name, **kwargs)
+
+    def _source_parameter(self, name: str, cmd: str, **kwargs: Any) -> Parameter:
+        return self.add_parameter(
+            name,
+            get_cmd=f"SOUR:{self.mode_prefix}:{cmd}?",
+            set_cmd=f"SOUR:{self.mode_prefix}:{cmd} {{}}",
+            get_parser=float,
+            **kwargs,
+        )
+
+    @abc.abstractmethod
+    def npoints(self) -> int:
+        """Returns the number of readings of one run."""
+
+    def nvpresent(self) -> bool:
+        """Returns True if the 6221 detects the 2182A over RS-232."""
+        return bool(int(float(self.ask("SOUR:DELT:NVPR?"))))
+
+    def arm(self) -> None:
+        """ Size the buffer for one run and arm the mode. """
+        if not self.nvpresent():
+            raise RuntimeError("2182A is not connected to the 6221 (check the RS-232 and Trigger Link cables)")
+        self.write(f"TRAC:CLE;:TRAC:POIN {self.npoints()};:SOUR:{self.mode_prefix}:ARM")
+
+    def is_armed(self) -> bool:
+        return bool(int(float(self.ask(f"SOUR:{self.mode_prefix}:ARM?"))))
+
+    def start(self) -> None:
+        """ Start the armed mode. """
+        self.write("INIT:IMM")
+
+    def abort(self) -> None:
+        """ Abort the mode and disarm it. """
+        self.write("SOUR:SWE:ABOR")
+
+    def run(self, timeout: float = 600.0, poll_interval: float = 0.1, binary: bool = True) -> np.ndarray:
+        """
+        Arms and runs the mode, waits for all readings and downloads them.
+
+        Args:
+            timeout: Maximum waiting time in s.
+            poll_interval: Interval between buffer count queries in s.
+            binary: Use binary transfer for the download.
+
+        Returns:
+            The readings averaged by the 6221 (V).
+        """
+        npoints = self.npoints()
+        self.arm()
+        self.start()
+        deadline = time.perf_counter() + timeout
+        try:
+            while self.parent.buffer_count() < npoints:
+                if time.perf_counter() > deadline:
+                    raise TimeoutError(f"{self.full_name} did not finish {npoints} readings within {timeout:.1f} s")
+                time.sleep(poll_interval)
+        except BaseException:
+            self.abort()
+            raise
+        self.abort()
+        return self.parent.buffer_fetch(binary)
+
+
+class Keithley6221Delta(Keithley6221DeltaBase):
+    """
+    Delta mode: alternates the current between high and low and cancels thermal EMFs.
+
+    Attributes:
+        high (Parameter): High source value in A.
+        low (Parameter): Low source value in A.
+        delay (Parameter): Delay between the current step and the measurement in s.
+        count (Parameter): Number of delta readings.
+        compliance_abort (Parameter): Abort on compliance (ON/OFF).
+    """
+
+    mode_prefix = "DELT"
+
+    def __init__(
+        self,
+        parent: Keithley6221,
+        name: str,
+        **kwargs: "Unpack[InstrumentBaseKWArgs]",
+    ) -> None:
+        super().__init__(parent, name, **kwargs)
+
+        self.high: Parameter = self._source_parameter(
+            "high", "HIGH", vals=Numbers(min_value=0, max_value=105e-3), unit="A"
+        )
+        self.low: Parameter = self._source_parameter(
+            "low", "LOW", vals=Numbers(min_value=-105e-3, max_value=0), unit="A"
+        )
+        self.delay: Parameter = self._source_parameter(
+            "delay", "DEL", vals=Numbers(min_value=1e-3, max_value=9999.999), unit="s"
+        )
+        self.count: Parameter = self.add_parameter(
+            "count",
+            get_cmd="SOUR:DELT:COUN?",
+            set_cmd="SOUR:DELT:COUN {}",
+            get_parser=lambda v: int(float(v)),
+            vals=Ints(min_value=1, max_value=65536),
+        )
+        self.compliance_abort: Parameter = self.add_parameter(
+            "compliance_abort",
+            get_cmd="SOUR:DELT:CAB?",
+            set_cmd="SOUR:DELT:CAB {}",
+            vals=Enum("ON", "OFF", "0", "1"),
+        )
+
+    def npoints(self) -> int:
+        return self.count.get_latest()
+
+
+class Keithley6221PulseDelta(Keithley6221DeltaBase):
+    """
+    Pulse delta mode: measures with short current pulses to minimize sample heating.
+
+    Attributes:
+        high (Parameter): Pulse high value in A.
+        low (Parameter): Pulse low value in A.
+        width (Parameter): Pulse width in s.
+        source_delay (Parameter): Delay between the pulse edge and the measurement in s.
+        interval (Parameter): Pulse interval in power line cycles.
+        count (Parameter): Number of pulse delta readings.
+        low_measurements (Parameter): Number of low measurements per cycle (1 or 2).
+    """
+
+    mode_prefix = "PDEL"
+
+    def __init__(
+        self,
+        parent: Keithley6221,
+        name: str,
+        **kwargs: "Unpack[InstrumentBaseKWArgs]",
+    ) -> None:
+        super().__init__(parent, name, **kwargs)
+
+        self.high: Parameter = self._source_parameter(
+            "high", "HIGH", vals=Numbers(min_value=-105e-3, max_value=105e-3), unit="A"
+        )
+        self.low: Parameter = self._source_parameter(
+            "low", "LOW", vals=Numbers(min_value=-105e-3, max_value=105e-3), unit="A"
+        )
+        self.width: Parameter = self._source_parameter(
+            "width", "WIDT", vals=Numbers(min_value=50e-6, max_value=12e-3), unit="s"
+        )
+        self.source_delay: Parameter = self._source_parameter(
+            "source_delay", "SDEL", vals=Numbers(min_value=16e-6, max_value=11.966e-3), unit="s"
+        )
+        self.interval: Parameter = self.add_parameter(
+            "interval",
+            get_cmd="SOUR:PDEL:INT?",
+            set_cmd="SOUR:PDEL:INT {}",
+            get_parser=lambda v: int(float(v)),
+            vals=Ints(min_value=5, max_value=999999),
+            unit="PLC",
+        )
+        self.count: Parameter = self.add_parameter(
+            "count",
+            get_cmd="SOUR:PDEL:COUN?",
+            set_cmd="SOUR:PDEL:COUN {}",
+            get_parser=lambda v: int(float(v)),
+            vals=Ints(min_value=1, max_value=65536),
+        )
+        self.low_measurements: Parameter = self.add_parameter(
+            "low_measurements",
+            get_cmd="SOUR:PDEL:LME?",
+            set_cmd="SOUR:PDEL:LME {}",
+            get_parser=lambda v: int(float(v)),
+            vals=Enum(1, 2),
+        )
+
+    def npoints(self) -> int:
+        return self.count.get_latest()
+
+
+class Keithley6221DiffConductance(Keithley6221DeltaBase):
+    """
+    Differential conductance mode: sweeps a staircase with a superimposed delta current.
+
+    Attributes:
+        start_current (Parameter): Start current in A.
+        stop_current (Parameter): Stop current in A.
+        step_current (Parameter): Step current in A.
+        delta_current (Parameter): Delta current in A.
+        delay (Parameter): Delay between the current step and the measurement in s.
+        compliance_abort (Parameter): Abort on compliance (ON/OFF).
+    """
+
+    mode_prefix = "DCON"
+
+    def __init__(
+        self,
+        parent: Keithley6221,
+        name: str,
+        **kwargs: "Unpack[InstrumentBaseKWArgs]",
+    ) -> None:
+        super().__init__(parent, name, **kwargs)
+
+        self.start_current: Parameter = self._source_parameter(
+            "start_current", "STAR", vals=Numbers(min_value=-105e-3, max_value=105e-3), unit="A"
+        )
+        self.stop_current: Parameter = self._source_parameter(
+            "stop_current", "STOP", vals=Numbers(min_value=-105e-3, max_value=105e-3), unit="A"
+        )
+        self.step_current: Parameter = self._source_parameter(
+            "step_current", "STEP", vals=Numbers(min_value=0, max_value=105e-3), unit="A"
+        )
+        self.delta_current: Parameter = self._source_parameter(
+            "delta_current", "DELT", vals=Numbers(min_value=0, max_value=105e-3), unit="A"
+        )
+        self.delay: Parameter = self._source_parameter(
+            "delay", "DEL", vals=Numbers(min_value=1e-3, max_value=9999.999), unit="s"
+        )
+        self.compliance_abort: Parameter = self.add_parameter(
+            "compliance_abort",
+            get_cmd="SOUR:DCON:CAB?",
+            set_cmd="SOUR:DCON:CAB {}",
+            vals=Enum("ON", "OFF", "0", "1"),
+        )
+
+    def npoints(self) -> int:
+        start = self.start_current.get_latest()
+        stop = self.stop_current.get_latest()
+        step = self.step_current.get_latest()
+        if step == 0:
+            return 1
+        return int(round(abs(stop - start) / step)) + 1
@@ -16,6 +16,9 @@ Attributes:
     v_sensitivity (Parameter): Voltage sensitivity in V.
     offset_status_x (Parameter): Status of X-axis offset (ON/OFF).
     offset_status_y (Parameter): Status of Y-axis offset (ON/OFF).
+    data1 - data4 (Parameter): Output data 1 to 4.
+    xy_rtheta (LI5650DataGroup): data1 to data4 read with one FETC? query.
+    memory_data1 - memory_data4 (LI5650MemoryBuffer): data1 to data4 recorded in the data memory.
 
 Methods:
     auto_all(): Automatically adjusts all settings.
@@ -23,29 +26,100 @@ Methods:
     auto_offset(): Automatically adjusts the offset.
     auto_time_constant(): Automatically adjusts the time constant.
     auto_sensitivity(): Automatically adjusts the sensitivity.
-    reset(): Resets the instrument.
+        The auto functions wait for completion (*OPC) before returning.
+    settle_time(accuracy): Settling time of the output filter for the given accuracy.
+    wait_settled(accuracy): Waits for the settling time of the output filter.
+    memory_configure(data_numbers, interval, npoints): Configures the data memory recording.
+    memory_start(): Starts recording into the data memory.
+    memory_stop(): Stops recording.
+    memory_count(): Returns the number of recorded samples.
+    memory_fetch(): Downloads the recorded block as a structured array in one binary transfer.
+    record(npoints, interval, data_numbers): Configures, records and downloads a block.
+    reset(): Resets the instrument and invalidates the suppressed writes.
+    enable_write_suppression(*names): Skips sensitivity/time constant writes that would not change them.
     disable_front_panel(): Disables the front panel.
     enable_front_panel(): Enables the front panel.
 """
-from functools import partial
+from functools import lru_cache, partial
+import math
+import time
 import numpy as np
 from typing import Any
 
-from qcodes import VisaInstrument
-from qcodes.parameters import ArrayParameter, ParamRawDataType
+from qcodes.parameters import ArrayParameter, MultiParameter, ParamRawDataType
 from qcodes.utils.validators import Numbers, Ints, Enum, Strings
 
 from typing import Tuple
 
-class LI5650(VisaInstrument):
+from .visa_base import PralabVisaInstrument
+
+
+@lru_cache
+def settle_factor(order: int, accuracy: float) -> float:
+    """
+    Settling time of a cascade of identical RC filters in units of the time constant.
+
+    The step response of ``order`` filters is 1 - exp(-x) * sum_{k<order} x^k / k!,
+    which is solved for the given accuracy by bisection.
+
+    Args:
+        order: Number of RC stages (filter slope / 6 dB/oct).
+        accuracy: Fraction of the final value to settle to (e.g. 0.999).
+
+    Returns:
+        The settling time divided by the time constant.
+    """
+    if not 0 < accuracy < 1:
+        raise ValueError("accuracy must be between 0 and 1")
+
+    def response(x: float) -> float:
+        return 1 - math.exp(-x) * sum(x**k / math.factorial(k) for k in range(order))
+
+    low, high = 0.0, 1.0
+    while response(high) < accuracy:
+        high *= 2
+    for _ in range(60):
+        mid = (low + high) / 2
+        if response(mid) < accuracy:
+            low = mid
+        else:
+            high = mid
+    return high
+
+class LI5650(PralabVisaInstrument):
     """
     This is the qcodes driver for the Stanford Research Systems NF
     Lock-in Amplifier
     """
 
+    _suppressible_parameters = (
+        "time_constant",
+        "filter_slope",
+        "ac_sensitivity",
+        "v_sensitivity",
+        "input_gain",
+        "reference",
+    )
+
+    _fast_set_formats = {
+        "frequency": "FREQ {:.4f}",
+        "phase": "PHAS {:.2f}",
+        "amplitude": ":SOUR:VOLT {:.3f}",
+        "source_frequency": ":SOUR:FREQ {:.4f}",
+    }
+
     def __init__(self, name: str, address: str, **kwargs: Any):
         super().__init__(name, address, **kwargs)
 
+        # 最後に書き込んだ :DATA のビットマスク (同じ値は再送しない)
+        self._data_mask: int | None = None
+
+        # データメモリ記録の設定と、最後にダウンロードしたブロック
+        self._memory_data_numbers: Tuple[int, ...] = (1, 2)
+        self._memory_interval = 1e-3
+        self._memory_npoints = 1000
+        self._memory_block: np.ndarray | None = None
+
         # Reference and phase
         self.add_parameter('phase',
                            label='Phase',
@@ -152,6 +226,16 @@ class LI5650(VisaInstrument):
                                get_parser=float,
                                unit='')
 
+        self.add_parameter('xy_rtheta',
+                           parameter_class=LI5650DataGroup,
+                           data_numbers=(1, 2, 3, 4))
+
+        for i in [1, 2, 3, 4]:
+            self.add_parameter(f'memory_data{i}',
+                               label=f'memory data {i}',
+                               parameter_class=LI5650MemoryBuffer,
+                               data_number=i)
+
                            
         self.add_parameter(name='offset_status_x',
                            get_cmd=':CALCulate1:OFFSet:STATe?',
@@ -165,26 +249,269 @@ class LI5650(VisaInstrument):
                            val_mapping={'OFF': 0,
                                         'ON': 1})
         # Auto functions
-        self.add_function('auto_all', call_cmd=':SENS:AUTO:ONCE')
-        self.add_function('auto_phase', call_cmd=':PHASe:AUTO:ONCE')
-        self.add_function('auto_offset', call_cmd=':CALC1:OFFS:AUTO:ONCE')
+        # 完了を *OPC で確認し、変更された設定のキャッシュを無効化する
+        self.add_function('auto_all', call_cmd=partial(
+            self._auto_once, ':SENS:AUTO:ONCE',
+            ('phase', 'time_constant', 'ac_sensitivity', 'v_sensitivity', 'x_offset')))
+        self.add_function('auto_phase', call_cmd=partial(
+            self._auto_once, ':PHASe:AUTO:ONCE', ('phase',)))
+        self.add_function('auto_offset', call_cmd=partial(
+            self._auto_once, ':CALC1:OFFS:AUTO:ONCE', ('x_offset',)))
         #self.add_function('auto_offset_x', call_cmd=':CALC1:OFFS:AUTO:ONCE')
-        self.add_function('auto_time_constant', call_cmd=':SENS:FILT:AUTO:ONCE')
-        self.add_function('auto_sensitivity', call_cmd=':SENSE:CURR:AC:RANG:AUTO:ONCE')
+        self.add_function('auto_time_constant', call_cmd=partial(
+            self._auto_once, ':SENS:FILT:AUTO:ONCE', ('time_constant',)))
+        self.add_function('auto_sensitivity', call_cmd=partial(
+            self._auto_once, ':SENSE:CURR:AC:RANG:AUTO:ONCE', ('ac_sensitivity', 'v_sensitivity')))
         # Interface
-        self.add_function('reset', call_cmd='*RST')
+        self.add_function('reset', call_cmd=self._reset)
 
         self.add_function('disable_front_panel', call_cmd='OVRM 0')
         self.add_function('enable_front_panel', call_cmd='OVRM 1')
 
 
+    def _auto_once(self, cmd: str, changed: Tuple[str, ...] = (),
+                   timeout: float = 60.0, poll_interval: float = 0.05) -> None:
+        """Runs an auto function and polls the operation complete bit until it has finished."""
+        self.write(f'*CLS;{cmd};*OPC')
+        deadline = time.perf_counter() + timeout
+        while not int(self.ask('*ESR?')) & 1:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"{cmd} did not complete within {timeout:.1f} s")
+            time.sleep(poll_interval)
+        for name in changed:
+            self.parameters[name].cache.invalidate()
+
+    def settle_time(self, accuracy: float = 0.999) -> float:
+        """
+        Settling time of the output filter, computed from the cached
+        time_constant and filter_slope.
+
+        Args:
+            accuracy: Fraction of the final value to settle to (e.g. 0.99, 0.999).
+
+        Returns:
+            The settling time in s.
+        """
+        time_constant = self.time_constant.get_latest()
+        order = int(self.filter_slope.get_latest()) // 6
+        return time_constant * settle_factor(order, accuracy)
+
+    def wait_settled(self, accuracy: float = 0.999) -> float:
+        """
+        Sleeps for the settling time of the output filter.
+
+        Args:
+            accuracy: Fraction of the final value to settle to.
+
+        Returns:
+            The time waited in s.
+        """
+        wait = self.settle_time(accuracy)
+        time.sleep(wait)
+        return wait
+
+    def memory_configure(self, data_numbers: Tuple[int, ...] = (1, 2),
+                         interval: float = 1e-3, npoints: int = 1000) -> None:
+        """
+        Configures the recording of output data into the internal data memory.
+
+        Args:
+            data_numbers: Output data to record (1 to 4).
+            interval: Sampling interval in s.
+            npoints: Number of samples.
+        """
+        data_numbers = tuple(sorted(data_numbers))
+        if not data_numbers or not set(data_numbers) <= {1, 2, 3, 4}:
+            raise ValueError("data_numbers must be taken from 1, 2, 3 and 4")
+        if npoints < 1:
+            raise ValueError("npoints must be positive")
+        mask = sum(1 << n for n in data_numbers)
+        self.write(f':TRAC:CLE;:TRAC:FEED {mask};:TRAC:POIN {npoints};:TRAC:TIM {interval:.6e}')
+        self._memory_data_numbers = data_numbers
+        self._memory_interval = interval
+        self._memory_npoints = npoints
+        self._memory_block = None
+        for i in [1, 2, 3, 4]:
+            self.parameters[f'memory_data{i}'].update_shape(npoints, interval)
+
+    def memory_start(self) -> None:
+        """Starts recording into the data memory."""
+        self._memory_block = None
+        self.write(':TRAC:FEED:CONT NEXT')
+
+    def memory_stop(self) -> None:
+        """Stops recording."""
+        self.write(':TRAC:FEED:CONT NEV')
+
+    def memory_count(self) -> int:
+        """Returns the number of samples recorded in the data memory."""
+        return int(float(self.ask(':TRAC:POIN:ACT?')))
+
+    def memory_wait(self, timeout: float | None = None, poll_interval: float = 0.05) -> None:
+        """
+        Waits until the configured number of samples has been recorded.
+
+        Args:
+            timeout: Maximum waiting time in s. If None, twice the recording time plus 5 s.
+            poll_interval: Interval between sample count queries in s.
+        """
+        if timeout is None:
+            timeout = 5 + 2 * self._memory_npoints * self._memory_interval
+        deadline = time.perf_counter() + timeout
+        while self.memory_count() < self._memory_npoints:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"Data memory did not record {self._memory_npoints} samples within {timeout:.1f} s")
+            time.sleep(poll_interval)
+
+    def memory_fetch(self) -> np.ndarray:
+        """
+        Downloads the recorded block in one binary transfer (FORM:DATA REAL,32).
+
+        Returns:
+            A structured array with the fields "time" and "data<n>" of each recorded output.
+        """
+        nquantities = len(self._memory_data_numbers)
+        with self.visa_lock:
+            try:
+                raw = self.ask_binary_values(
+                    ':FORM:DATA REAL,32;:TRAC:DATA?',
+                    datatype='f',
+                    is_big_endian=True,
+                )
+            finally:
+                self.write(':FORM:DATA ASC')
+        raw = raw[:len(raw) // nquantities * nquantities].reshape(-1, nquantities)
+        dtype = [('time', 'f8')] + [(f'data{n}', 'f8') for n in self._memory_data_numbers]
+        block = np.empty(len(raw), dtype=dtype)
+        block['time'] = np.arange(len(raw)) * self._memory_interval
+        for column, n in enumerate(self._memory_data_numbers):
+            block[f'data{n}'] = raw[:, column]
+        self._memory_block = block
+        return block
+
+    def record(self, npoints: int, interval: float, data_numbers: Tuple[int, ...] = (1, 2),
+               timeout: float | None = None) -> np.ndarray:
+        """
+        Records a block into the data memory at a fixed sampling rate and downloads it.
+
+        Args:
+            npoints: Number of samples.
+            interval: Sampling interval in s.
+            data_numbers: Output data to record (1 to 4).
+            timeout: Maximum waiting time in s.
+
+        Returns:
+            A structured array with the fields "time" and "data<n>".
+        """
+        self.memory_configure(data_numbers, interval, npoints)
+        self.memory_start()
+        try:
+            self.memory_wait(timeout)
+        finally:
+            self.memory_stop()
+        return self.memory_fetch()
+
+    def _reset(self):
+        self.write('*RST')
+
+    def _device_reset(self) -> None:
+        super()._device_reset()
+        # *RST で :DATA も既定値に戻る
+        self._data_mask = None
+
+    def _select_data(self, mask: int) -> None:
+        # :DATA を書き換えるたびに1回の通信が増えるので、変化した時だけ送る
+        if self._data_mask != mask:
+            self.write(f':DATA {mask}')
+            self._data_mask = mask
+
     def _get_data(self, data_number):
-        if data_number==1:
-            self.write(':DATA 2')
-        elif data_number==2:
-            self.write(':DATA 4')
-        elif data_number==3:
-            self.write(':DATA 8')
-        elif data_number==4:
-            self.write(':DATA 16')
-        return self.ask('FETC?')
+        with self.visa_lock:
+            self._select_data(1 << data_number)
+            return self.ask('FETC?')
+
+    def _fetch_data(self, data_numbers: Tuple[int, ...]) -> Tuple[float, ...]:
+        """
+        Reads several output data with one FETC? query.
+
+        Args:
+            data_numbers: Output data numbers (1 to 4) in ascending order.
+
+        Returns:
+            The values in the order of data_numbers.
+        """
+        mask = sum(1 << n for n in data_numbers)
+        with self.visa_lock:
+            self._select_data(mask)
+            response = self.ask('FETC?')
+        values = tuple(float(v) for v in response.split(','))
+        if len(values) != len(data_numbers):
+            raise RuntimeError(f"Expected {len(data_numbers)} values from FETC?, got {response!r}")
+        return values
+
+
+class LI5650DataGroup(MultiParameter):
+    """
+    MultiParameter reading several output data (data1 to data4) with one FETC? query.
+    The :DATA bitmask is only rewritten when it changes.
+    With the default data assignment, data1 to data4 are X, Y, R and theta.
+    """
+    def __init__(
+        self,
+        name: str,
+        instrument: LI5650,
+        data_numbers: Tuple[int, ...] = (1, 2, 3, 4),
+        **kwargs: Any,
+    ) -> None:
+        data_numbers = tuple(sorted(data_numbers))
+        if not data_numbers or not set(data_numbers) <= {1, 2, 3, 4}:
+            raise ValueError("data_numbers must be taken from 1, 2, 3 and 4")
+        names = tuple(f'data{i}' for i in data_numbers)
+        super().__init__(name,
+                         names=names,
+                         shapes=((),) * len(names),
+                         instrument=instrument,
+                         labels=tuple(f'data {i}' for i in data_numbers),
+                         units=('',) * len(names),
+                         **kwargs)
+        self.data_numbers = data_numbers
+
+    def get_raw(self) -> Tuple[float, ...]:
+        return self.instrument._fetch_data(self.data_numbers)
+
+
+class LI5650MemoryBuffer(ArrayParameter):
+    """
+    ArrayParameter for one output data recorded in the LI5650 data memory.
+    All recorded outputs are downloaded together with the first get after a
+    recording, and the other memory_data parameters reuse that block.
+    """
+    def __init__(
+        self,
+        name: str,
+        instrument: LI5650,
+        data_number: int,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(name,
+                         shape=(1,),
+                         instrument=instrument,
+                         setpoints=((0.0,),),
+                         setpoint_names=('time',),
+                         setpoint_labels=('time',),
+                         setpoint_units=('s',),
+                         **kwargs)
+        self.data_number = data_number
+
+    def update_shape(self, npoints: int, interval: float) -> None:
+        self.shape = (npoints,)
+        self.setpoints = (tuple(np.arange(npoints) * interval),)
+
+    def get_raw(self) -> np.ndarray:
+        instrument = self.instrument
+        if self.data_number not in instrument._memory_data_numbers:
+            raise RuntimeError(f"data{self.data_number} is not recorded (see memory_configure)")
+        block = instrument._memory_block
+        if block is None:
+            block = instrument.memory_fetch()
+        return block[f'data{self.data_number}']
@@ -1,13 +1,96 @@
-import clr
+import asyncio
+import threading
+from collections import deque
+import time
+from typing import Any, Protocol
+
+import numpy as np
 from qcodes.parameters import Parameter
 from qcodes.instrument.base import Instrument
-clr.AddReference("System")
-from System import Double, UInt16, Int32
-
 
-# add .net reference and import so python can see .net
 
 DEFAULT_PORT = 11000
+# Quantities read together with their status by one .NET call
+STATE_QUANTITIES = ("temperature", "field", "position")
+# Number of (time, value) samples kept per quantity for interpolation
+HISTORY_LENGTH = 100_000
+
+# Status codes (QDInstrumentBase.TemperatureStatus / FieldStatus / PositionStatus)
+# regarded as stable
+STABLE_STATUS = {
+    "temperature": (1,),    # Stable
+    "field": (1, 4),        # StablePersistent, StableDriven
+    "position": (1,),       # TransitionComplete
+}
+# Default distance from the target regarded as reached (K, Oe, deg)
+DEFAULT_TOLERANCE = {"temperature": 0.05, "field": 5.0, "position": 0.1}
+
+
+class QDBackend(Protocol):
+    """
+    Interface of the device behind QDdotNET. QDNetBackend talks to MultiVu through
+    QDInstrument.dll; pralab_phys.qcodes_drivers.sim.QDSimBackend is a Python stand-in.
+    The getters return (error, value, status).
+    """
+    def get_temperature(self) -> tuple[int, float, int]: ...
+    def set_temperature(self, temperature: float, rate: float) -> int: ...
+    def get_field(self) -> tuple[int, float, int]: ...
+    def set_field(self, field: float, rate: float) -> int: ...
+    def get_position(self) -> tuple[int, float, int]: ...
+    def set_position(self, position: float, rate: float) -> int: ...
+
+
+class QDNetBackend:
+    """
+    Backend talking to MultiVu through QDInstrument.dll (pythonnet).
+    The .NET runtime is only loaded when this backend is created.
+    """
+    def __init__(
+        self,
+        ip_address: str,
+        instrument_type: str = "DynaCool",
+        remote: bool = False,
+        QDInstrumentdir: str = "",
+        QDInstrumentname: str = "QDInstrument",
+        port: int = DEFAULT_PORT,
+    ) -> None:
+        # add .net reference and import so python can see .net
+        import clr
+        clr.AddReference("System")
+        from System import Double, UInt16, Int32
+        clr.AddReference(QDInstrumentdir+QDInstrumentname)
+
+        from QuantumDesign.QDInstrument import QDInstrumentBase, QDInstrumentFactory
+
+        INST_MAP = {"PPMS": QDInstrumentBase.QDInstrumentType.PPMS, "DynaCool":  QDInstrumentBase.QDInstrumentType.DynaCool}
+
+        self._Double = Double
+        self._Int32 = Int32
+        self.QDIBase = QDInstrumentBase
+        self.QDIFactory = QDInstrumentFactory
+        try:
+            self.device = QDInstrumentFactory.GetQDInstrument(INST_MAP[instrument_type], remote, ip_address, UInt16(port))
+        except Exception:
+            raise RuntimeError("Unsupported instrument_type")
+
+    def get_temperature(self):
+        return self.device.GetTemperature(self._Double(0), self.QDIBase.TemperatureStatus(self._Int32(0)))
+
+    def set_temperature(self, temperature, rate):
+        return self.device.SetTemperature(temperature, rate, self.QDIBase.TemperatureApproach(self._Int32(0)))
+
+    def get_field(self):
+        return self.device.GetField(self._Double(0), self.QDIBase.FieldStatus(self._Int32(0)))
+
+    def set_field(self, field, rate):
+        return self.device.SetField(field, rate, self.QDIBase.FieldApproach(self._Int32(0)), self.QDIBase.FieldMode(0))
+
+    def get_position(self):
+        return self.device.GetPosition("Horizontal Rotator", self._Double(0), self.QDIBase.PositionStatus(self._Int32(0)))
+
+    def set_position(self, position, rate):
+        return self.device.SetPosition("Horizontal Rotator", self._Double(position), rate, self.QDIBase.PositionMode(self._Int32(0)))
+
 
 class QDdotNET(Instrument):
     """
@@ -29,6 +112,9 @@ class QDdotNET(Instrument):
         Name of the Quantum Design instrument DLL (default is "QDInstrument").
     port : int, optional
         The port number for communication (default is 11000).
+    backend : QDBackend, optional
+        Device backend. If None, QDNetBackend is created from the arguments above.
+        Pass a stand-in such as sim.QDSimBackend to run without QDInstrument.dll.
     **kwargs : dict
         Additional keyword arguments passed to the base class.
 
@@ -52,6 +138,10 @@ class QDdotNET(Instrument):
         Parameter for setting and getting the temperature rate.
     positionrate : Parameter
         Parameter for setting and getting the position rate.
+    state_max_age : Parameter
+        Maximum age in s of a recorded value+status that parameters may return
+        instead of querying the instrument. If None (default), it is 0 (always
+        query) without the poller and twice the polling interval with it.
 
     Methods
     -------
@@ -69,6 +159,22 @@ class QDdotNET(Instrument):
         Retrieves the current temperature value.
     get_idn()
         Returns the instrument identification information.
+    read_state(quantity)
+        Returns the latest (value, status) of "temperature", "field" or "position".
+    start_poller(interval, quantities)
+        Starts a background thread recording value and status at a fixed rate.
+    stop_poller()
+        Stops the background poller.
+    state_history(quantity)
+        Returns the times and values recorded for a quantity.
+    approach_temperature(temperature, rate)
+        Coroutine: sets the temperature and waits until it is stable.
+    approach_field(field, rate)
+        Coroutine: sets the field and waits until it is stable.
+    approach_position(position, rate)
+        Coroutine: sets the position and waits until it is reached.
+    wait_stable(quantity, target)
+        Coroutine: waits until a quantity is stable, polling with adaptive intervals.
     """
 
     def __init__(
@@ -80,23 +186,30 @@ class QDdotNET(Instrument):
         QDInstrumentdir: str = "",
         QDInstrumentname: str = "QDInstrument",
         port = DEFAULT_PORT,
+        backend: QDBackend | None = None,
         **kwargs,
     ) -> None:
         super().__init__(name=name, **kwargs)
 
-        clr.AddReference(QDInstrumentdir+QDInstrumentname)
-        
-        from QuantumDesign.QDInstrument import QDInstrumentBase, QDInstrumentFactory
-
-        INST_MAP = {"PPMS": QDInstrumentBase.QDInstrumentType.PPMS, "DynaCool":  QDInstrumentBase.QDInstrumentType.DynaCool}
+        if backend is None:
+            backend = QDNetBackend(ip_address, instruent_type, remote, QDInstrumentdir, QDInstrumentname, port)
+        self.backend = backend
+        self.device = getattr(backend, "device", backend)
+
+        # .NET 呼び出しを直列化するロックと、最新の値+ステータスの記録
+        self.device_lock = threading.RLock()
+        self._state_lock = threading.Lock()
+        self._state: dict[str, tuple[float, float, int]] = {}
+        self._history: dict[str, deque[tuple[float, float]]] = {
+            quantity: deque(maxlen=HISTORY_LENGTH) for quantity in STATE_QUANTITIES
+        }
+        self._poller: threading.Thread | None = None
+        self._poller_stop = threading.Event()
+        # state_max_age used when it is None (set by start_poller)
+        self._default_max_age = 0.0
+        # last setpoint written per quantity (wait_stable compares against it)
+        self._setpoints: dict[str, float] = {}
 
-        self.QDIBase = QDInstrumentBase
-        self.QDIFactory = QDInstrumentFactory
-        try:
-            self.device = QDInstrumentFactory.GetQDInstrument(INST_MAP[instruent_type], remote, ip_address, UInt16(port))
-        except Exception:
-            raise RuntimeError("Unsupported instrument_type")
-        
         self.Brate = 100
         self.Trate = 10
         self.prate = 10
@@ -152,7 +265,7 @@ class QDdotNET(Instrument):
         self.temperaturerate: Parameter = self.add_parameter(
             name = "temperaturerate",
             label = "temperaturerate",
-            unit = "K/s",
+            unit = "K/min",
             get_cmd = lambda: self.Trate,
             set_cmd = self._set_t_rate,
         )
@@ -165,33 +278,298 @@ class QDdotNET(Instrument):
             set_cmd = self._set_p_rate,
         )
 
+        self.state_max_age: Parameter = self.add_parameter(
+            name = "state_max_age",
+            label = "state_max_age",
+            unit = "s",
+            get_cmd = None,
+            set_cmd = None,
+            initial_value = None,
+        )
+
+
+    def _query_state(self, quantity: str) -> tuple[float, int]:
+        """Queries value and status of a quantity and records them."""
+        query = {
+            "temperature": self.get_temperature,
+            "field": self.get_field,
+            "position": self.get_position,
+        }[quantity]
+        # 時刻は .NET 呼び出しの中点を、device_lock の中で取る
+        # (ポーラーと直接の読み出しの記録順が時刻順になるように)
+        with self.device_lock:
+            started = time.time()
+            _, value, status = query()
+            now = (started + time.time()) / 2
+            value, status = float(value), int(status)
+            with self._state_lock:
+                history = self._history[quantity]
+                # the wall clock may step back; state_history() must stay in ascending order
+                if not history or now >= history[-1][0]:
+                    self._state[quantity] = (now, value, status)
+                    history.append((now, value))
+        return value, status
+
+    def state_history(self, quantity: str, since: float | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the samples recorded for a quantity by direct reads and the poller.
+
+        Args:
+            quantity: "temperature", "field" or "position".
+            since: Only return the samples recorded after this time.time() timestamp.
+                The cost then follows the number of new samples, not the history length.
+
+        Returns:
+            (times, values): time.time() timestamps and values in ascending time order.
+        """
+        with self._state_lock:
+            history = self._history[quantity]
+            if since is None:
+                samples = list(history)
+            else:
+                samples = []
+                for sample in reversed(history):
+                    if sample[0] <= since:
+                        break
+                    samples.append(sample)
+                samples.reverse()
+        if not samples:
+            return np.empty(0), np.empty(0)
+        times, values = zip(*samples)
+        return np.asarray(times), np.asarray(values)
+
+    def clear_state_history(self) -> None:
+        with self._state_lock:
+            for history in self._history.values():
+                history.clear()
+
+    def read_state(self, quantity: str, max_age: float | None = None) -> tuple[float, int]:
+        """
+        Returns the latest value and status of a quantity.
+        The recorded state is returned without blocking if it is younger than max_age,
+        otherwise the instrument is queried directly.
+
+        Args:
+            quantity: "temperature", "field" or "position".
+            max_age: Maximum age in s. If None, state_max_age is used.
+
+        Returns:
+            (value, status)
+        """
+        if max_age is None:
+            max_age = self.state_max_age.cache.get()
+        if max_age is None:
+            max_age = self._default_max_age
+        with self._state_lock:
+            record = self._state.get(quantity)
+        if record is not None and time.time() - record[0] <= max_age:
+            return record[1], record[2]
+        return self._query_state(quantity)
+
+    def _invalidate_state(self, quantity: str) -> None:
+        with self._state_lock:
+            self._state.pop(quantity, None)
+
+    def start_poller(self, interval: float = 0.5, quantities: tuple[str, ...] = STATE_QUANTITIES) -> None:
+        """
+        Starts a background thread that records value and status of the quantities
+        every interval seconds. Parameters then read the record without blocking,
+        if it is younger than state_max_age (twice interval, unless set explicitly).
+
+        Args:
+            interval: Polling interval in s.
+            quantities: Quantities to poll.
+        """
+        for quantity in quantities:
+            if quantity not in STATE_QUANTITIES:
+                raise ValueError(f"Unknown quantity {quantity!r}")
+        self.stop_poller()
+        self._poller_stop.clear()
+        self._poller = threading.Thread(
+            target=self._poll,
+            args=(interval, tuple(quantities)),
+            name=f"{self.name}-poller",
+            daemon=True,
+        )
+        self._poller.start()
+        self._default_max_age = 2 * interval
+
+    def stop_poller(self) -> None:
+        """Stops the background poller."""
+        if self._poller is not None:
+            self._poller_stop.set()
+            self._poller.join()
+            self._poller = None
+        self._default_max_age = 0.0
+
+    def _poll(self, interval: float, quantities: tuple[str, ...]) -> None:
+        while not self._poller_stop.is_set():
+            started = time.perf_counter()
+            for quantity in quantities:
+                try:
+                    self._query_state(quantity)
+                except Exception:
+                    self.log.exception(f"Polling {quantity} failed")
+            self._poller_stop.wait(max(interval - (time.perf_counter() - started), 0))
+
+    def close(self) -> None:
+        self.stop_poller()
+        super().close()
 
     def get_field(self):
-        return self.device.GetField(Double(0), self.QDIBase.FieldStatus(Int32(0)))
+        with self.device_lock:
+            return self.backend.get_field()
     
     def set_field(self, field):
         if -90000 <= field <= 90000:
-            return self.device.SetField(field, self.Brate, self.QDIBase.FieldApproach(Int32(0)), self.QDIBase.FieldMode(0))
+            with self.device_lock:
+                result = self.backend.set_field(field, self.Brate)
+                # after the Set call, so that a poll in flight cannot restore the old status
+                self._invalidate_state("field")
+                self._setpoints["field"] = float(field)
+            return result
         else:
             raise RuntimeError("Field is out of bounds. Should be between -90000 and 90000 Oe")
 
     def get_position(self):
-        error, position, status = self.device.GetPosition("Horizontal Rotator", Double(0), self.QDIBase.PositionStatus(Int32(0)))
+        with self.device_lock:
+            error, position, status = self.backend.get_position()
         return (error, position, status)
 
     def set_position(self, position):
-        return self.device.SetPosition("Horizontal Rotator", Double(position), self.prate, self.QDIBase.PositionMode(Int32(0)))
+        with self.device_lock:
+            result = self.backend.set_position(position, self.prate)
+            self._invalidate_state("position")
+            self._setpoints["position"] = float(position)
+        return result
 
     def set_temperature(self, temp):
         if self.minimim_temperature <= temp <= 350:
-            return self.device.SetTemperature(temp, self.Trate, self.QDIBase.TemperatureApproach(Int32(0)))
+            with self.device_lock:
+                result = self.backend.set_temperature(temp, self.Trate)
+                self._invalidate_state("temperature")
+                self._setpoints["temperature"] = float(temp)
+            return result
         else:
             raise RuntimeError("Temperature is out of bounds. Should be between " + str(self.minimim_temperature) + " and 350 K")
 
     def get_temperature(self) -> float:
-        error, temperature, status = self.device.GetTemperature(Double(0), self.QDIBase.TemperatureStatus(Int32(0)))
+        with self.device_lock:
+            error, temperature, status = self.backend.get_temperature()
         return (error, temperature, status)
 
+    async def wait_stable(
+        self,
+        quantity: str,
+        target: float | None = None,
+        tolerance: float | None = None,
+        rate: float | None = None,
+        min_interval: float = 0.1,
+        max_interval: float = 10.0,
+        timeout: float | None = None,
+    ) -> float:
+        """
+        Waits until a quantity reports a stable status (and is within tolerance of target).
+
+        While far from the target, the polling interval follows the estimated time
+        of arrival (half of it, within min_interval and max_interval). Once the target
+        is reached but the status is not yet stable, the interval doubles after each
+        poll, so slow stabilization costs few round trips. The blocking reads run in
+        a worker thread, so several waits can be combined with asyncio.gather().
+
+        Args:
+            quantity: "temperature", "field" or "position".
+            target: Target value. If None, the last setpoint written through this driver
+                is used (only the status is checked if there is none), so that the
+                stable status of the previous setpoint is not taken for the new one.
+            tolerance: Distance from target regarded as reached. Defaults to DEFAULT_TOLERANCE.
+            rate: Approach rate used to estimate the time of arrival (per s;
+                MultiVu temperature rates are per minute, see approach_temperature).
+            min_interval: Shortest polling interval in s.
+            max_interval: Longest polling interval in s.
+            timeout: Maximum waiting time in s. None waits forever.
+
+        Returns:
+            The stable value.
+        """
+        if quantity not in STATE_QUANTITIES:
+            raise ValueError(f"Unknown quantity {quantity!r}")
+        if tolerance is None:
+            tolerance = DEFAULT_TOLERANCE[quantity]
+        if target is None:
+            target = self._setpoints.get(quantity)
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        settle_interval = min_interval
+        while True:
+            value, status = await asyncio.to_thread(self.read_state, quantity, min_interval)
+            reached = target is None or abs(value - target) <= tolerance
+            if reached and status in STABLE_STATUS[quantity]:
+                return value
+            if reached or not rate:
+                interval = settle_interval
+                settle_interval = min(settle_interval * 2, max_interval)
+            else:
+                interval = min(max(abs(value - target) / abs(rate) / 2, min_interval), max_interval)
+            if deadline is not None:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise TimeoutError(f"{quantity} did not become stable within {timeout} s")
+                interval = min(interval, remaining)
+            await asyncio.sleep(interval)
+
+    async def approach_temperature(self, temperature: float, rate: float | None = None, **kwargs: Any) -> float:
+        """
+        Sets the temperature and waits until it is stable.
+
+        Args:
+            temperature: Target temperature in K.
+            rate: Temperature rate in K/min. If None, temperaturerate is used.
+            **kwargs: Forwarded to wait_stable().
+
+        Returns:
+            The stable temperature.
+        """
+        if rate is not None:
+            self.temperaturerate.set(rate)
+        await asyncio.to_thread(self.set_temperature, temperature)
+        # MultiVu の温度レートは K/min
+        return await self.wait_stable("temperature", temperature, rate=self.Trate / 60, **kwargs)
+
+    async def approach_field(self, field: float, rate: float | None = None, **kwargs: Any) -> float:
+        """
+        Sets the magnetic field and waits until it is stable.
+
+        Args:
+            field: Target field in Oe.
+            rate: Field rate in Oe/s. If None, fieldrate is used.
+            **kwargs: Forwarded to wait_stable().
+
+        Returns:
+            The stable field.
+        """
+        if rate is not None:
+            self.fieldrate.set(rate)
+        await asyncio.to_thread(self.set_field, field)
+        return await self.wait_stable("field", field, rate=self.Brate, **kwargs)
+
+    async def approach_position(self, position: float, rate: float | None = None, **kwargs: Any) -> float:
+        """
+        Sets the rotator position and waits until it is reached.
+
+        Args:
+            position: Target position in deg.
+            rate: Position rate in deg/s. If None, positionrate is used.
+            **kwargs: Forwarded to wait_stable().
+
+        Returns:
+            The reached position.
+        """
+        if rate is not None:
+            self.positionrate.set(rate)
+        await asyncio.to_thread(self.set_position, position)
+        return await self.wait_stable("position", position, rate=self.prate, **kwargs)
+
     def _set_t_rate(self, rate: float):
         self.Trate = rate
     
@@ -247,7 +625,7 @@ class QDPosition(Parameter):
 
     def get_raw(self) -> float:
         """Returns the motor position"""
-        return self.instrument.get_position()[1]
+        return self.instrument.read_state("position")[0]
     
 
 class QDPositionStatus(Parameter):
@@ -281,7 +659,7 @@ class QDPositionStatus(Parameter):
 
     def get_raw(self) -> float:
         """Returns the motor position status"""
-        return int(self.instrument.get_position()[2])
+        return self.instrument.read_state("position")[1]
 
 
 class QDTemperature(Parameter):
@@ -321,7 +699,7 @@ class QDTemperature(Parameter):
 
     def get_raw(self) -> float:
         """Returns the temperature"""
-        return self.instrument.get_temperature()[1]
+        return self.instrument.read_state("temperature")[0]
 
 
 class QDTemperatureStatus(Parameter):
@@ -355,7 +733,7 @@ class QDTemperatureStatus(Parameter):
 
     def get_raw(self) -> float:
         """Returns the temperature"""
-        return int(self.instrument.get_temperature()[2])
+        return self.instrument.read_state("temperature")[1]
 
 
 class QDField(Parameter):
@@ -395,7 +773,7 @@ class QDField(Parameter):
 
     def get_raw(self) -> float:
         """Returns the magnetic field"""
-        return self.instrument.get_field()[1]
+        return self.instrument.read_state("field")[0]
 
 
 class QDFieldStatus(Parameter):
@@ -412,4 +790,4 @@ class QDFieldStatus(Parameter):
 
     def get_raw(self) -> float:
         """Returns the magnetic field"""
-        return int(self.instrument.get_field()[2])
+        return self.instrument.read_state("field")[1]
@@ -0,0 +1,137 @@
+"""
+Non-blocking ramps of source parameters.
+
+ramp_parameter() steps a parameter to a target value in a worker thread and
+returns a RampFuture immediately, so the notebook and the other instruments
+stay usable while the source moves. The VISA access of each instrument is
+serialized by PralabVisaInstrument, so the instrument itself can also be
+read while it ramps.
+
+Example:
+    >>> ramp = yoko.ramp_current(1e-3, rate=1e-4, step=1e-5)
+    >>> k2182.amplitude()  # other instruments stay readable
+    >>> ramp.stop()        # stop at the present value
+    >>> ramp.result()      # last value set
+"""
+import math
+import threading
+import weakref
+from concurrent.futures import Future
+
+import numpy as np
+from qcodes.parameters import Parameter
+
+# 実行中のランプ (同じパラメータに対して同時に一つだけ)
+_active_ramps: "weakref.WeakKeyDictionary[Parameter, RampFuture]" = weakref.WeakKeyDictionary()
+_active_ramps_lock = threading.Lock()
+
+
+class RampFuture(Future):
+    """
+    Future of a running ramp. Its result is the last value set.
+
+    stop() ends the ramp at the value reached so far; the future then
+    completes normally with that value. cancel() keeps the Future contract:
+    it returns True only for a ramp that has not started yet. For a running
+    ramp it also requests the stop but returns False, as the ramp is not cancelled.
+    """
+
+    def __init__(self, parameter: Parameter, target: float) -> None:
+        super().__init__()
+        self.parameter = parameter
+        self.target = target
+        self._stop = threading.Event()
+
+    def stop(self) -> bool:
+        """
+        Stops the ramp at the present value, or cancels it if it has not started.
+
+        Returns:
+            False if the ramp had already finished.
+        """
+        if super().cancel():
+            return True
+        if self.done():
+            return False
+        self._stop.set()
+        return True
+
+    def cancel(self) -> bool:
+        self.stop()
+        return self.cancelled()
+
+    @property
+    def stop_requested(self) -> bool:
+        """True if stop() or cancel() was called while the ramp was running."""
+        return self._stop.is_set()
+
+    def _run(self, values: np.ndarray, interval: float) -> None:
+        if not self.set_running_or_notify_cancel():
+            return
+        last = None
+        try:
+            for i, value in enumerate(values):
+                if i > 0 and self._stop.wait(interval):
+                    break
+                self.parameter.set(float(value))
+                last = float(value)
+        except BaseException as e:
+            self.set_exception(e)
+        else:
+            self.set_result(last)
+        finally:
+            with _active_ramps_lock:
+                if _active_ramps.get(self.parameter) is self:
+                    del _active_ramps[self.parameter]
+
+
+def ramp_parameter(
+    parameter: Parameter,
+    target: float,
+    rate: float,
+    step: float,
+    start: float | None = None,
+) -> RampFuture:
+    """
+    Ramps a parameter to a target value in a worker thread.
+    A ramp already running on the same parameter is stopped first.
+
+    Args:
+        parameter: The parameter to ramp.
+        target: Target value.
+        rate: Ramp rate in parameter units per second.
+        step: Maximum step size in parameter units.
+        start: Start value. If None, the parameter is read.
+
+    Returns:
+        The future of the ramp.
+    """
+    if rate <= 0 or step <= 0:
+        raise ValueError("rate and step must be positive")
+    parameter.validate(target)
+
+    with _active_ramps_lock:
+        previous = _active_ramps.get(parameter)
+    if previous is not None:
+        previous.stop()
+        # 開始前に取り消されたランプは exception() が CancelledError を投げる
+        if not previous.cancelled():
+            previous.exception()
+
+    if start is None:
+        start = parameter.get()
+    nsteps = max(math.ceil(abs(target - start) / step), 1)
+    values = np.linspace(start, target, nsteps + 1)[1:]
+    interval = abs(target - start) / nsteps / rate
+
+    future = RampFuture(parameter, target)
+    with _active_ramps_lock:
+        _active_ramps[parameter] = future
+    thread = threading.Thread(
+        target=future._run,
+        args=(values, interval),
+        name=f"ramp-{parameter.full_name}",
+        daemon=True,
+    )
+    thread.start()
+    return future
@@ -0,0 +1,508 @@
+"""
+Local instrument server, so that several notebooks share one set of driver sessions.
+
+One process hosts the pralab drivers and serves parameter get/set to the
+other kernels over a local TCP socket (one JSON object per line).
+
+- Identical reads arriving within coalesce_window seconds are answered by a
+  single bus transaction.
+- Writes to one instrument are serialized, and the reads coalesced before a
+  write are discarded.
+- The cached snapshots of all instruments can be broadcast periodically to
+  subscribed clients; building them does not touch the bus.
+
+LoopbackClient talks to the server in the same process without a socket,
+which makes notebooks and scripts testable without hardware.
+
+Example (server process):
+    >>> server = InstrumentServer({"qd": qd, "lockin": lockin}, port=5025)
+    >>> server.start(snapshot_interval=1)
+
+Example (client notebook):
+    >>> client = InstrumentClient(port=5025)
+    >>> client.get("qd.temperature")
+    >>> client.set("lockin.frequency", 13.0)
+    >>> client.subscribe(lambda snapshot: print(snapshot["qd"]["parameters"]["temperature"]["value"]))
+
+Protocol:
+    Request:  {"id": 1, "op": "get", "parameter": "qd.temperature"}
+    Response: {"id": 1, "result": 300.0} or {"id": 1, "error": "..."}
+    The ops are "get", "set" (with "value"), "snapshot" (optional "instrument"),
+    "parameters", "stats" and "subscribe". Broadcast snapshots are sent as
+    {"snapshot": {...}} without an id.
+"""
+import abc
+import json
+import logging
+import socket
+import socketserver
+import threading
+import time
+from collections.abc import Callable, Mapping
+from concurrent.futures import Future
+from typing import Any
+
+from qcodes.instrument import InstrumentBase
+from qcodes.parameters import ParameterBase
+from qcodes.utils import NumpyJSONEncoder
+
+log = logging.getLogger(__name__)
+
+# 同じパラメータの読み取りをまとめる時間 (s)
+DEFAULT_COALESCE_WINDOW = 0.05
+
+
+def _encode(message: dict[str, Any]) -> bytes:
+    return (json.dumps(message, cls=NumpyJSONEncoder) + "\n").encode()
+
+
+class InstrumentServer:
+    """
+    Serves the parameters of local instruments to other processes.
+
+    Args:
+        instruments: Instruments served, by name. The parameters are addressed
+            as "<name>.<parameter>" or "<name>.<submodule>.<parameter>".
+        host: Address to listen on. Only local clients are expected.
+        port: TCP port. 0 picks a free port (see the port attribute).
+        coalesce_window: Reads of one parameter within this time in s share one bus transaction.
+
+    Attributes:
+        stats (dict[str, int]): Numbers of gets, bus reads, coalesced reads and sets.
+    """
+
+    def __init__(
+        self,
+        instruments: Mapping[str, InstrumentBase],
+        host: str = "127.0.0.1",
+        port: int = 0,
+        coalesce_window: float = DEFAULT_COALESCE_WINDOW,
+    ) -> None:
+        self.instruments = dict(instruments)
+        self.host = host
+        self.port = port
+        self.coalesce_window = coalesce_window
+        self.stats = {"gets": 0, "reads": 0, "coalesced": 0, "sets": 0}
+
+        self._lock = threading.Lock()
+        # parameter name -> (future of the read, time the read finished or None, write generation)
+        self._reads: dict[str, tuple[Future, float | None, int]] = {}
+        self._write_locks = {name: threading.Lock() for name in self.instruments}
+        # 装置ごとの書き込み世代: 書き込みをまたいだ読み取り結果は共有しない
+        self._generations = {name: 0 for name in self.instruments}
+        self._subscribers: list[Callable[[dict[str, Any]], None]] = []
+
+        self._tcp_server: socketserver.ThreadingTCPServer | None = None
+        self._threads: list[threading.Thread] = []
+        self._stop = threading.Event()
+
+    def _resolve(self, name: str) -> tuple[str, ParameterBase]:
+        instrument_name, *path = name.split(".")
+        if instrument_name not in self.instruments or not path:
+            raise KeyError(f"Unknown parameter {name!r}")
+        node: Any = self.instruments[instrument_name]
+        for part in path[:-1]:
+            node = node.submodules[part]
+        parameter = node.parameters.get(path[-1])
+        if parameter is None:
+            raise KeyError(f"Unknown parameter {name!r}")
+        return instrument_name, parameter
+
+    def get(self, name: str) -> Any:
+        """
+        Reads a parameter, sharing the bus transaction with identical reads in the window.
+
+        A read is only shared within one write generation of its instrument:
+        a read overlapping a set() is neither joined by later reads nor kept.
+        """
+        instrument_name, parameter = self._resolve(name)
+        with self._lock:
+            self.stats["gets"] += 1
+            generation = self._generations[instrument_name]
+            entry = self._reads.get(name)
+            if entry is not None:
+                future, finished, entry_generation = entry
+                if entry_generation == generation and (
+                    finished is None or time.monotonic() - finished <= self.coalesce_window
+                ):
+                    self.stats["coalesced"] += 1
+                    owner = False
+                else:
+                    entry = None
+            if entry is None:
+                future = Future()
+                self._reads[name] = (future, None, generation)
+                self.stats["reads"] += 1
+                owner = True
+
+        if owner:
+            try:
+                future.set_result(parameter.get())
+            except Exception as e:
+                future.set_exception(e)
+            with self._lock:
+                if self._reads.get(name, (None,))[0] is future:
+                    if self._generations[instrument_name] == generation:
+                        self._reads[name] = (future, time.monotonic(), generation)
+                    else:
+                        # set() ran during the read: the value may predate the write
+                        del self._reads[name]
+        return future.result()
+
+    def _new_generation(self, instrument_name: str) -> None:
+        # 書き込みで他のパラメータも変わり得るので、その装置の読み取り結果は全て捨てる
+        prefix = instrument_name + "."
+        with self._lock:
+            self._generations[instrument_name] += 1
+            for key in [key for key in self._reads if key.startswith(prefix)]:
+                del self._reads[key]
+
+    def set(self, name: str, value: Any) -> None:
+        """Sets a parameter. Writes to one instrument are serialized."""
+        instrument_name, parameter = self._resolve(name)
+        with self._write_locks[instrument_name]:
+            with self._lock:
+                self.stats["sets"] += 1
+            # reads started before or during the write belong to the old generations
+            self._new_generation(instrument_name)
+            try:
+                parameter.set(value)
+            finally:
+                self._new_generation(instrument_name)
+
+    def snapshot(self, instrument: str | None = None) -> dict[str, Any]:
+        """Returns the cached snapshot of one or all instruments without touching the bus."""
+        if instrument is not None:
+            return self.instruments[instrument].snapshot(update=False)
+        return {name: inst.snapshot(update=False) for name, inst in self.instruments.items()}
+
+    def parameters(self) -> list[str]:
+        """Returns the names of all served parameters."""
+        names = []
+
+        def collect(prefix: str, node: InstrumentBase) -> None:
+            names.extend(prefix + name for name in node.parameters)
+            for sub_name, submodule in node.submodules.items():
+                collect(prefix + sub_name + ".", submodule)
+
+        for name, instrument in self.instruments.items():
+            collect(name + ".", instrument)
+        return names
+
+    def handle_request(self, request: dict[str, Any]) -> dict[str, Any]:
+        """
+        Executes one protocol request and returns the response.
+        Errors are reported in the response instead of being raised.
+        """
+        response: dict[str, Any] = {"id": request.get("id")}
+        try:
+            op = request["op"]
+            if op == "get":
+                response["result"] = self.get(request["parameter"])
+            elif op == "set":
+                self.set(request["parameter"], request["value"])
+                response["result"] = None
+            elif op == "snapshot":
+                response["result"] = self.snapshot(request.get("instrument"))
+            elif op == "parameters":
+                response["result"] = self.parameters()
+            elif op == "stats":
+                with self._lock:
+                    response["result"] = dict(self.stats)
+            else:
+                raise ValueError(f"Unknown op {op!r}")
+        except Exception as e:
+            response["error"] = f"{type(e).__name__}: {e}"
+        return response
+
+    def add_subscriber(self, callback: Callable[[dict[str, Any]], None]) -> None:
+        """Registers a callback receiving the broadcast messages."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+    def remove_subscriber(self, callback: Callable[[dict[str, Any]], None]) -> None:
+        with self._lock:
+            if callback in self._subscribers:
+                self._subscribers.remove(callback)
+
+    def broadcast(self) -> None:
+        """Sends the cached snapshots of all instruments to the subscribers."""
+        with self._lock:
+            subscribers = list(self._subscribers)
+        if not subscribers:
+            return
+        message = {"snapshot": self.snapshot()}
+        for callback in subscribers:
+            try:
+                callback(message)
+            except OSError:
+                # 切断されたクライアント
+                self.remove_subscriber(callback)
+
+    def _broadcast_loop(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            self.broadcast()
+
+    def start(self, snapshot_interval: float | None = None) -> None:
+        """
+        Starts serving in background threads.
+
+        Args:
+            snapshot_interval: Interval of the snapshot broadcast in s. If None, nothing is broadcast.
+        """
+        if self._tcp_server is not None:
+            raise RuntimeError("Server is already running")
+        self._stop.clear()
+        self._tcp_server = _TCPServer((self.host, self.port), _RequestHandler, self)
+        self.port = self._tcp_server.server_address[1]
+        self._threads = [
+            threading.Thread(target=self._tcp_server.serve_forever, name="instrument-server", daemon=True)
+        ]
+        if snapshot_interval is not None:
+            self._threads.append(
+                threading.Thread(
+                    target=self._broadcast_loop,
+                    args=(snapshot_interval,),
+                    name="instrument-server-broadcast",
+                    daemon=True,
+                )
+            )
+        for thread in self._threads:
+            thread.start()
+
+    def shutdown(self) -> None:
+        """Stops serving. The instruments are left open."""
+        self._stop.set()
+        if self._tcp_server is not None:
+            self._tcp_server.shutdown()
+            self._tcp_server.server_close()
+            self._tcp_server = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address: tuple[str, int], handler: type, instrument_server: InstrumentServer) -> None:
+        self.instrument_server = instrument_server
+        super().__init__(address, handler)
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    server: _TCPServer
+
+    def _send(self, message: dict[str, Any]) -> None:
+        with self._send_lock:
+            self.wfile.write(_encode(message))
+            self.wfile.flush()
+
+    def handle(self) -> None:
+        instrument_server = self.server.instrument_server
+        self._send_lock = threading.Lock()
+        subscribed = False
+        try:
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except json.JSONDecodeError as e:
+                    self._send({"id": None, "error": f"JSONDecodeError: {e}"})
+                    continue
+                if request.get("op") == "subscribe":
+                    if not subscribed:
+                        instrument_server.add_subscriber(self._send)
+                        subscribed = True
+                    self._send({"id": request.get("id"), "result": None})
+                else:
+                    self._send(instrument_server.handle_request(request))
+        finally:
+            if subscribed:
+                instrument_server.remove_subscriber(self._send)
+
+
+class _ClientBase(abc.ABC):
+    """
+    Parameter access and snapshot delivery shared by InstrumentClient and LoopbackClient.
+
+    The subscribed callbacks run in a dispatcher thread, so a slow or failing
+    callback does not stall the thread receiving the broadcast. Snapshots
+    arriving while the callbacks run are coalesced into the newest one.
+    """
+
+    def __init__(self) -> None:
+        self._callbacks: list[Callable[[dict[str, Any]], None]] = []
+        self._snapshot_ready = threading.Condition()
+        self._latest_snapshot: dict[str, Any] | None = None
+        self._dispatcher: threading.Thread | None = None
+        self._closed = False
+
+    @abc.abstractmethod
+    def request(self, op: str, **kwargs: Any) -> Any:
+        """Sends one request and returns its result."""
+
+    def _add_callback(self, callback: Callable[[dict[str, Any]], None]) -> bool:
+        """Registers a snapshot callback. Returns True for the first one."""
+        self._callbacks.append(callback)
+        if self._dispatcher is None:
+            self._dispatcher = threading.Thread(
+                target=self._dispatch_loop, name="instrument-client-snapshots", daemon=True
+            )
+            self._dispatcher.start()
+        return len(self._callbacks) == 1
+
+    def _queue_snapshot(self, snapshot: dict[str, Any]) -> None:
+        with self._snapshot_ready:
+            self._latest_snapshot = snapshot
+            self._snapshot_ready.notify()
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            with self._snapshot_ready:
+                while self._latest_snapshot is None and not self._closed:
+                    self._snapshot_ready.wait()
+                if self._closed:
+                    return
+                snapshot, self._latest_snapshot = self._latest_snapshot, None
+            for callback in list(self._callbacks):
+                try:
+                    callback(snapshot)
+                except Exception:
+                    log.exception(f"Snapshot callback {callback!r} failed")
+
+    def _stop_dispatcher(self) -> None:
+        with self._snapshot_ready:
+            self._closed = True
+            self._snapshot_ready.notify_all()
+        if self._dispatcher is not None and self._dispatcher is not threading.current_thread():
+            self._dispatcher.join()
+
+    def get(self, parameter: str) -> Any:
+        """Reads a served parameter, e.g. "qd.temperature"."""
+        return self.request("get", parameter=parameter)
+
+    def set(self, parameter: str, value: Any) -> None:
+        """Sets a served parameter."""
+        self.request("set", parameter=parameter, value=value)
+
+    def snapshot(self, instrument: str | None = None) -> dict[str, Any]:
+        """Returns the cached snapshot of one or all served instruments."""
+        return self.request("snapshot", instrument=instrument)
+
+    def parameters(self) -> list[str]:
+        """Returns the names of all served parameters."""
+        return self.request("parameters")
+
+    def stats(self) -> dict[str, int]:
+        """Returns the read/write counters of the server."""
+        return self.request("stats")
+
+    @staticmethod
+    def _result(response: dict[str, Any]) -> Any:
+        if "error" in response:
+            raise RuntimeError(f"Instrument server error: {response['error']}")
+        return response.get("result")
+
+
+class InstrumentClient(_ClientBase):
+    """
+    Client of an InstrumentServer running in another process.
+
+    Args:
+        host: Address of the server.
+        port: TCP port of the server.
+        timeout: Maximum waiting time of a request in s.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 5025, timeout: float = 10.0) -> None:
+        super().__init__()
+        self.timeout = timeout
+        self._socket = socket.create_connection((host, port), timeout=timeout)
+        self._socket.settimeout(None)
+        self._rfile = self._socket.makefile("rb")
+        self._send_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self._pending: dict[int, Future] = {}
+        self._reader = threading.Thread(target=self._read_loop, name="instrument-client", daemon=True)
+        self._reader.start()
+
+    def _read_loop(self) -> None:
+        try:
+            for line in self._rfile:
+                message = json.loads(line)
+                if "snapshot" in message:
+                    self._queue_snapshot(message["snapshot"])
+                    continue
+                with self._lock:
+                    future = self._pending.pop(message.get("id"), None)
+                if future is not None:
+                    future.set_result(message)
+        except (OSError, ValueError):
+            pass
+        finally:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(ConnectionError("Instrument server closed the connection"))
+
+    def request(self, op: str, **kwargs: Any) -> Any:
+        """Sends one request and waits for its response."""
+        future: Future = Future()
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = future
+        with self._send_lock:
+            self._socket.sendall(_encode({"id": request_id, "op": op, **kwargs}))
+        return self._result(future.result(self.timeout))
+
+    def subscribe(self, callback: Callable[[dict[str, Any]], None]) -> None:
+        """Calls callback (in a background thread) with the snapshots broadcast by the server."""
+        if self._add_callback(callback):
+            self.request("subscribe")
+
+    def close(self) -> None:
+        self._stop_dispatcher()
+        try:
+            # wakes up the reader thread blocked in recv
+            self._socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._socket.close()
+        self._reader.join()
+
+
+class LoopbackClient(_ClientBase):
+    """
+    Stand-in for InstrumentClient that calls an InstrumentServer in the same process.
+
+    Requests and responses still go through JSON, so values come back
+    exactly as a remote client would receive them. The server does not need
+    to be started.
+    """
+
+    def __init__(self, server: InstrumentServer) -> None:
+        super().__init__()
+        self.server = server
+
+    def request(self, op: str, **kwargs: Any) -> Any:
+        request = json.loads(_encode({"id": None, "op": op, **kwargs}))
+        if op == "subscribe":
+            return None
+        return self._result(json.loads(_encode(self.server.handle_request(request))))
+
+    def _deliver(self, message: dict[str, Any]) -> None:
+        self._queue_snapshot(json.loads(_encode(message))["snapshot"])
+
+    def subscribe(self, callback: Callable[[dict[str, Any]], None]) -> None:
+        """Calls callback (in a background thread) with the snapshots broadcast by the server."""
+        if self._add_callback(callback):
+            self.server.add_subscriber(self._deliver)
+
+    def close(self) -> None:
+        self.server.remove_subscriber(self._deliver)
+        self._stop_dispatcher()
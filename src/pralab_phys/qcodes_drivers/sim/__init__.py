@@ -0,0 +1,13 @@
+# pralab_phys.qcodes_drivers.sim
+# Python stand-ins for the instruments, for use without hardware
+
+from .qddotnet import QDSimBackend
+from .visa import SimInstrument, SimulatedResource
+from .instruments import (
+    SIM_MODELS,
+    SimKeithley2182A,
+    SimKeithley6221,
+    SimLI5650,
+    SimYokogawa7651,
+    sim_model_for,
+)
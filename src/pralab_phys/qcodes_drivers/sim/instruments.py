@@ -0,0 +1,470 @@
+"""
+Simulated models of the pralab VISA instruments.
+
+Each model answers the commands its driver sends, with the timing of the
+real instrument (integration time, settling, transfer) and noisy readings.
+The measured quantities are plain attributes, so a simulation can set up
+the "sample":
+
+    >>> model = SimKeithley2182A(voltages=(1e-6, 2e-3), noise=30e-9)
+    >>> k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=model)
+"""
+import math
+import re
+from typing import Any
+
+import numpy as np
+
+from .visa import SimInstrument
+
+
+class SimKeithley2182A(SimInstrument):
+    """
+    Keithley 2182A nanovoltmeter (1 or 2 channels).
+
+    Args:
+        voltages: Voltages of CH1 and CH2 in V.
+        noise: Noise of a reading at 1 NPLC (V rms). It scales with 1/sqrt(NPLC)
+            and the digital filter (10 readings) reduces it by sqrt(10).
+        reading_overhead: Time in s of a reading on top of its integration time.
+        **kwargs: Forwarded to SimInstrument (latency, transfer_rate, ...).
+    """
+
+    idn = "KEITHLEY INSTRUMENTS INC.,MODEL 2182A,0000000,SIM"
+    defaults = {
+        "SENS:VOLT:NPLC": "5",
+        "SENS:VOLT:CHAN1:RANG:AUTO": "1",
+        "SENS:VOLT:CHAN2:RANG:AUTO": "1",
+        "SENS:VOLT:REFERENCE:STATE": "0",
+        "SENS:VOLT:CHAN1:REFERENCE:STATE": "0",
+        "SENS:VOLT:CHAN2:REFERENCE:STATE": "0",
+        "SENS:FUNC": '"VOLT:DC"',
+        "SENS:VOLT:DFILTER:STAT": "1",
+        "SENS:CHAN": "1",
+        "SENS:VOLT:RAT": "0",
+        "INIT:CONT": "1",
+        "TRIG:SOUR": "IMM",
+        "TRIG:COUN": "1",
+        "TRAC:POIN": "1024",
+        "TRAC:FEED:CONT": "NEV",
+        "FORM:DATA": "ASC",
+    }
+    dialogues = SimInstrument.common_dialogues + (
+        (r"SENS:DATA:FRES\?", "fresh_query"),
+        (r"READ\?", "read_query"),
+        (r"INIT", "init"),
+        (r"FETC\?", "fetch_query"),
+        (r"ABOR", "abort"),
+        (r"TRAC:CLE", "trace_clear"),
+        (r"TRAC:POIN:ACT\?", "trace_count_query"),
+        (r"TRAC:DATA\?", "trace_data_query"),
+    )
+
+    def __init__(
+        self,
+        voltages: tuple[float, float] = (1e-6, 1e-3),
+        noise: float = 20e-9,
+        reading_overhead: float = 2e-3,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.voltages = voltages
+        self.noise = noise
+        self.reading_overhead = reading_overhead
+        self._init_time: float | None = None
+        self._done_time = 0.0
+        self._last = 0.0
+        self._trace = np.empty(0)
+
+    def reset(self) -> None:
+        super().reset()
+        self.values["INIT:CONT"] = "0"
+        self._init_time = None
+        self._trace = np.empty(0)
+
+    def reading_time(self) -> float:
+        return float(self.values["SENS:VOLT:NPLC"]) / self.line_frequency + self.reading_overhead
+
+    def readings(self, n: int) -> np.ndarray:
+        nplc = float(self.values["SENS:VOLT:NPLC"])
+        sigma = self.noise / math.sqrt(nplc)
+        if self.values["SENS:VOLT:DFILTER:STAT"] == "1":
+            sigma /= math.sqrt(10)
+        v1 = self.voltages[0] + sigma * self.rng.standard_normal(n)
+        if self.values["SENS:VOLT:RAT"] == "1":
+            v2 = self.voltages[1] + sigma * self.rng.standard_normal(n)
+            return v1 / v2
+        if self.values["SENS:CHAN"] == "2":
+            return self.voltages[1] + sigma * self.rng.standard_normal(n)
+        return v1
+
+    def fresh_query(self) -> str:
+        self.busy += self.reading_time()
+        self._last = float(self.readings(1)[0])
+        return f"{self._last:.7E}"
+
+    def read_query(self) -> str:
+        return self.fresh_query()
+
+    def init(self) -> None:
+        now = self.clock() + self.busy
+        self._init_time = now
+        if self.values["TRAC:FEED:CONT"] == "NEXT":
+            self._trace = self.readings(int(self.values["TRAC:POIN"]))
+            self._done_time = now + len(self._trace) * self.reading_time()
+        else:
+            self._last = float(self.readings(1)[0])
+            self._done_time = now + self.reading_time()
+
+    def operation_done(self) -> float:
+        return self._done_time
+
+    def fetch_query(self) -> str:
+        self.wait_until(self._done_time)
+        return f"{self._last:.7E}"
+
+    def abort(self) -> None:
+        self._init_time = None
+
+    def trace_clear(self) -> None:
+        self._trace = np.empty(0)
+
+    def trace_count_query(self) -> str:
+        if self._init_time is None or not len(self._trace):
+            return "0"
+        elapsed = self.clock() + self.busy - self._init_time
+        return str(min(len(self._trace), int(elapsed / self.reading_time())))
+
+    def trace_data_query(self) -> np.ndarray:
+        return self._trace[:int(self.trace_count_query())]
+
+
+class SimKeithley6221(SimInstrument):
+    """
+    Keithley 6221 current source.
+
+    Args:
+        resistance: Resistance of the sample in Ohm, used for the delta/sweep buffer readings.
+        noise: Noise of a buffered voltage reading (V rms).
+        reading_time: Time in s per delta/sweep reading.
+        settle_time: Time in s a new DC amplitude takes to settle.
+        **kwargs: Forwarded to SimInstrument (latency, transfer_rate, ...).
+    """
+
+    idn = "KEITHLEY INSTRUMENTS INC.,MODEL 6221,0000000,SIM"
+    defaults = {
+        "OUTP:STAT": "0",
+        "SOUR:CURR:AMPL": "0.000000E+00",
+        "SOUR:CURR:COMP": "1.000000E+01",
+        "SOUR:CURR:RANG:AUTO": "0",
+        "SOUR:WAVE:FUNC": "SIN",
+        "SOUR:WAVE:AMPL": "2.000000E-12",
+        "SOUR:WAVE:FREQ": "1.000000E+03",
+        "SOUR:WAVE:OFFS": "0.000000E+00",
+        "SOUR:WAVE:PMAR:STAT": "0",
+        "SOUR:WAVE:PMAR": "0",
+        "SOUR:WAVE:PMAR:OLIN": "3",
+        "SENS:AVER": "0",
+        "SENS:AVER:COUN": "10",
+        "SENS:AVER:TCON": "MOV",
+        "SOUR:DELT:NVPR": "1",
+        "TRAC:POIN": "100",
+        "FORM:DATA": "ASC",
+    }
+    dialogues = SimInstrument.common_dialogues + (
+        (r"OUTPUT (ON|OFF)", "output"),
+        (r"SOUR:(DELT|PDEL|DCON):ARM", "arm"),
+        (r"SOUR:(?:DELT|PDEL|DCON):ARM\?", "armed_query"),
+        (r"INIT:IMM", "init"),
+        (r"SOUR:SWE:ABOR", "abort"),
+        (r"TRAC:CLE", "trace_clear"),
+        (r"TRAC:POIN:ACT\?", "trace_count_query"),
+        (r"TRAC:DATA\?", "trace_data_query"),
+    )
+    command_latency = {
+        r"OUTP(?:UT)?(?::STAT)? .*": 10e-3,
+        r"SOUR:CURR:AMPL .*": 0.5e-3,
+        r"SOUR:WAVE:(?:FREQ|AMPL|OFFS) .*": 1e-3,
+    }
+
+    def __init__(
+        self,
+        resistance: float = 1.0,
+        noise: float = 10e-9,
+        reading_time: float = 10e-3,
+        settle_time: float = 0.0,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.resistance = resistance
+        self.noise = noise
+        self.reading_time = reading_time
+        self.settle_time = settle_time
+        self._armed = False
+        self._init_time: float | None = None
+        self._trace = np.empty(0)
+        if settle_time:
+            self._command_latency.append((re.compile(r"SOUR:CURR:AMPL .*", re.IGNORECASE), settle_time))
+
+    def output(self, state: str) -> None:
+        self.values["OUTP:STAT"] = "1" if state.upper() == "ON" else "0"
+
+    def arm(self, mode: str) -> None:
+        self._armed = True
+
+    def armed_query(self) -> str:
+        return "1" if self._armed else "0"
+
+    def init(self) -> None:
+        npoints = int(float(self.values["TRAC:POIN"]))
+        current = float(self.values["SOUR:CURR:AMPL"]) or 1e-6
+        self._trace = self.resistance * current + self.noise * self.rng.standard_normal(npoints)
+        self._init_time = self.clock() + self.busy
+
+    def abort(self) -> None:
+        self._armed = False
+        self._init_time = None
+
+    def trace_clear(self) -> None:
+        self._trace = np.empty(0)
+
+    def trace_count_query(self) -> str:
+        if self._init_time is None:
+            return "0"
+        elapsed = self.clock() + self.busy - self._init_time
+        return str(min(len(self._trace), int(elapsed / self.reading_time)))
+
+    def trace_data_query(self) -> np.ndarray:
+        return self._trace[:int(self.trace_count_query())]
+
+
+class SimLI5650(SimInstrument):
+    """
+    NF LI5650 lock-in amplifier.
+
+    The signal is x + iy (V) independent of the frequency. Its noise is
+    reduced by the time constant like an equivalent noise bandwidth.
+
+    Args:
+        signal: Complex signal in V.
+        noise: Noise density in V/sqrt(Hz).
+        auto_time: Time in s the auto functions take.
+        **kwargs: Forwarded to SimInstrument (latency, transfer_rate, ...).
+    """
+
+    idn = "NF Corporation,LI5650,0,SIM"
+    defaults = {
+        "PHAS": "0.00",
+        "FREQ": "1000.0000",
+        "SOUR:VOLT": "0.000",
+        "CALCULATE1:OFFSET": "0.000",
+        "CALCULATE2:OFFSET": "0.000",
+        "CALCULATE1:OFFSET:STATE": "0",
+        "CALCULATE2:OFFSET:STATE": "0",
+        "ROUT2": "RINP",
+        "FILT:TCON": "0.1",
+        "INP:GAIN": "IE6",
+        "SOUR:FREQ": "1000.0000",
+        "FILT:SLOP": "24",
+        "CURR:AC:RANG": "1E-06",
+        "VOLT:AC:RANG": "1",
+        "DATA": "6",
+        "TRAC:POIN": "1000",
+        "TRAC:TIM": "1E-3",
+        "TRAC:FEED": "6",
+        "TRAC:FEED:CONT": "NEV",
+        "FORM:DATA": "ASC",
+    }
+    dialogues = SimInstrument.common_dialogues + (
+        (r"FETC\?", "fetch_query"),
+        (r"[A-Z0-9:]+:AUTO:ONCE", "auto_once"),
+        (r"TRAC:CLE", "trace_clear"),
+        (r"TRAC:FEED:CONT (NEXT|NEV)", "trace_control"),
+        (r"TRAC:POIN:ACT\?", "trace_count_query"),
+        (r"TRAC:DATA\?", "trace_data_query"),
+    )
+
+    def __init__(
+        self,
+        signal: complex = 1e-3 + 0j,
+        noise: float = 10e-9,
+        auto_time: float = 0.5,
+        **kwargs: Any,
+    ) -> None:
+        super().__init__(**kwargs)
+        self.signal = signal
+        self.noise = noise
+        self.auto_time = auto_time
+        self._auto_done = 0.0
+        self._trace_start: float | None = None
+        self._trace_stop: float | None = None
+
+    def outputs(self, n: int) -> np.ndarray:
+        """Returns n samples of data1 to data4 (X, Y, R, theta) as columns."""
+        time_constant = float(self.values["FILT:TCON"])
+        sigma = self.noise / math.sqrt(4 * time_constant)
+        z = self.signal + sigma * (self.rng.standard_normal(n) + 1j * self.rng.standard_normal(n))
+        return np.column_stack([z.real, z.imag, np.abs(z), np.degrees(np.angle(z))])
+
+    def fetch_query(self) -> str:
+        mask = int(self.values["DATA"])
+        data = self.outputs(1)[0]
+        return ",".join(f"{data[n - 1]:+.6E}" for n in (1, 2, 3, 4) if mask & (1 << n))
+
+    def auto_once(self) -> None:
+        self._auto_done = self.clock() + self.busy + self.auto_time
+
+    def operation_done(self) -> float:
+        return self._auto_done
+
+    def trace_clear(self) -> None:
+        self._trace_start = None
+        self._trace_stop = None
+
+    def trace_control(self, state: str) -> None:
+        now = self.clock() + self.busy
+        if state.upper() == "NEXT":
+            self._trace_start = now
+            self._trace_stop = None
+        elif self._trace_start is not None:
+            self._trace_stop = now
+
+    def trace_count_query(self) -> str:
+        if self._trace_start is None:
+            return "0"
+        end = self._trace_stop if self._trace_stop is not None else self.clock() + self.busy
+        count = int((end - self._trace_start) / float(self.values["TRAC:TIM"]))
+        return str(min(count, int(self.values["TRAC:POIN"])))
+
+    def trace_data_query(self) -> np.ndarray:
+        mask = int(self.values["TRAC:FEED"])
+        columns = [n - 1 for n in (1, 2, 3, 4) if mask & (1 << n)]
+        return self.outputs(int(self.trace_count_query()))[:, columns].ravel()
+
+
+class SimYokogawa7651(SimInstrument):
+    """
+    Yokogawa 7651 DC source (non-SCPI, one command per message).
+
+    Args:
+        settle_time: Time in s a new output level takes to settle.
+        **kwargs: Forwarded to SimInstrument (latency, transfer_rate, ...).
+    """
+
+    separator = None
+    dialogues = (
+        (r"OS", "os_query"),
+        (r"OD", "od_query"),
+        (r"OC", "oc_query"),
+        (r"RC", "rst"),
+        (r"F([15])SA([+-]?[0-9.]+(?:E[+-]?\d+)?)E", "set_level"),
+        (r"F([15])E", "set_function"),
+        (r"F([15])R(\d)E", "set_range"),
+        (r"O([01])E", "set_output"),
+        (r"L([VA])(\d+)E?", "set_limit"),
+        (r"PRS", "program_start"),
+        (r"PRE", "program_end"),
+        (r"PI([0-9.]+(?:E[+-]?\d+)?)", "program_interval"),
+        (r"RU(\d)", "program_run"),
+        (r"(SW|M)[0-9.E+-]*", "ignore"),
+    )
+
+    def __init__(self, settle_time: float = 0.0, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self.settle_time = settle_time
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.function = "F1"
+        self.level = 0.0
+        self.output = 0
+        self.limits = {"V": 30, "A": 120}
+        self._editing = False
+        self._program: list[tuple[str, float]] = []
+        self._interval = 1.0
+        self._program_end: float | None = None
+
+    def os_query(self) -> str:
+        return "MDL7651REV1.04"
+
+    def od_query(self) -> str:
+        self._update_program()
+        unit = "V" if self.function == "F1" else "A"
+        return f"NDC{unit}{self.level:+.5E}"
+
+    def oc_query(self) -> str:
+        self._update_program()
+        status = self.output << 4
+        if self._program_end is not None:
+            status |= 1 << 1
+        return f"STS1={status}"
+
+    def set_level(self, function: str, value: str) -> None:
+        if self._editing:
+            self._program.append(("F" + function, float(value)))
+            return
+        self.function = "F" + function
+        self.level = float(value)
+        self.busy += self.settle_time
+
+    def set_function(self, function: str) -> None:
+        self.function = "F" + function
+
+    def set_range(self, function: str, range_code: str) -> None:
+        self.function = "F" + function
+
+    def set_output(self, state: str) -> None:
+        self.output = int(state)
+
+    def set_limit(self, kind: str, value: str) -> None:
+        self.limits[kind] = int(value)
+
+    def program_start(self) -> None:
+        self._editing = True
+        self._program = []
+
+    def program_end(self) -> None:
+        self._editing = False
+
+    def program_interval(self, interval: str) -> None:
+        self._interval = float(interval)
+
+    def program_run(self, mode: str) -> None:
+        if mode in ("2", "3") and self._program:
+            self._program_end = self.clock() + self.busy + len(self._program) * self._interval
+        elif mode == "0":
+            self._update_program()
+            self._program_end = None
+
+    def _update_program(self) -> None:
+        if self._program_end is None:
+            return
+        remaining = self._program_end - self.clock()
+        steps_left = max(math.ceil(remaining / self._interval), 0)
+        index = min(len(self._program) - steps_left, len(self._program) - 1)
+        self.function, self.level = self._program[index]
+        if remaining <= 0:
+            self._program_end = None
+
+    def ignore(self, *args: str) -> None:
+        return None
+
+
+# driver class name -> simulated model
+SIM_MODELS: dict[str, type[SimInstrument]] = {
+    "Keithley2182A1ch": SimKeithley2182A,
+    "Keithley2182A": SimKeithley2182A,
+    "Keithley6221": SimKeithley6221,
+    "LI5650": SimLI5650,
+    "Yokogawa7651": SimYokogawa7651,
+}
+
+
+def sim_model_for(driver: type) -> SimInstrument:
+    """Returns a new simulated model for a driver class (or one of its subclasses)."""
+    for cls in driver.__mro__:
+        model = SIM_MODELS.get(cls.__name__)
+        if model is not None:
+            return model()
+    raise ValueError(f"No simulated model for {driver.__name__}")
@@ -0,0 +1,134 @@
+"""
+QDSimBackend is a pure-Python stand-in for the MultiVu device behind QDdotNET.
+
+Temperature, field and position move linearly towards their setpoints at the
+requested rate (K/min, Oe/s and deg/s like MultiVu) and report the status codes of QDInstrument.dll, so QDdotNET
+runs on any machine without .NET or the DLL. Each call can cost a latency
+like a MultiVu round trip, and the readings can carry gaussian noise:
+
+    >>> qd = QDdotNET("qd", "", backend=QDSimBackend(latency=0.02, noise={"temperature": 1e-3}))
+"""
+import time
+from collections.abc import Callable, Mapping
+
+import numpy as np
+
+# Status codes while moving, after reaching the target and once stable
+_STATUS = {
+    "temperature": {"moving": 2, "near": 5, "stable": 1},    # Tracking, Near, Stable
+    "field": {"moving": 6, "near": 5, "stable": 4},          # Charging, Iterating, StableDriven
+    "position": {"moving": 5, "near": 5, "stable": 1},       # Moving, Moving, TransitionComplete
+}
+# Time unit of the rates in s (MultiVu temperature rates are per minute)
+_RATE_TIME = {"temperature": 60.0, "field": 1.0, "position": 1.0}
+
+
+class _SimQuantity:
+    def __init__(self, name: str, value: float, settle_time: float, clock: Callable[[], float]) -> None:
+        self.name = name
+        self.clock = clock
+        self.settle_time = settle_time
+        self.start_value = value
+        self.target = value
+        self.rate = 1.0
+        self.start_time = clock() - settle_time
+
+    def value(self) -> float:
+        elapsed = self.clock() - self.start_time
+        distance = self.target - self.start_value
+        travel = self.rate * elapsed
+        if travel >= abs(distance):
+            return self.target
+        return self.start_value + travel * (1 if distance > 0 else -1)
+
+    def status(self) -> int:
+        codes = _STATUS[self.name]
+        elapsed = self.clock() - self.start_time
+        arrival = abs(self.target - self.start_value) / self.rate
+        if elapsed < arrival:
+            return codes["moving"]
+        if elapsed < arrival + self.settle_time:
+            return codes["near"]
+        return codes["stable"]
+
+    def set(self, target: float, rate: float) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.start_value = self.value()
+        self.start_time = self.clock()
+        self.target = target
+        # per s
+        self.rate = rate / _RATE_TIME[self.name]
+
+
+class QDSimBackend:
+    """
+    Python stand-in for the MultiVu device.
+
+    Args:
+        temperature: Initial temperature in K.
+        field: Initial field in Oe.
+        position: Initial position in deg.
+        settle_time: Time in s between reaching a setpoint and reporting a stable status.
+        clock: Time source in s (time.monotonic by default).
+        latency: Time in s every get/set call takes.
+        noise: Noise (rms) of the readings of each quantity, e.g. {"temperature": 1e-3}.
+        seed: Seed of the noise generator.
+        sleep: Function waiting for the latency.
+    """
+
+    def __init__(
+        self,
+        temperature: float = 300.0,
+        field: float = 0.0,
+        position: float = 0.0,
+        settle_time: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+        latency: float = 0.0,
+        noise: Mapping[str, float] | None = None,
+        seed: int | None = None,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.clock = clock
+        self.latency = latency
+        self.noise = dict(noise or {})
+        self.rng = np.random.default_rng(seed)
+        self.sleep = sleep
+        self._quantities = {
+            "temperature": _SimQuantity("temperature", temperature, settle_time, clock),
+            "field": _SimQuantity("field", field, settle_time, clock),
+            "position": _SimQuantity("position", position, settle_time, clock),
+        }
+
+    def _get(self, name: str) -> tuple[int, float, int]:
+        if self.latency:
+            self.sleep(self.latency)
+        quantity = self._quantities[name]
+        value = quantity.value()
+        if self.noise.get(name):
+            value += self.noise[name] * float(self.rng.standard_normal())
+        return 0, value, quantity.status()
+
+    def _set(self, name: str, value: float, rate: float) -> int:
+        if self.latency:
+            self.sleep(self.latency)
+        self._quantities[name].set(value, rate)
+        return 0
+
+    def get_temperature(self):
+        return self._get("temperature")
+
+    def set_temperature(self, temperature, rate):
+        return self._set("temperature", temperature, rate)
+
+    def get_field(self):
+        return self._get("field")
+
+    def set_field(self, field, rate):
+        return self._set("field", field, rate)
+
+    def get_position(self):
+        return self._get("position")
+
+    def set_position(self, position, rate):
+        return self._set("position", position, rate)
@@ -0,0 +1,232 @@
+"""
+Simulated VISA resources for the pralab drivers.
+
+A SimInstrument describes an instrument in the spirit of a pyvisa-sim
+definition file: default register values for the plain "HEADER value" /
+"HEADER?" commands, plus dialogues (regular expression -> method) for the
+commands with behaviour. Unlike pyvisa-sim it also models time: every
+transaction costs a latency, commands can cost extra time, readings take
+their integration time (NPLC) and responses their transfer time, and the
+readings carry gaussian noise. The simulated throughput is therefore close
+to that of the real instruments, which makes acquisition speed measurable
+without hardware.
+
+SimulatedResource puts a SimInstrument behind the subset of the PyVISA
+MessageBasedResource interface used by QCoDeS and PralabVisaInstrument.
+The drivers open one with sim=True:
+
+    >>> k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=True)
+"""
+import re
+import time
+from collections import deque
+from collections.abc import Callable
+from typing import Any
+
+import numpy as np
+
+
+class SimInstrument:
+    """
+    Base class of the simulated instrument models.
+
+    Args:
+        latency: Time in s of every bus transaction.
+        transfer_rate: Response transfer rate in bytes/s.
+        line_frequency: Power line frequency in Hz (integration time of 1 NPLC).
+        seed: Seed of the noise generator.
+        clock: Time source in s.
+        sleep: Function waiting for the simulated time.
+    """
+
+    idn = "PRALAB,SIMULATED,0,0"
+    # Message unit separator of compound commands (None: the whole message is one command)
+    separator: str | None = ";"
+    # Default register values of the generic "HEADER value" / "HEADER?" commands
+    defaults: dict[str, str] = {}
+    # Dialogues: regular expression of the command -> name of the method handling it
+    dialogues: tuple[tuple[str, str], ...] = ()
+    # Extra time in s of some commands (regular expression -> s)
+    command_latency: dict[str, float] = {}
+
+    def __init__(
+        self,
+        latency: float = 1e-3,
+        transfer_rate: float = 1e5,
+        line_frequency: float = 50.0,
+        seed: int | None = None,
+        clock: Callable[[], float] = time.perf_counter,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.latency = latency
+        self.transfer_rate = transfer_rate
+        self.line_frequency = line_frequency
+        self.rng = np.random.default_rng(seed)
+        self.clock = clock
+        self.sleep = sleep
+        self.values = dict(self.defaults)
+        self.busy = 0.0
+        self._dialogues = [
+            (re.compile(pattern, re.IGNORECASE), getattr(self, method))
+            for pattern, method in self.dialogues
+        ]
+        self._command_latency = [
+            (re.compile(pattern, re.IGNORECASE), seconds)
+            for pattern, seconds in self.command_latency.items()
+        ]
+        self._esr = 0
+        self._opc_time: float | None = None
+
+    def reset(self) -> None:
+        """Restores the default register values."""
+        self.values = dict(self.defaults)
+
+    def wait_until(self, t: float) -> None:
+        """Makes the present command last until the clock reaches t."""
+        self.busy = max(self.busy, t - self.clock())
+
+    def handle(self, unit: str) -> str | np.ndarray | None:
+        """Executes one command and returns its response (None for commands without one)."""
+        command = unit.strip().lstrip(":")
+        for pattern, seconds in self._command_latency:
+            if pattern.fullmatch(command):
+                self.busy += seconds
+        for pattern, method in self._dialogues:
+            match = pattern.fullmatch(command)
+            if match:
+                return method(*match.groups())
+        if command.endswith("?"):
+            # 未定義のレジスタは 0 を返す
+            return self.values.get(command[:-1].strip().upper(), "0")
+        header, _, value = command.partition(" ")
+        value = value.strip()
+        self.values[header.upper()] = {"ON": "1", "OFF": "0"}.get(value.upper(), value)
+        return None
+
+    # common IEEE 488.2 commands
+
+    def idn_query(self) -> str:
+        return self.idn
+
+    def rst(self) -> None:
+        self.reset()
+
+    def cls(self) -> None:
+        self._esr = 0
+        self._opc_time = None
+
+    def opc(self) -> None:
+        # the operation completes when the pending operation (if any) has finished
+        self._opc_time = max(self.clock() + self.busy, self.operation_done())
+
+    def esr_query(self) -> str:
+        if self._opc_time is not None and self.clock() >= self._opc_time:
+            self._esr |= 1
+            self._opc_time = None
+        esr, self._esr = self._esr, 0
+        return str(esr)
+
+    def operation_done(self) -> float:
+        """Time at which the pending overlapped operation finishes."""
+        return 0.0
+
+    common_dialogues = (
+        (r"\*IDN\?", "idn_query"),
+        (r"\*RST", "rst"),
+        (r"\*CLS", "cls"),
+        (r"\*OPC", "opc"),
+        (r"\*ESR\?", "esr_query"),
+    )
+
+
+class SimulatedResource:
+    """
+    Stand-in for a PyVISA MessageBasedResource backed by a SimInstrument.
+
+    Args:
+        model: The simulated instrument.
+        resource_name: Address reported by the resource.
+    """
+
+    def __init__(self, model: SimInstrument, resource_name: str = "SIM::INSTR") -> None:
+        self.model = model
+        self.resource_name = resource_name
+        self.timeout = 2000.0
+        self.read_termination = "\n"
+        self.write_termination = "\n"
+        self.session = 0
+        self.transactions = 0
+        self._responses: deque[list[str | np.ndarray]] = deque()
+
+    def _execute(self, message: str) -> list[str | np.ndarray]:
+        model = self.model
+        model.busy = 0.0
+        if model.separator is None:
+            units = [message]
+        else:
+            units = [unit for unit in message.split(model.separator) if unit.strip()]
+        responses = [r for r in (model.handle(unit) for unit in units) if r is not None]
+        self.transactions += 1
+        model.sleep(model.latency + model.busy)
+        return responses
+
+    def _transfer(self, nbytes: int) -> None:
+        self.model.sleep(nbytes / self.model.transfer_rate)
+
+    @staticmethod
+    def _format(response: str | np.ndarray) -> str:
+        if isinstance(response, np.ndarray):
+            return ",".join(f"{v:.6E}" for v in response)
+        return response
+
+    def write(self, message: str) -> int:
+        responses = self._execute(message)
+        if responses:
+            self._responses.append(responses)
+        return len(message)
+
+    def read(self) -> str:
+        if not self._responses:
+            raise TimeoutError("Simulated instrument has nothing to send (query timeout)")
+        text = ";".join(self._format(r) for r in self._responses.popleft())
+        self._transfer(len(text) + 1)
+        return text
+
+    def query(self, message: str) -> str:
+        self.write(message)
+        return self.read()
+
+    def query_ascii_values(
+        self,
+        message: str,
+        converter: str = "f",
+        separator: str = ",",
+        container: Callable[..., Any] = list,
+        **kwargs: Any,
+    ) -> Any:
+        text = self.query(message)
+        return container([float(v) for v in re.split(r"[;,]", text) if v.strip()])
+
+    def query_binary_values(
+        self,
+        message: str,
+        datatype: str = "f",
+        is_big_endian: bool = False,
+        container: Callable[..., Any] = list,
+        **kwargs: Any,
+    ) -> Any:
+        responses = self._execute(message)
+        data = next((r for r in responses if isinstance(r, np.ndarray)), None)
+        if data is None:
+            raise ValueError(f"{message!r} does not return a block")
+        dtype = np.dtype(datatype).newbyteorder(">" if is_big_endian else "<")
+        data = data.astype(dtype)
+        # IEEE 488.2 definite length block: #<n><length><data>
+        self._transfer(data.nbytes + len(str(data.nbytes)) + 3)
+        return container(data)
+
+    def clear(self) -> None:
+        self._responses.clear()
+
+    def close(self) -> None:
+        self._responses.clear()
@@ -0,0 +1,263 @@
+"""
+PralabVisaInstrument is the common base class of the VISA drivers in pralab_phys.
+
+The VISA sessions are taken from the process-wide pool of eztools.visa,
+so the resource manager is shared and sessions are reused instead of being
+opened again by every driver and discovery call. visa_handle is the
+PooledResource handle of the driver: closing it (close(), or the finalizer
+of VisaInstrument when the driver is collected) hands the session back to
+the pool instead of closing it.
+
+With sim=True the driver talks to a simulated instrument (see the sim package)
+instead of a VISA session, with realistic latency, integration time and noise:
+
+    >>> k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=True)
+
+Every VISA transaction of one instrument is serialized with a reentrant lock,
+so that the instrument can be read from several threads (e.g. while a ramp
+runs in a worker thread). Drivers opened on the same address share the lock
+of the pooled session. Sequences that must not be interleaved with other
+threads can hold the lock explicitly:
+
+    >>> with inst.visa_lock:
+    ...     inst.write("...")
+    ...     inst.ask("...")
+
+Configuration parameters listed in _suppressible_parameters of a driver can
+opt in to write suppression: a set is skipped when the parameter cache holds
+the same value, confirmed by the last set or get. The caches are invalidated
+by *RST (written by any method, see _device_reset) and by the reset()/initialize()
+methods of the drivers.
+
+    >>> k6221.enable_write_suppression()
+    >>> k6221.wave_frec(13.0)   # written
+    >>> k6221.wave_frec(13.0)   # skipped
+    >>> k6221.write_suppression_stats
+    {'written': 1, 'suppressed': 1}
+
+Attributes:
+    visa_lock (threading.RLock): Lock serializing the VISA access of the instrument (shared per address).
+    write_suppression_stats (dict[str, int]): Numbers of suppressible sets written and suppressed.
+
+Methods:
+    ask_ascii_values(cmd): Queries a comma separated list of numbers.
+    ask_binary_values(cmd): Queries an IEEE 488.2 binary block.
+    enable_write_suppression(*names): Skips sets that would not change the parameters.
+    disable_write_suppression(*names): Writes every set again.
+    invalidate_write_cache(): Forgets the values of the suppressed parameters.
+    fast_set_formatter(name): Command formatter used by fast_sweep.FastSweepSetter.
+"""
+import math
+import threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from typing_extensions import (
+        Unpack,  # can be imported from typing if python >= 3.12
+    )
+
+import numpy as np
+import pyvisa
+import pyvisa.resources
+from qcodes.instrument import (
+    Instrument,
+    VisaInstrument,
+    VisaInstrumentKWArgs,
+)
+from qcodes.parameters import Parameter
+
+from ..eztools.visa import PooledResource, visa_pool
+
+if TYPE_CHECKING:
+    from .sim import SimInstrument
+
+
+class PralabVisaInstrument(VisaInstrument):
+    """Base class of the pralab_phys VISA drivers"""
+
+    # Parameters whose writes can be suppressed (see enable_write_suppression)
+    _suppressible_parameters: tuple[str, ...] = ()
+    # Set command format of the parameters supporting fast sweeps (see fast_sweep.FastSweepSetter)
+    _fast_set_formats: dict[str, str] = {}
+
+    def __init__(
+        self,
+        name: str,
+        address: str,
+        sim: "bool | SimInstrument" = False,
+        **kwargs: "Unpack[VisaInstrumentKWArgs]",
+    ):
+        """
+        Args:
+            name: Name of the instrument.
+            address: VISA resource address.
+            sim: Use a simulated instrument instead of the VISA resource.
+                True creates the default model of the driver; a SimInstrument is used as given.
+            **kwargs: Forwarded to VisaInstrument.
+        """
+        self.visa_lock = threading.RLock()
+        self._sim = sim
+        # suppressed parameter name -> original set
+        self._unsuppressed_sets: dict[str, Callable[..., None]] = {}
+        self.write_suppression_stats = {"written": 0, "suppressed": 0}
+        super().__init__(name, address, **kwargs)
+
+    def _open_resource(
+        self, address: str, visalib: str | None
+    ) -> tuple[pyvisa.resources.MessageBasedResource, str, pyvisa.ResourceManager | None]:
+        if self._sim:
+            from .sim import SimInstrument, SimulatedResource, sim_model_for
+
+            model = self._sim if isinstance(self._sim, SimInstrument) else sim_model_for(type(self))
+            self.visa_log.info(f"Opening simulated {type(model).__name__} at address: {address}")
+            # visabackend "sim" skips the device clear of VisaInstrument
+            return SimulatedResource(model, address), "sim", None
+        # in case we're changing the address - hand the old session back first
+        handle = getattr(self, "visa_handle", None)
+        if isinstance(handle, PooledResource):
+            handle.close()
+        if visalib is not None and "@" in visalib:
+            visabackend = visalib.split("@")[1]
+        else:
+            visabackend = "ivi"
+        self.visa_log.info(f"Acquiring pooled PyVISA resource at address: {address}")
+        resource = visa_pool.acquire(address, visalib)
+        # 同じアドレスのドライバ同士で通信が割り込まないよう、セッションのロックを使う
+        self.visa_lock = resource.lock
+        return resource, visabackend, visa_pool.resource_manager(visalib)
+
+    def device_clear(self) -> None:
+        handle = self.visa_handle
+        if not isinstance(handle, PooledResource):
+            super().device_clear()
+            return
+        # VisaInstrument checks the type of visa_handle (serial ports are flushed, not cleared)
+        with self.visa_lock:
+            self.visa_handle = handle.resource
+            try:
+                super().device_clear()
+            finally:
+                self.visa_handle = handle
+
+    def close(self) -> None:
+        """Hands the session back to the pool and tears down the instrument."""
+        handle = getattr(self, "visa_handle", None)
+        if isinstance(handle, PooledResource):
+            # the handle acts once, also if the driver is collected later
+            handle.close()
+        # VisaInstrument.close would close the shared resource manager
+        Instrument.close(self)
+
+    def write_raw(self, cmd: str) -> None:
+        with self.visa_lock:
+            super().write_raw(cmd)
+            if "*RST" in cmd.upper():
+                self._device_reset()
+
+    def _device_reset(self) -> None:
+        """
+        Called after *RST was written. Drivers extend it to forget the
+        instrument state they keep on the host side.
+        """
+        self.invalidate_write_cache()
+
+    def ask_raw(self, cmd: str) -> str:
+        with self.visa_lock:
+            return super().ask_raw(cmd)
+
+    def ask_ascii_values(self, cmd: str, **kwargs: Any) -> np.ndarray:
+        """
+        Queries a comma separated list of numbers.
+
+        Args:
+            cmd: The query.
+            **kwargs: Forwarded to pyvisa query_ascii_values.
+        """
+        kwargs.setdefault("container", np.array)
+        with self.visa_lock:
+            self.visa_log.debug(f"Querying ascii values: {cmd}")
+            return self.visa_handle.query_ascii_values(cmd, **kwargs)
+
+    def ask_binary_values(self, cmd: str, **kwargs: Any) -> np.ndarray:
+        """
+        Queries an IEEE 488.2 binary block.
+
+        Args:
+            cmd: The query.
+            **kwargs: Forwarded to pyvisa query_binary_values (datatype, is_big_endian, ...).
+        """
+        kwargs.setdefault("container", np.array)
+        with self.visa_lock:
+            self.visa_log.debug(f"Querying binary values: {cmd}")
+            return self.visa_handle.query_binary_values(cmd, **kwargs)
+
+    @staticmethod
+    def _same_value(cached: Any, value: Any) -> bool:
+        if isinstance(cached, float) or isinstance(value, float):
+            try:
+                return math.isclose(float(cached), float(value), rel_tol=1e-9, abs_tol=0.0)
+            except (TypeError, ValueError):
+                return False
+        return cached == value
+
+    def _suppressing_set(self, parameter: Parameter, set_function: Callable[..., None]) -> Callable[..., None]:
+        def set_(value: Any, **kwargs: Any) -> None:
+            cache = parameter.cache
+            if cache.valid and self._same_value(cache.get(get_if_invalid=False), value):
+                self.write_suppression_stats["suppressed"] += 1
+                return
+            set_function(value, **kwargs)
+            self.write_suppression_stats["written"] += 1
+
+        return set_
+
+    def enable_write_suppression(self, *names: str) -> None:
+        """
+        Skips the sets of configuration parameters that would not change their value.
+
+        The value compared with is the parameter cache, i.e. the last value set or read.
+        Call invalidate_write_cache() when the instrument was changed behind the
+        driver's back (front panel, another program).
+
+        Args:
+            *names: Parameters to suppress. Defaults to all suppressible parameters of the driver.
+        """
+        for name in names or self._suppressible_parameters:
+            if name not in self._suppressible_parameters:
+                raise ValueError(f"Writes of {name!r} cannot be suppressed")
+            if name in self._unsuppressed_sets:
+                continue
+            parameter = self.parameters[name]
+            self._unsuppressed_sets[name] = parameter.set
+            parameter.set = self._suppressing_set(parameter, parameter.set)
+
+    def disable_write_suppression(self, *names: str) -> None:
+        """
+        Writes every set of the given parameters again.
+
+        Args:
+            *names: Parameters to restore. Defaults to all suppressed parameters.
+        """
+        for name in names or list(self._unsuppressed_sets):
+            original = self._unsuppressed_sets.pop(name, None)
+            if original is not None:
+                self.parameters[name].set = original
+
+    def invalidate_write_cache(self) -> None:
+        """Forgets the values of the suppressed parameters, so that their next set is written."""
+        for name in self._unsuppressed_sets:
+            self.parameters[name].cache.invalidate()
+
+    def fast_set_formatter(self, name: str) -> Callable[[float], str]:
+        """
+        Returns the function formatting the set command of a parameter,
+        used by fast_sweep.FastSweepSetter to bypass the Parameter set pipeline.
+
+        Args:
+            name: Name of the parameter.
+        """
+        try:
+            return self._fast_set_formats[name].format
+        except KeyError:
+            raise ValueError(f"{name!r} of {self.name} does not support fast sweeps") from None
@@ -1,14 +1,30 @@
 from functools import partial
-from qcodes import (VisaInstrument,
-					validators as vals)
+from collections.abc import Sequence
+from qcodes import validators as vals
 from qcodes.parameters import Parameter
 
 import logging
+import time
+
+import numpy as np
+
+from .ramp import RampFuture, ramp_parameter
+from .visa_base import PralabVisaInstrument
 
 log = logging.getLogger(__name__)
 
+# The 7651 program memory holds at most 50 steps.
+PROGRAM_MAX_STEPS = 50
+# Output limits of the 7651 (120 mA range, 30 V range with overrange)
+MAX_CURRENT = 0.12
+MAX_VOLTAGE = 32.0
+# Bit of the OC status byte set while a program is executed.
+_OC_PROGRAM_RUNNING = 1 << 1
+# Program execution commands
+_PROGRAM_RUN = {"hold": "RU0", "step": "RU1", "run": "RU2", "continue": "RU3"}
+
 
-class Yokogawa7651(VisaInstrument):
+class Yokogawa7651(PralabVisaInstrument):
 	""" 
         QCoDeS driver for the Yokogawa 7651 I/V source.  
 
@@ -36,11 +52,43 @@ class Yokogawa7651(VisaInstrument):
 
             output (Parameter):
 				Output Status. ("on", "off")
+
+            readback_ttl (Parameter):
+				Time in s during which an OD/OC response is reused by every readback. (0: disabled)
+
+        Methods:
+            program_upload(setpoints, mode, interval, slope):
+				Compiles a sweep into the program memory.
+            program_run():
+				Starts the hardware-timed program.
+            program_hold():
+				Holds the program.
+            program_status():
+				Reports the program progress without blocking.
+            clear_readback_cache():
+				Discards the cached OD/OC responses.
+            ramp_current(target, rate, step):
+				Ramps the current in a worker thread.
+            ramp_voltage(target, rate, step):
+				Ramps the voltage in a worker thread.
+            enable_write_suppression(*names):
+				Skips range/limit writes that would not change them.
         """  
+
+	_suppressible_parameters = ("voltage_range", "current_range", "voltage_limit", "current_limit")
+
 	def __init__(self, name, address, **kwargs):
 		# supplying the terminator means you don't need to remove it from every response
 		super().__init__(name, address, terminator='\n', **kwargs)
 
+		self._program_duration: float | None = None
+		self._program_started: float | None = None
+
+		# OD/OC の応答を短時間キャッシュし、同じ問い合わせを複数のパラメータで共有する
+		self._readback_cache: dict[str, tuple[float, str]] = {}
+		self.readback_stats: dict[str, dict[str, int]] = {}
+		"""Cache hits and misses of each readback."""
+
 		# init: crashes the I/O, clear from visa test panel fixes the issue
 		# self.write('RC')
         
@@ -58,6 +106,7 @@ class Yokogawa7651(VisaInstrument):
                 parameter_class=Y7651AutoCurrent,
                 label="current",
                 unit="A",
+                vals=vals.Numbers(-MAX_CURRENT, MAX_CURRENT),
             )
 		
 		self.current_peak_amplitude: Parameter = self.add_parameter(
@@ -65,6 +114,7 @@ class Yokogawa7651(VisaInstrument):
                 parameter_class=Y7651AutoCurrent,
                 label="current peak amplitude",
                 unit="A",
+                vals=vals.Numbers(-MAX_CURRENT, MAX_CURRENT),
             )
 
 		self.auto_voltage: Parameter = self.add_parameter(
@@ -72,6 +122,7 @@ class Yokogawa7651(VisaInstrument):
 			parameter_class=Y7651AutoVoltage,
 			label="voltage",
 			unit="V",
+			vals=vals.Numbers(-MAX_VOLTAGE, MAX_VOLTAGE),
 		)
 
 		self.mode: Parameter = self.add_parameter(
@@ -119,10 +170,20 @@ class Yokogawa7651(VisaInstrument):
 			name = 'output',  
 			label = 'Output State',
 			set_cmd=lambda x: self.on() if x else self.off(),
-            get_cmd=lambda x: self._get_output(),
+			get_cmd=self._get_output,
 			val_mapping={"off": 0, "on": 1,},
 			)
 
+		self.readback_ttl: Parameter = self.add_parameter(
+			name = 'readback_ttl',
+			label = 'Lifetime of the cached OD/OC responses',
+			unit = 's',
+			vals = vals.Numbers(0, 10),
+			get_cmd = None,
+			set_cmd = None,
+			initial_value = 0.05,
+			)
+
 	
 	def on(self):
 		self.write('O1E')
@@ -136,11 +197,36 @@ class Yokogawa7651(VisaInstrument):
 	def output_off(self):
 		self.write('O0E')
 
-	def _get_output(self):
-		return int(self.ask("OC")[5:].strip()) >> 4 & 1
-
-	def _get_amplitude(self):
-		return float(self.ask("OD")[4:].strip())
+	def write_raw(self, cmd: str) -> None:
+		# any setting may change the output, so cached readbacks are discarded
+		with self.visa_lock:
+			self._readback_cache.clear()
+			super().write_raw(cmd)
+			# RC (initialize or reverse()) resets the settings like *RST
+			if cmd.strip().upper() == "RC":
+				self._device_reset()
+
+	def _cached_ask(self, cmd: str, name: str) -> str:
+		with self.visa_lock:
+			stats = self.readback_stats.setdefault(name, {"hits": 0, "misses": 0})
+			now = time.perf_counter()
+			cached = self._readback_cache.get(cmd)
+			if cached is not None and now - cached[0] <= self.readback_ttl.cache.get():
+				stats["hits"] += 1
+				return cached[1]
+			stats["misses"] += 1
+			response = self.ask(cmd)
+			self._readback_cache[cmd] = (now, response)
+			return response
+
+	def clear_readback_cache(self):
+		self._readback_cache.clear()
+
+	def _get_output(self, name: str = "output"):
+		return int(self._cached_ask("OC", name)[5:].strip()) >> 4 & 1
+
+	def _get_amplitude(self, name: str = "amplitude"):
+		return float(self._cached_ask("OD", name)[4:].strip())
 	
 	def _set_range(self, range:int, mode:str) -> None:
 		if mode == "CURR":
@@ -153,19 +239,137 @@ class Yokogawa7651(VisaInstrument):
 	def _div_1000_int(self,val):
 		return int(val/1000)
 
-	def _set_V(self,voltage):
-		if voltage>0:
+	@staticmethod
+	def _format_level(function: str, value: float) -> str:
+		if value>0:
 			polarity = '+'
 		else:
 			polarity = '-'
-		self.write('F1SA'+polarity+str(round(abs(voltage),6))+'E')
+		return function+'SA'+polarity+str(round(abs(value),6))+'E'
+
+	def fast_set_formatter(self, name: str):
+		function = {"current": "F5", "current_peak_amplitude": "F5", "voltage": "F1"}.get(name)
+		if function is None:
+			return super().fast_set_formatter(name)
+		return partial(self._format_level, function)
+
+	def _set_V(self,voltage):
+		self.write(self._format_level('F1', voltage))
 
 	def _set_A(self,current):
-		if current>0:
-			polarity = '+'
-		else:
-			polarity = '-'
-		self.write('F5SA'+polarity+str(round(abs(current),6))+'E')
+		self.write(self._format_level('F5', current))
+
+	@classmethod
+	def compile_program(cls, setpoints: Sequence[float], mode: str = "current") -> list[str]:
+		"""
+		Compiles a sweep into the program steps of the 7651.
+
+		Args:
+			setpoints: Output of each step (A for current, V for voltage), at most 50 steps.
+				Use breakpoints: with a slope time, the 7651 ramps linearly between steps.
+			mode: "current" or "voltage"
+
+		Returns:
+			The commands of each program step.
+		"""
+		function = {"current": "F5", "voltage": "F1"}[mode]
+		setpoints = np.asarray(setpoints, dtype=float)
+		if setpoints.ndim != 1 or not 1 <= len(setpoints) <= PROGRAM_MAX_STEPS:
+			raise ValueError(f"setpoints must be a one dimensional array of 1 to {PROGRAM_MAX_STEPS} steps")
+		return [cls._format_level(function, v) for v in setpoints]
+
+	def program_upload(
+		self,
+		setpoints: Sequence[float],
+		mode: str = "current",
+		interval: float = 1.0,
+		slope: float | None = None,
+		repeat: bool = False,
+	) -> float:
+		"""
+		Uploads a sweep to the program memory. Start it with program_run().
+
+		Args:
+			setpoints: Output of each step (A for current, V for voltage), at most 50 steps.
+			mode: "current" or "voltage"
+			interval: Interval time of each step in s (0.1 to 3600).
+			slope: Slope (ramp) time to each step in s. If None, it equals interval,
+				which gives a continuous linear ramp through the setpoints.
+			repeat: Repeat the program instead of running it once.
+
+		Returns:
+			The duration of one program run in s.
+		"""
+		if slope is None:
+			slope = interval
+		if not 0.1 <= interval <= 3600:
+			raise ValueError("interval must be between 0.1 and 3600 s")
+		if not 0 <= slope <= interval:
+			raise ValueError("slope must be between 0 and interval")
+		steps = self.compile_program(setpoints, mode)
+
+		self.write('PRS')
+		for step in steps:
+			self.write(step)
+		self.write('PRE')
+		self.write(f'PI{interval:.1f}')
+		self.write(f'SW{slope:.1f}')
+		self.write('M0' if repeat else 'M1')
+
+		self._program_duration = len(steps) * interval
+		self._program_started = None
+		return self._program_duration
+
+	def program_run(self):
+		self.write(_PROGRAM_RUN["run"])
+		self._program_started = time.perf_counter()
+
+	def program_hold(self):
+		self.write(_PROGRAM_RUN["hold"])
+
+	def program_status(self) -> dict[str, float | bool | None]:
+		"""
+		Reports the progress of the program from the status byte (one OC query, no waiting).
+
+		Returns:
+			"running": True while the program is executed.
+			"elapsed": Time since program_run() in s.
+			"fraction": Estimated fraction of the program completed (0 to 1).
+		"""
+		running = bool(int(self._cached_ask("OC", "program_status")[5:].strip()) & _OC_PROGRAM_RUNNING)
+		if self._program_started is None or not self._program_duration:
+			return {"running": running, "elapsed": None, "fraction": None}
+		elapsed = time.perf_counter() - self._program_started
+		fraction = 1.0 if not running else min(elapsed / self._program_duration, 1.0)
+		return {"running": running, "elapsed": elapsed, "fraction": fraction}
+
+	def ramp_current(self, target: float, rate: float, step: float) -> RampFuture:
+		"""
+		Ramps the current to target in a worker thread and returns immediately.
+
+		Args:
+			target: Target current in A.
+			rate: Ramp rate in A/s.
+			step: Maximum step in A.
+
+		Returns:
+			The future of the ramp. stop() ends the ramp at the present value.
+		"""
+		return ramp_parameter(self.current, target, rate, step)
+
+	def ramp_voltage(self, target: float, rate: float, step: float) -> RampFuture:
+		"""
+		Ramps the voltage to target in a worker thread and returns immediately.
+
+		Args:
+			target: Target voltage in V.
+			rate: Ramp rate in V/s.
+			step: Maximum step in V.
+
+		Returns:
+			The future of the ramp. stop() ends the ramp at the present value.
+		"""
+		return ramp_parameter(self.auto_voltage, target, rate, step)
 
 	def initialize(self):
 		self.write('RC')
@@ -189,7 +393,7 @@ class Y7651AutoCurrent(Parameter):
 
 	def get_raw(self):
 		# self は Parameter インスタンス。 instrument にアクセスして _get_amplitude を呼び出す。
-		return self.instrument._get_amplitude() 
+		return self.instrument._get_amplitude(self.name)
 
 	def set_raw(self, value):
 		self.instrument._set_A(value)
@@ -206,7 +410,7 @@ class Y7651AutoVoltage(Parameter):
 
 	def get_raw(self):
 		# self は Parameter インスタンス。 instrument にアクセスして _get_amplitude を呼び出す。
-		return self.instrument._get_amplitude()
+		return self.instrument._get_amplitude(self.name)
 
 	def set_raw(self, value):
 		self.instrument._set_V(value)
@@ -0,0 +1,51 @@
+import pytest
+from qcodes.instrument import Instrument
+
+from pralab_phys.qcodes_drivers.sim import SimKeithley2182A, SimKeithley6221, SimYokogawa7651
+
+
+def _no_sleep(seconds: float) -> None:
+    pass
+
+
+# 通信時間を 0 にした模擬装置 (タイミングではなく動作を調べる)
+SIM_KWARGS = {"latency": 0.0, "transfer_rate": float("inf"), "sleep": _no_sleep}
+
+
+class FakeClock:
+    """Clock of the simulated backends, advanced by the test."""
+
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+@pytest.fixture(autouse=True)
+def close_instruments():
+    yield
+    Instrument.close_all()
+
+
+@pytest.fixture
+def clock() -> FakeClock:
+    return FakeClock()
+
+
+@pytest.fixture
+def sim_2182a() -> SimKeithley2182A:
+    return SimKeithley2182A(**SIM_KWARGS)
+
+
+@pytest.fixture
+def sim_6221() -> SimKeithley6221:
+    return SimKeithley6221(**SIM_KWARGS)
+
+
+@pytest.fixture
+def sim_yokogawa() -> SimYokogawa7651:
+    return SimYokogawa7651(**SIM_KWARGS)
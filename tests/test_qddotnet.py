@@ -0,0 +1,117 @@
+import time
+from collections import deque
+
+import pytest
+from qcodes.parameters import Parameter
+
+from pralab_phys.qcodes_drivers import QDdotNET
+from pralab_phys.qcodes_drivers.continuous_sweep import ContinuousSweep
+from pralab_phys.qcodes_drivers.sim import QDSimBackend
+
+
+class CountingBackend(QDSimBackend):
+    """QDSimBackend counting the temperature queries."""
+
+    def __init__(self, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.temperature_queries = 0
+
+    def get_temperature(self):
+        self.temperature_queries += 1
+        return super().get_temperature()
+
+
+@pytest.fixture
+def backend(clock) -> CountingBackend:
+    return CountingBackend(clock=clock, settle_time=0.0)
+
+
+@pytest.fixture
+def qd(backend) -> QDdotNET:
+    return QDdotNET("qd", "", backend=backend)
+
+
+def _wait_for_poll(qd: QDdotNET, quantity: str, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not len(qd.state_history(quantity)[0]):
+        if time.monotonic() > deadline:
+            raise TimeoutError("the poller did not record a sample")
+        time.sleep(0.01)
+
+
+def test_reads_query_the_device_without_poller(qd, backend):
+    qd.read_state("temperature")
+    qd.read_state("temperature")
+    assert backend.temperature_queries == 2
+
+
+def test_poller_record_is_used_while_it_runs(qd, backend):
+    qd.start_poller(interval=60, quantities=("temperature",))
+    try:
+        _wait_for_poll(qd, "temperature")
+        queries = backend.temperature_queries
+        qd.read_state("temperature")
+        assert backend.temperature_queries == queries
+    finally:
+        qd.stop_poller()
+    qd.read_state("temperature")
+    assert backend.temperature_queries == queries + 1
+
+
+def test_set_invalidates_the_recorded_state(qd):
+    qd.state_max_age.set(3600)
+    assert qd.read_state("temperature") == (300.0, 1)
+    qd.set_temperature(10)
+    # the stable status recorded before the set must not be returned
+    _, status = qd.read_state("temperature")
+    assert status == 2
+
+
+def test_temperature_rate_is_per_minute(qd, clock):
+    qd.temperaturerate.set(60)
+    qd.set_temperature(290)
+    clock.advance(5)
+    value, _ = qd.read_state("temperature", max_age=0)
+    assert value == pytest.approx(295.0)
+
+
+def test_state_history_since_returns_new_samples(qd):
+    for _ in range(3):
+        qd.read_state("temperature", max_age=0)
+        time.sleep(0.002)
+    times, _ = qd.state_history("temperature")
+    new_times, _ = qd.state_history("temperature", since=times[0])
+    assert list(new_times) == list(times[1:])
+
+
+def test_interpolation_keeps_a_bounded_window(qd, clock):
+    qd.temperaturerate.set(60)
+    qd.set_temperature(290)
+    sweep = ContinuousSweep(qd, "temperature", [])
+    for _ in range(4):
+        qd.read_state("temperature", max_age=0)
+        clock.advance(1)
+        time.sleep(0.002)
+    times, values = qd.state_history("temperature")
+
+    pending = deque([((times[1] + times[2]) / 2, [])])
+    rows = list(sweep._interpolate(pending))
+    assert len(rows) == 1
+    assert values[2] < rows[0]["temperature"] < values[1]
+    # 読み取りが残っていなければ最後のサンプルだけを保持する
+    assert len(sweep._window) == 1
+
+    qd.read_state("temperature", max_age=0)
+    list(sweep._interpolate(deque()))
+    assert len(sweep._window) == 1
+
+
+def test_run_starts_with_an_empty_history(qd):
+    qd.read_state("temperature", max_age=0)
+    before = qd.state_history("temperature")[0][-1]
+    reading = Parameter("reading", get_cmd=lambda: 1.0, set_cmd=False)
+    sweep = ContinuousSweep(qd, "temperature", [reading], poll_interval=0.01)
+    rows = list(sweep.run(target=300.0))
+    assert rows and rows[0]["reading"] == 1.0
+    times, _ = qd.state_history("temperature")
+    assert times.min() > before
@@ -0,0 +1,57 @@
+import time
+
+import pytest
+from qcodes.parameters import Parameter
+
+from pralab_phys.qcodes_drivers.ramp import ramp_parameter
+
+
+@pytest.fixture
+def source() -> Parameter:
+    return Parameter("source", get_cmd=None, set_cmd=None, initial_value=0.0)
+
+
+def _wait_running(ramp, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not ramp.running():
+        if time.monotonic() > deadline:
+            raise TimeoutError("the ramp did not start")
+        time.sleep(0.001)
+
+
+def test_ramp_reaches_target(source):
+    ramp = ramp_parameter(source, 0.1, rate=100.0, step=0.01)
+    assert ramp.result(timeout=5) == pytest.approx(0.1)
+    assert source.get() == pytest.approx(0.1)
+
+
+def test_stop_ends_a_running_ramp(source):
+    ramp = ramp_parameter(source, 1.0, rate=1.0, step=0.01)
+    _wait_running(ramp)
+    assert ramp.stop()
+    assert ramp.result(timeout=5) < 1.0
+    assert ramp.stop_requested
+
+
+def test_cancel_of_a_running_ramp_follows_future(source):
+    ramp = ramp_parameter(source, 1.0, rate=1.0, step=0.01)
+    _wait_running(ramp)
+    # a running ramp cannot be cancelled, but it is asked to stop
+    assert not ramp.cancel()
+    assert not ramp.cancelled()
+    assert ramp.result(timeout=5) < 1.0
+
+
+def test_finished_ramp_cannot_be_stopped(source):
+    ramp = ramp_parameter(source, 0.1, rate=100.0, step=0.1)
+    ramp.result(timeout=5)
+    assert not ramp.stop()
+    assert not ramp.cancel()
+
+
+def test_new_ramp_stops_the_previous_one(source):
+    first = ramp_parameter(source, 1.0, rate=1.0, step=0.01)
+    _wait_running(first)
+    second = ramp_parameter(source, 0.0, rate=100.0, step=0.1)
+    assert first.done() and first.stop_requested
+    assert second.result(timeout=5) == pytest.approx(0.0)
@@ -0,0 +1,71 @@
+import threading
+import time
+
+import pytest
+from qcodes.instrument import Instrument
+
+from pralab_phys.qcodes_drivers.server import InstrumentServer, LoopbackClient
+
+
+class SlowInstrument(Instrument):
+    """Instrument whose reads take a bus transaction of read_time."""
+
+    def __init__(self, name: str, read_time: float = 0.05) -> None:
+        super().__init__(name)
+        self.read_time = read_time
+        self.value = 1.0
+        self.reads = 0
+        self.add_parameter("x", get_cmd=self._get_x, set_cmd=self._set_x)
+
+    def _get_x(self) -> float:
+        self.reads += 1
+        time.sleep(self.read_time)
+        return self.value
+
+    def _set_x(self, value: float) -> None:
+        self.value = value
+
+
+@pytest.fixture
+def server():
+    return InstrumentServer({"dev": SlowInstrument("dev")}, coalesce_window=1.0)
+
+
+def test_concurrent_reads_share_a_transaction(server):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def read() -> None:
+        barrier.wait()
+        results.append(server.get("dev.x"))
+
+    threads = [threading.Thread(target=read) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == [1.0] * 8
+    assert server.stats["gets"] == 8
+    assert server.stats["reads"] < 8
+    assert server.stats["reads"] + server.stats["coalesced"] == 8
+
+
+def test_set_discards_coalesced_reads(server):
+    client = LoopbackClient(server)
+    try:
+        assert client.get("dev.x") == 1.0
+        client.set("dev.x", 2.0)
+        # within the coalesce window, but after the write
+        assert client.get("dev.x") == 2.0
+    finally:
+        client.close()
+
+
+def test_read_overlapping_a_set_is_not_shared(server):
+    reading = threading.Thread(target=server.get, args=("dev.x",))
+    reading.start()
+    time.sleep(0.01)
+    server.set("dev.x", 3.0)
+    reading.join()
+    assert server.get("dev.x") == 3.0
@@ -0,0 +1,97 @@
+import gc
+from unittest.mock import MagicMock
+
+import pytest
+import pyvisa
+import pyvisa.resources
+
+from pralab_phys.eztools.visa import PooledResource, VisaPool
+from pralab_phys.qcodes_drivers import visa_base
+from pralab_phys.qcodes_drivers.visa_base import PralabVisaInstrument
+
+ADDRESS = "GPIB0::5::INSTR"
+
+
+class FakeResourceManager:
+    def __init__(self, *args) -> None:
+        self.opened: list[MagicMock] = []
+
+    def open_resource(self, address: str, **kwargs) -> MagicMock:
+        resource = MagicMock(spec=pyvisa.resources.MessageBasedResource)
+        resource.clear.return_value = None
+        self.opened.append(resource)
+        return resource
+
+    def close(self) -> None:
+        pass
+
+
+@pytest.fixture
+def pool(monkeypatch) -> VisaPool:
+    monkeypatch.setattr(pyvisa, "ResourceManager", FakeResourceManager)
+    pool = VisaPool()
+    # ドライバもこのプールからセッションを取る
+    monkeypatch.setattr(visa_base, "visa_pool", pool)
+    return pool
+
+
+def _session(pool: VisaPool):
+    return pool._sessions[(None, ADDRESS)]
+
+
+def test_handles_share_session_and_lock(pool):
+    first = pool.acquire(ADDRESS)
+    second = pool.acquire(ADDRESS)
+    assert isinstance(first, PooledResource)
+    assert first.resource is second.resource
+    assert first.lock is second.lock
+    assert pool.counts()["opens"] == 1
+    assert _session(pool).users == 2
+
+
+def test_handle_close_releases_once(pool):
+    first = pool.acquire(ADDRESS)
+    second = pool.acquire(ADDRESS)
+    first.close()
+    first.close()
+    assert _session(pool).users == 1
+    # 使用中のセッションは識別の問い合わせに渡さない
+    assert pool.acquire_idle(ADDRESS) is None
+    second.close()
+    assert _session(pool).users == 0
+    first.resource.close.assert_not_called()
+
+
+def test_handle_forwards_attributes(pool):
+    handle = pool.acquire(ADDRESS)
+    handle.timeout = 1234
+    assert handle.resource.timeout == 1234
+    handle.write("*CLS")
+    handle.resource.write.assert_called_once_with("*CLS")
+
+
+def test_drivers_on_one_address_share_the_lock(pool):
+    first = PralabVisaInstrument("first", ADDRESS)
+    second = PralabVisaInstrument("second", ADDRESS)
+    assert first.visa_lock is second.visa_lock
+    assert first.visa_lock is _session(pool).lock
+
+
+def test_driver_close_releases_without_closing(pool):
+    first = PralabVisaInstrument("first", ADDRESS)
+    second = PralabVisaInstrument("second", ADDRESS)
+    resource = _session(pool).resource
+    first.close()
+    assert _session(pool).users == 1
+    resource.close.assert_not_called()
+    second.ask("*IDN?")
+    resource.query.assert_called_with("*IDN?")
+
+
+def test_collected_driver_releases_without_closing(pool):
+    driver = PralabVisaInstrument("collected", ADDRESS)
+    resource = _session(pool).resource
+    del driver
+    gc.collect()
+    assert _session(pool).users == 0
+    resource.close.assert_not_called()
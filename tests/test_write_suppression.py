@@ -0,0 +1,86 @@
+from pralab_phys.qcodes_drivers import Keithley2182A, Keithley2182A1ch, Keithley6221, Yokogawa7651
+
+
+def test_2182a_switches_read_back_as_int(sim_2182a):
+    k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    assert k2182.filter.get() == 1
+    assert k2182.auto_range.get() == 1
+    assert k2182.rel.get() == 0
+    assert k2182.active.get() == "VOLT"
+
+
+def test_get_refreshes_the_suppression_cache(sim_2182a):
+    k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    k2182.enable_write_suppression("filter")
+    k2182.filter.get()
+    k2182.filter.set(1)
+    assert k2182.write_suppression_stats == {"written": 0, "suppressed": 1}
+
+
+def test_2182a_reset_forgets_suppressed_writes(sim_2182a):
+    k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    k2182.enable_write_suppression()
+    k2182.nplc.set(1)
+    k2182.nplc.set(1)
+    assert k2182.write_suppression_stats == {"written": 1, "suppressed": 1}
+
+    k2182.reset()
+    transactions = k2182.visa_handle.transactions
+    k2182.nplc.set(1)
+    assert k2182.write_suppression_stats == {"written": 2, "suppressed": 1}
+    assert k2182.visa_handle.transactions == transactions + 1
+
+
+def test_raw_rst_forgets_suppressed_writes(sim_2182a):
+    k2182 = Keithley2182A1ch("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    k2182.enable_write_suppression()
+    k2182.filter.set(0)
+    k2182.write("*RST")
+    k2182.filter.set(0)
+    assert k2182.write_suppression_stats == {"written": 2, "suppressed": 0}
+    assert sim_2182a.values["SENS:VOLT:DFILTER:STAT"] == "0"
+
+
+def test_2182a_channel_parameters_follow_the_active_channel(sim_2182a):
+    k2182 = Keithley2182A("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    k2182.channel.set(2)
+    k2182.auto_range.set(0)
+    assert sim_2182a.values["SENS:VOLT:CHAN2:RANG:AUTO"] == "0"
+    assert sim_2182a.values["SENS:VOLT:CHAN1:RANG:AUTO"] == "1"
+    assert k2182.auto_range.get() == 0
+    assert k2182.ch1.auto_range.get() == 1
+
+
+def test_2182a_channel_change_invalidates_the_suppression_cache(sim_2182a):
+    k2182 = Keithley2182A("k2182", "GPIB::7::INSTR", sim=sim_2182a)
+    k2182.enable_write_suppression("auto_range")
+    k2182.channel.set(1)
+    k2182.auto_range.set(0)
+    k2182.channel.set(2)
+    k2182.auto_range.set(0)
+    assert k2182.write_suppression_stats == {"written": 2, "suppressed": 0}
+    assert sim_2182a.values["SENS:VOLT:CHAN2:RANG:AUTO"] == "0"
+
+
+def test_6221_reset_forgets_suppressed_writes(sim_6221):
+    k6221 = Keithley6221("k6221", "GPIB::12::INSTR", sim=sim_6221)
+    k6221.enable_write_suppression()
+    k6221.wave_frec.set(13.0)
+    k6221.wave_frec.set(13.0)
+    k6221.reset()
+    k6221.wave_frec.set(13.0)
+    assert k6221.write_suppression_stats == {"written": 2, "suppressed": 1}
+
+
+def test_yokogawa_reverse_forgets_suppressed_writes(sim_yokogawa):
+    yoko = Yokogawa7651("yoko", "GPIB::1::INSTR", sim=sim_yokogawa)
+    yoko.enable_write_suppression()
+    yoko.current_limit.set(50)
+    yoko.current_limit.set(50)
+    assert yoko.write_suppression_stats == {"written": 1, "suppressed": 1}
+
+    # RC も *RST と同様に設定を初期化する
+    yoko.reverse()
+    yoko.current_limit.set(50)
+    assert yoko.write_suppression_stats == {"written": 2, "suppressed": 1}
+    assert sim_yokogawa.limits["A"] == 50